@@ -4,20 +4,61 @@ Communication with the GUI is managed via standard output.
 """
 
 import re
+from array import array
 from pprint import pprint
 import struct
 from collections import namedtuple
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from copy import copy
+from functools import lru_cache
 import json
+import os
 import sys
+import time
+import tracemalloc
+
+from cfg import drop_unreachable
 
 # Set to true if the -i flag is used (i.e. the GUI is running)
 INTERACTIVE_MODE = False
 
+# Where the GUI's commentary is written in interactive mode
+TRACE_PATH = "../GUI/asmout.txt"
+
+# How much of the commentary is written. An event is only written if the verbosity is at least its level.
+VERBOSITY_STAGES = 0    # The start and end of each stage
+VERBOSITY_LINES = 1     # Each line read, and each label and variable found
+VERBOSITY_BYTES = 2     # Each instruction as it is converted to bytes
+
+# The level of each event. Any event not listed is at VERBOSITY_LINES.
+EVENT_LEVELS = {
+    "start_text": VERBOSITY_STAGES,
+    "remove_comments": VERBOSITY_STAGES,
+    "remove_empty_lines": VERBOSITY_STAGES,
+    "remove_dup_wspace": VERBOSITY_STAGES,
+    "split": VERBOSITY_STAGES,
+    "start_proc_meta": VERBOSITY_STAGES,
+    "start_proc_data": VERBOSITY_STAGES,
+    "start_proc_text": VERBOSITY_STAGES,
+    "start_lv_detect": VERBOSITY_STAGES,
+    "mem_offsets": VERBOSITY_STAGES,
+    "conv_meta": VERBOSITY_STAGES,
+    "conv_instr": VERBOSITY_BYTES,
+    "end": VERBOSITY_STAGES
+}
+
+# The largest the commentary may get, in characters. After that only the end event is written.
+DEFAULT_TRACE_LIMIT = 16 * 1024 * 1024
+
 # The default values for the contents of the meta section
 META_CONFIG_DEFAULT = {
     "mem_amt": 4
 }
 
+# The version of the assembler's output. Change it whenever the same source would assemble into different bytes, so
+# that anything cached by an older version is not used.
+ASSEMBLER_VERSION = "1.0"
+
 # A dict of opcodes.
 OPCODES = {
     "HLT": 0x00,
@@ -190,6 +231,142 @@ DTYPE_META = {
     "4B": DataTypeMetadata(4)
 }
 
+# The mnemonics and data types an instruction can have, so that an InstructionTable only needs a byte for each. A
+# data type of 0 is what the parser gives an instruction that has none.
+TABLE_MNEMONICS = tuple(sorted(OPCODE_NAMES))
+TABLE_MNEMONIC_IDS = {mnemonic: i for i, mnemonic in enumerate(TABLE_MNEMONICS)}
+TABLE_DTYPES = (0, "", "char", "uchar", "short", "ushort", "int", "uint", "float", "1B", "2B", "4B")
+TABLE_DTYPE_IDS = {dtype: i for i, dtype in enumerate(TABLE_DTYPES)}
+
+# The size-based opcode suffix used by each data type, for opcodes which only care about the size
+DTYPE_SIZE_SUFFIXES = {
+    "char": "_1B",
+    "uchar": "_1B",
+    "short": "_2B",
+    "ushort": "_2B",
+    "int": "_4B",
+    "uint": "_4B",
+    "float": "_4B"
+}
+
+
+def build_opcode_table() -> dict:
+    """
+    Work out the opcode for every legal (mnemonic, data type) pair. An opcode with no subtypes (like JMP) is used
+    whatever the type; otherwise the opcode for that exact type is used, or failing that the one for its size.
+    """
+    opcode_table = {}
+    for mnemonic in OPCODE_NAMES:
+        for dtype in TABLE_DTYPES:
+            if mnemonic in OPCODES:
+                opcode_table[(mnemonic, dtype)] = OPCODES[mnemonic]
+            elif dtype and mnemonic + "_" + dtype in OPCODES:
+                opcode_table[(mnemonic, dtype)] = OPCODES[mnemonic + "_" + dtype]
+            elif mnemonic + DTYPE_SIZE_SUFFIXES.get(dtype, "") in OPCODES:
+                opcode_table[(mnemonic, dtype)] = OPCODES[mnemonic + DTYPE_SIZE_SUFFIXES[dtype]]
+    return opcode_table
+
+
+# Maps (mnemonic, data type) to the opcode number. Any pair which is missing is not allowed.
+OPCODE_TABLE = build_opcode_table()
+
+
+def describe_opcode_error(mnemonic: str, dtype: str) -> str:
+    """Explain why a (mnemonic, data type) pair is not in OPCODE_TABLE."""
+    if mnemonic not in OPCODE_NAMES:
+        return "Unsupported opcode mnemonic: {}".format(mnemonic)
+    return "Mismatch between opcode {} and data type {}".format(mnemonic, dtype)
+
+# Precompiled structs used when writing bytecode, keyed by their format string
+STRUCTS = {fmt: struct.Struct(fmt) for fmt in (">b", ">B", ">h", ">H", ">i", ">I", ">f")}
+U8 = STRUCTS[">B"]
+U32 = STRUCTS[">I"]
+
+# The v2 container format. It starts with a fixed header: the magic bytes, the format version, the number of
+# sections and the entry point (the code address to start at), followed by the (offset, length) of each section in
+# the file. A section which isn't present has a length of 0.
+CONTAINER_MAGIC = b"ASMB"
+CONTAINER_VERSION = 2
+CONTAINER_HEADER = struct.Struct(">4sHHI")
+CONTAINER_SECTION = struct.Struct(">II")
+
+# The sections of a container, in the order they appear in the header. META is the key=value& metadata and CODE is
+# the instructions (which are addressed from 0 as before). SYMBOLS and LINES are optional.
+SECTION_META = 0
+SECTION_CODE = 1
+SECTION_SYMBOLS = 2
+SECTION_LINES = 3
+CONTAINER_SECTION_COUNT = 4
+
+# The symbol table is a count, then one record per symbol sorted by name so that it can be binary searched, then the
+# names. A record is the address, where the name starts (from the start of the names), the length of the name and
+# the kind of symbol.
+SYMBOL_RECORD = struct.Struct(">IIHB")
+SYMBOL_LABEL = 0
+SYMBOL_VARIABLE = 1
+
+# The line table is a count, then (code address, source line) pairs sorted by address
+LINE_RECORD = struct.Struct(">II")
+
+# Images assembled with raw data have the initial values of the variables straight after the code, instead of MOVs
+# to set them. The metadata then says how many bytes of the image are data, and how many more bytes after that are
+# the variables which start at zero. The interpreter ignores keys it doesn't know, but only reads 9 characters of one.
+META_DATA_SIZE = "data_size"
+META_BSS_SIZE = "bss_size"
+
+# How the initial value of each type of variable is stored in memory
+DATA_STRUCTS = {
+    "char": STRUCTS[">b"],
+    "uchar": STRUCTS[">B"],
+    "short": STRUCTS[">h"],
+    "ushort": STRUCTS[">H"],
+    "int": STRUCTS[">i"],
+    "uint": STRUCTS[">I"],
+    "float": STRUCTS[">f"]
+}
+
+# An image read by read_image(), from either format. symbols maps each name to (address, kind) and lines is a list of
+# (code address, source line) pairs; both are None if the image doesn't have them. code_offset is where code starts
+# in the image. code is everything loaded into memory from address 0, so with raw data its last
+# config[META_DATA_SIZE] bytes are the data image.
+Image = namedtuple("Image", ["version", "config", "code", "code_offset", "entry", "symbols", "lines"])
+
+# The result of the layout pass. instr_offsets has one more entry than there are instructions; the last is the total.
+Layout = namedtuple("Layout", ["instr_offsets", "text_size", "var_offsets", "var_table_size", "label_offsets"])
+
+# The number of distinct operands intern_operand() will remember
+OPERAND_CACHE_SIZE = 4096
+
+# Used to collapse runs of whitespace during normalisation
+MULTIPLE_WHITESPACE = re.compile(r"\s+")
+
+# The inside of an arithmetic operand: a, a*b, a+b, a*b+c or a+b*c. Only complete matches are valid.
+ARITHMETIC_PATTERN = re.compile(r"(?P<a>[a-zA-Z0-9]+)"
+                                r"(?:(?P<op1>[*+])(?P<b>[a-zA-Z0-9]+)(?:(?P<op2>[*+])(?P<c>[a-zA-Z0-9]+))?)?")
+
+# Maps the operators in an arithmetic operand to its bit designation. a*b*c and a+b+c are not allowed.
+ARITHMETIC_FORMS = {
+    (None, None): 6,    # a
+    ("*", None): 7,     # a*b
+    ("+", None): 8,     # a+b
+    ("*", "+"): 9,      # a*b+c
+    ("+", "*"): 10      # a+b*c
+}
+
+# Classifies a whole operand in one match. Registers and addresses both match the name group, and are told apart by
+# looking the name up in REGISTERS.
+OPERAND_PATTERN = re.compile(r"(?P<imm>[+-]?(?:\d+(?P<frac>\.\d*)?|(?P<frac2>\.\d+))(?P<exp>[eE][+-]?\d+)?)"
+                             r"|(?P<name>[^\W\d]\w*)"
+                             r"|\[" + ARITHMETIC_PATTERN.pattern + r"\]")
+
+# The result of classify_operand(). kind is "register", "immediate", "address" or "arithmetic". For an arithmetic
+# operand, form is its bit designation and a, b and c are its parts; otherwise a holds the name or value.
+OperandToken = namedtuple("OperandToken", ["kind", "form", "a", "b", "c"])
+
+# The result of assemble(). symbols maps each label and variable to its address, and config is the meta section
+# with the defaults filled in.
+Assembled = namedtuple("Assembled", ["bytecode", "symbols", "config"])
+
 # ---------- CLASSES
 
 
@@ -206,6 +383,10 @@ class Instruction:
     def get_bytes(self, mem_table):
         raise NotImplementedError("Must only use a subclass of Instruction")
 
+    def write_bytes(self, buffer, offset, mem_table):
+        """Write the instruction into buffer starting at offset, and return the offset just after it."""
+        raise NotImplementedError("Must only use a subclass of Instruction")
+
 
 class DataInstruction(Instruction):
     """
@@ -248,41 +429,45 @@ class DataInstruction(Instruction):
         return 6 + self._calculate_valsize()
 
     def get_bytes(self, mem_table):
-        # The instruction byte
+        buffer = bytearray(self.get_bytes_length())
+        self.write_bytes(buffer, 0, mem_table)
+        return bytes(buffer)
+
+    def get_opcode_num(self) -> int:
+        """Find the opcode number of the MOV used to set the variable."""
         if self.data_type in ("char", "uchar"):
-            instr = struct.pack(">B", OPCODES["MOV_1B"])
+            return OPCODES["MOV_1B"]
         elif self.data_type in ("short", "ushort"):
-            instr = struct.pack(">B", OPCODES["MOV_2B"])
+            return OPCODES["MOV_2B"]
         elif self.data_type in ("int", "uint", "float"):
-            instr = struct.pack(">B", OPCODES["MOV_4B"])
+            return OPCODES["MOV_4B"]
         else:
             raise ValueError("Cannot find size of type {}".format(self.data_type))
 
+    def get_operand_byte(self) -> int:
+        """The byte describing the operands: a memory address and an immediate value of the right size."""
         valsize = self._calculate_valsize()
-        # The byte to describe the operands and the format string for how to turn the immediate value into binary
         if valsize == 1:
-            operand_num = b"R" # 0x52
-            val_fmt_str = ">B"
+            return 0x52  # R
         elif valsize == 2:
-            operand_num = b"S" # 0x53
-            val_fmt_str = ">H"
+            return 0x53  # S
         elif valsize == 4:
-            operand_num = b"T" # 0x54
-            val_fmt_str = ">I"
+            return 0x54  # T
         else:
             raise ValueError("Illegal value size: {}".format(valsize))
 
+    def write_bytes(self, buffer, offset, mem_table):
+        U8.pack_into(buffer, offset, self.get_opcode_num())
+        U8.pack_into(buffer, offset + 1, self.get_operand_byte())
+
         # The memory address
-        mem_addr = struct.pack(">I", mem_table[self.name])
+        U32.pack_into(buffer, offset + 2, mem_table[self.name])
 
         # The initial value
-        if self.data_type == "float":
-            value_bytes = struct.pack(">F", float(self.value))
-        else:
-            value_bytes = struct.pack(val_fmt_str, int(self.value))
+        value_bytes = self.get_op2_bytes(mem_table)
+        buffer[offset + 6: offset + 6 + len(value_bytes)] = value_bytes
 
-        # Put them all together and return
-        return instr + operand_num + mem_addr + value_bytes
+        return offset + 6 + len(value_bytes)
 
     def get_op1_bytes(self, mem_table):
         """Get the bytes of the first operand."""
@@ -302,7 +487,7 @@ class DataInstruction(Instruction):
             raise ValueError("Illegal value size: {}".format(valsize))
 
         if self.data_type == "float":
-            return struct.pack(">F", float(self.value))
+            return struct.pack(">f", float(self.value))
         else:
             return struct.pack(val_fmt_str, int(self.value))
 
@@ -360,51 +545,43 @@ class TextInstruction(Instruction):
 
         return length
 
-    def get_bytes(self, mem_table):
-        # First find the opcode byte
-
-        # Check the opcode is valid
-        if self.opcode_mnemonic not in OPCODE_NAMES:
-            raise ValueError("Unsupported opcode mnemonic: {}".format(self.opcode_mnemonic))
-
-        # Is this the type of opcode that has no subtypes?
-        if self.opcode_mnemonic in OPCODES.keys():
-            opcode_num = OPCODES[self.opcode_mnemonic]
+    def get_opcode_num(self) -> int:
+        """Find the opcode number for this combination of mnemonic and data type."""
+        try:
+            return OPCODE_TABLE[(self.opcode_mnemonic, self.data_type)]
+        except KeyError:
+            raise ValueError(describe_opcode_error(self.opcode_mnemonic, self.data_type)) from None
 
-        # Is it based on a data type?
-        elif (self.opcode_mnemonic + "_" + self.data_type) in OPCODES.keys():
-            opcode_num = OPCODES[self.opcode_mnemonic + "_" + self.data_type]
+    def get_bytes(self, mem_table):
+        instr_bytes = bytearray(self.get_bytes_length())
+        end = self.write_bytes(instr_bytes, 0, mem_table)
 
-        # If neither of those, then it might be size based
-        elif (self.data_type in ("char", "uchar")) and (self.opcode_mnemonic + "_1B" in OPCODES.keys()):
-            opcode_num = OPCODES[self.opcode_mnemonic + "_1B"]
-        elif (self.data_type in ("short", "ushort")) and (self.opcode_mnemonic + "_2B" in OPCODES.keys()):
-            opcode_num = OPCODES[self.opcode_mnemonic + "_2B"]
-        elif (self.data_type in ("int", "uint", "float")) and (self.opcode_mnemonic + "_4B" in OPCODES.keys()):
-            opcode_num = OPCODES[self.opcode_mnemonic + "_4B"]
+        assert end == self.get_bytes_length()
 
-        else:
-            raise ValueError("Mismatch between opcode {} and data type {}".format(self.opcode_mnemonic, self.data_type))
+        return bytes(instr_bytes)
 
-        # Turn the opcode number into an opcode byte
-        opcode_byte = struct.pack(">B", opcode_num)
-
-        # Next, find the operand byte
+    def get_operand_byte(self) -> int:
+        """The byte describing the types of the two operands, one in each half."""
         operand_num = self.operand1.get_bit_designation() if self.operand1 is not None else 0
         operand_num = operand_num << 4    # Shift the bits to the left to make space for the second
         operand_num += self.operand2.get_bit_designation() if self.operand2 is not None else 0
-        operand_byte = struct.pack(">B", operand_num)
+        return operand_num
 
-        # Get the operand bytes
-        op1_bytes = self.operand1.get_bytes() if self.operand1 is not None else b""
-        op2_bytes = self.operand2.get_bytes() if self.operand2 is not None else b""
+    def write_bytes(self, buffer, offset, mem_table):
+        # First the opcode byte
+        U8.pack_into(buffer, offset, self.get_opcode_num())
 
-        # Add them together
-        instr_bytes = opcode_byte + operand_byte + op1_bytes + op2_bytes
+        # Next, the operand byte
+        U8.pack_into(buffer, offset + 1, self.get_operand_byte())
 
-        assert len(instr_bytes) == self.get_bytes_length()
+        # Then the operands themselves
+        offset += 2
+        if self.operand1 is not None:
+            offset = self.operand1.write_bytes(buffer, offset)
+        if self.operand2 is not None:
+            offset = self.operand2.write_bytes(buffer, offset)
 
-        return instr_bytes
+        return offset
 
     def get_op1_bytes(self, mem_table):
         return self.operand1.get_bytes() if self.operand1 is not None else b""
@@ -419,10 +596,31 @@ class Operand:
     """
     Superclass for all operands. They use the features here to standardise
     things that all operands have. 
+    Operands returned by intern_operand() are shared between instructions, so they are frozen: their bytes are
+    worked out once and they cannot be changed afterwards. Constructors and freeze() set attributes with
+    object.__setattr__, so that only changes made later go through the check in __setattr__.
     """
+    __slots__ = ("_bit_designation", "_required_length", "_bytes", "_frozen")
+
     def __init__(self):
-        self._bit_designation = -1
-        self._required_length = -1
+        set_field = object.__setattr__
+        set_field(self, "_bit_designation", -1)
+        set_field(self, "_required_length", -1)
+        set_field(self, "_bytes", None)
+        set_field(self, "_frozen", False)
+
+    def __setattr__(self, name, value):
+        if self._frozen:
+            raise AttributeError("Cannot change a shared operand: {!r}".format(self))
+        object.__setattr__(self, name, value)
+
+    def freeze(self):
+        """Store the encoded bytes (if they can be worked out yet) and stop the operand from being changed."""
+        try:
+            object.__setattr__(self, "_bytes", self._encode())
+        except struct.error:
+            pass    # An address which is still a name
+        object.__setattr__(self, "_frozen", True)
 
     def get_bit_designation(self):
         return self._bit_designation
@@ -431,20 +629,34 @@ class Operand:
         return self._required_length
 
     def get_bytes(self):
+        if self._bytes is not None:
+            return self._bytes
+        return self._encode()
+
+    def _encode(self):
         raise NotImplementedError("Must use a subclass of Operand")
 
+    def write_bytes(self, buffer, offset):
+        """Write the operand into buffer starting at offset, and return the offset just after it."""
+        end = offset + self.get_required_length()
+        buffer[offset:end] = self.get_bytes()
+        return end
+
 
 class RegisterOperand(Operand):
     """
     Refers to a register. Stores its name, bit designation and length needed, and works out its numerical version.
     """
+    __slots__ = ("name", "numerical")
+
     def __init__(self, regname: str):
         super().__init__()
-        self.name = regname.lower()
-        self.numerical = REGISTERS[regname.lower()]
+        set_field = object.__setattr__
+        set_field(self, "name", regname.lower())
+        set_field(self, "numerical", REGISTERS[regname.lower()])
 
-        self._bit_designation = 1
-        self._required_length = 1
+        set_field(self, "_bit_designation", 1)
+        set_field(self, "_required_length", 1)
 
     def __eq__(self, other):
         return isinstance(other, RegisterOperand) \
@@ -459,33 +671,41 @@ class RegisterOperand(Operand):
     def __str__(self):
         return "\"{0.name}\"".format(self)
 
-    def get_bytes(self):
+    def _encode(self):
         # Basically turn the numerical register number into a byte
         return struct.pack(">B", self.numerical)
 
+    def write_bytes(self, buffer, offset):
+        U8.pack_into(buffer, offset, self.numerical)
+        return offset + 1
+
 
 class ImmediateOperand(Operand):
     """
     Represents an immediate value, like "5". Has to work out the size and type.
     """
-    def __init__(self, value: str):
+    __slots__ = ("value", "size")
+
+    def __init__(self, value: (str, int, float)):
         super().__init__()
-        try:
-            self.value = int(value)
-        except ValueError:
-            self.value = float(value)
-
-        if isinstance(self.value, float) or self.value < -32768 or self.value > 65536:
-            self.size = 4
-            self._bit_designation = 4
-        elif self.value < -128 or self.value > 255:
-            self.size = 2
-            self._bit_designation = 3
+        if not isinstance(value, (int, float)):
+            try:
+                value = int(value)
+            except ValueError:
+                value = float(value)
+
+        if isinstance(value, float) or value < -32768 or value > 65535:
+            size, bit_designation = 4, 4
+        elif value < -128 or value > 255:
+            size, bit_designation = 2, 3
         else:
-            self.size = 1
-            self._bit_designation = 2
+            size, bit_designation = 1, 2
 
-        self._required_length = self.size
+        set_field = object.__setattr__
+        set_field(self, "value", value)
+        set_field(self, "size", size)
+        set_field(self, "_bit_designation", bit_designation)
+        set_field(self, "_required_length", size)
 
     def __eq__(self, other):
         return isinstance(other, ImmediateOperand) \
@@ -516,18 +736,21 @@ class ImmediateOperand(Operand):
         else:
             return ">I"
 
-    def get_bytes(self):
+    def _encode(self):
         return struct.pack(self._get_value_format_string(), self.value)
 
 class AddressOperand(Operand):
     """
     An address. To start with, self.addr will be a string, but eventually it will be replaced with a memory address.
     """
+    __slots__ = ("addr",)
+
     def __init__(self, address: (str, int)):
         super().__init__()
-        self.addr = address
-        self._bit_designation = 5
-        self._required_length = 4
+        set_field = object.__setattr__
+        set_field(self, "addr", address)
+        set_field(self, "_bit_designation", 5)
+        set_field(self, "_required_length", 4)
 
     def __eq__(self, other):
         return isinstance(other, AddressOperand) \
@@ -538,65 +761,40 @@ class AddressOperand(Operand):
     def __repr__(self):
         return "AddressOperand({0.addr})".format(self)
 
-    def get_bytes(self):
+    def _encode(self):
         return struct.pack(">I", self.addr)
 
+    def write_bytes(self, buffer, offset):
+        U32.pack_into(buffer, offset, self.addr)
+        return offset + 4
+
 
 class ArithmeticOperand(Operand):
     """
-    One of the following types of arithmetic operands. 
+    One of the following types of arithmetic operands: a, a*b, a+b, a*b+c or a+b*c (see ARITHMETIC_FORMS).
     """
-    type_6 = r"^(?P<a>[a-zA-Z0-9]+)$"    # a
-    type_7 = r"^(?P<a>[a-zA-Z0-9]+)\*(?P<b>[a-zA-Z0-9]+)$"    # a*b
-    type_8 = r"^(?P<a>[a-zA-Z0-9]+)\+(?P<b>[a-zA-Z0-9]+)$"    # a+b
-    type_9 = r"^(?P<a>[a-zA-Z0-9]+)\*(?P<b>[a-zA-Z0-9]+)\+(?P<c>[a-zA-Z0-9]+)$"     # a*b+c
-    type_10 = r"^(?P<a>[a-zA-Z0-9]+)\+(?P<b>[a-zA-Z0-9]+)\*(?P<c>[a-zA-Z0-9]+)$"    # a+b*c
+    __slots__ = ("asm_str", "a", "b", "c")
 
-    def __init__(self, asm_str: str):
+    def __init__(self, asm_str: str, token: OperandToken = None):
         super().__init__()
-        self.asm_str = asm_str
-
-        if not asm_str.strip():
-            raise ValueError("Cannot process empty operand")
-
-        # See which type of operand this is and set everything accordingly
-        if re.search(self.type_10, asm_str) is not None:
-            m = re.match(self.type_10, asm_str)
-            self._bit_designation = 10
-            self._required_length = 3
-            self.a = m.group("a")
-            self.b = m.group("b")
-            self.c = m.group("c")
-        elif re.search(self.type_9, asm_str) is not None:
-            m = re.match(self.type_9, asm_str)
-            self._bit_designation = 9
-            self._required_length = 3
-            self.a = m.group("a")
-            self.b = m.group("b")
-            self.c = m.group("c")
-        elif re.search(self.type_8, asm_str) is not None:
-            m = re.match(self.type_8, asm_str)
-            self._bit_designation = 8
-            self._required_length = 2
-            self.a = m.group("a")
-            self.b = m.group("b")
-            self.c = None
-        elif re.search(self.type_7, asm_str) is not None:
-            m = re.match(self.type_7, asm_str)
-            self._bit_designation = 7
-            self._required_length = 2
-            self.a = m.group("a")
-            self.b = m.group("b")
-            self.c = None
-        elif re.search(self.type_6, asm_str) is not None:
-            m = re.match(self.type_6, asm_str)
-            self._bit_designation = 6
-            self._required_length = 1
-            self.a = m.group("a")
-            self.b = None
-            self.c = None
-        else:
-            raise AssemblyError(-1, "Incorrect format for arithmetic operand: {}".format(asm_str))
+        if token is None:
+            if not asm_str.strip():
+                raise ValueError("Cannot process empty operand")
+
+            # See which type of operand this is and set everything accordingly
+            m = ARITHMETIC_PATTERN.fullmatch(asm_str)
+            form = ARITHMETIC_FORMS.get(m.group("op1", "op2")) if m is not None else None
+            if form is None:
+                raise AssemblyError(-1, "Incorrect format for arithmetic operand: {}".format(asm_str))
+            token = OperandToken("arithmetic", form, m.group("a"), m.group("b"), m.group("c"))
+
+        set_field = object.__setattr__
+        set_field(self, "asm_str", asm_str)
+        set_field(self, "_bit_designation", token.form)
+        set_field(self, "a", token.a)
+        set_field(self, "b", token.b)
+        set_field(self, "c", token.c)
+        set_field(self, "_required_length", 1 + (token.b is not None) + (token.c is not None))
 
     def __eq__(self, other):
         return isinstance(other, ArithmeticOperand) \
@@ -627,7 +825,7 @@ class ArithmeticOperand(Operand):
         else:
             raise ValueError("Only 2, 4 and 8 are permitted for multiplication in arithmetic operands")
 
-    def get_bytes(self):
+    def _encode(self):
         bytes_ = b""
         for val in (self.a, self.b, self.c):
             if val is not None:
@@ -638,6 +836,206 @@ class ArithmeticOperand(Operand):
 
 
 
+class InstructionTable:
+    """
+    A compact store for a list of instructions, with one array per field instead of one object per instruction.
+    Row i holds instruction number i:
+     * opcodes[i] and operand_kinds[i] are its first two bytes
+     * payload[payload_offsets[i]:payload_offsets[i + 1]] are its operand bytes. Addresses which are still names
+       are left as zeroes and listed in the relocations (reloc_positions/reloc_symbols) for place_memory_addresses()
+     * label_ids[i] is the index of its label in symbols, or -1
+     * source_lines[i] is the line of the source file it came from, or 0 if that is not known
+    The other columns are only kept so that rows can be turned back into Instruction objects, which is what
+    indexing or iterating over the table gives.
+    """
+
+    def __init__(self):
+        self.opcodes = bytearray()
+        self.operand_kinds = bytearray()
+        self.payload_offsets = array("I", [0])
+        self.payload = bytearray()
+        self.label_ids = array("i")
+        self.source_lines = array("I")
+
+        self.mnemonic_ids = bytearray()
+        self.dtype_ids = bytearray()
+        self.operand1_ids = array("i")
+        self.operand2_ids = array("i")
+        self.var_ids = array("i")
+
+        # Lookup tables the columns refer to
+        self.operands = []      # Each distinct operand object, shared by every row that uses it
+        self.variables = []     # (name, value, dtype) for each data row
+        self.symbols = []       # Label and variable names
+        self.reloc_positions = array("I")
+        self.reloc_symbols = array("I")
+
+        self._operand_ids = {}
+        self._symbol_ids = {}
+
+    @classmethod
+    def from_instructions(cls, instruction_list: list):
+        table = cls()
+        for instruction in instruction_list:
+            table.append(instruction)
+        return table
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i: int) -> Instruction:
+        """Rebuild row i as an Instruction object."""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Instruction table index out of range")
+
+        if self.var_ids[i] >= 0:
+            name, value, dtype = self.variables[self.var_ids[i]]
+            return DataInstruction(i, name, value, dtype)
+
+        label_id = self.label_ids[i]
+        return TextInstruction(i,
+                               TABLE_MNEMONICS[self.mnemonic_ids[i]],
+                               TABLE_DTYPES[self.dtype_ids[i]],
+                               self._get_operand(self.operand1_ids[i]),
+                               self._get_operand(self.operand2_ids[i]),
+                               self.symbols[label_id] if label_id >= 0 else "")
+
+    def _get_operand(self, operand_id: int) -> Operand:
+        return self.operands[operand_id] if operand_id >= 0 else None
+
+    def _operand_id(self, operand: Operand) -> int:
+        if operand is None:
+            return -1
+        # Interned operands are shared, so most rows point at one of a handful of objects
+        operand_id = self._operand_ids.get(id(operand))
+        if operand_id is None:
+            operand_id = self._operand_ids[id(operand)] = len(self.operands)
+            self.operands.append(operand)
+        return operand_id
+
+    def _symbol_id(self, name: str) -> int:
+        symbol_id = self._symbol_ids.get(name)
+        if symbol_id is None:
+            symbol_id = self._symbol_ids[name] = len(self.symbols)
+            self.symbols.append(name)
+        return symbol_id
+
+    def _add_relocation(self, name: str):
+        """Leave space in the payload for the address of name."""
+        self.reloc_positions.append(len(self.payload))
+        self.reloc_symbols.append(self._symbol_id(name))
+        self.payload += b"\x00\x00\x00\x00"
+
+    def append(self, instruction: Instruction, source_line: int = 0):
+        """Add an instruction to the end of the table."""
+        if isinstance(instruction, DataInstruction):
+            self.opcodes.append(instruction.get_opcode_num())
+            self.operand_kinds.append(instruction.get_operand_byte())
+            self._add_relocation(instruction.name)
+            self.payload += instruction.get_op2_bytes({})
+
+            self.label_ids.append(-1)
+            self.mnemonic_ids.append(TABLE_MNEMONIC_IDS["MOV"])
+            self.dtype_ids.append(TABLE_DTYPE_IDS[instruction.data_type])
+            self.operand1_ids.append(-1)
+            self.operand2_ids.append(-1)
+            self.var_ids.append(len(self.variables))
+            self.variables.append((instruction.name, instruction.value, instruction.data_type))
+
+        elif isinstance(instruction, TextInstruction):
+            self.opcodes.append(instruction.get_opcode_num())
+            self.operand_kinds.append(instruction.get_operand_byte())
+            for operand in (instruction.operand1, instruction.operand2):
+                if isinstance(operand, AddressOperand) and isinstance(operand.addr, str):
+                    self._add_relocation(operand.addr)
+                elif operand is not None:
+                    self.payload += operand.get_bytes()
+
+            self.label_ids.append(self._symbol_id(instruction.label) if instruction.label != "" else -1)
+            self.mnemonic_ids.append(TABLE_MNEMONIC_IDS[instruction.opcode_mnemonic])
+            self.dtype_ids.append(TABLE_DTYPE_IDS[instruction.data_type])
+            self.operand1_ids.append(self._operand_id(instruction.operand1))
+            self.operand2_ids.append(self._operand_id(instruction.operand2))
+            self.var_ids.append(-1)
+
+        else:
+            raise ValueError("Item in instruction list is neither \
+            DataInstruction nor TextInstruction: {}".format(instruction))
+
+        self.payload_offsets.append(len(self.payload))
+        self.source_lines.append(source_line)
+
+    def extend(self, other):
+        """Add all the rows of another table to the end of this one."""
+        payload_shift = len(self.payload)
+        var_shift = len(self.variables)
+        symbol_map = [self._symbol_id(name) for name in other.symbols]
+        operand_map = [self._operand_id(operand) for operand in other.operands]
+
+        self.opcodes += other.opcodes
+        self.operand_kinds += other.operand_kinds
+        self.payload_offsets.extend(offset + payload_shift for offset in other.payload_offsets[1:])
+        self.payload += other.payload
+        self.label_ids.extend(symbol_map[x] if x >= 0 else -1 for x in other.label_ids)
+        self.source_lines += other.source_lines
+
+        self.mnemonic_ids += other.mnemonic_ids
+        self.dtype_ids += other.dtype_ids
+        self.operand1_ids.extend(operand_map[x] if x >= 0 else -1 for x in other.operand1_ids)
+        self.operand2_ids.extend(operand_map[x] if x >= 0 else -1 for x in other.operand2_ids)
+        self.var_ids.extend(x + var_shift if x >= 0 else -1 for x in other.var_ids)
+
+        self.variables += other.variables
+        self.reloc_positions.extend(x + payload_shift for x in other.reloc_positions)
+        self.reloc_symbols.extend(symbol_map[x] for x in other.reloc_symbols)
+
+    def layout(self) -> Layout:
+        """The table version of compute_layout(). Every instruction is two bytes plus its payload."""
+        instr_offsets = [2 * i + offset for i, offset in enumerate(self.payload_offsets)]
+
+        var_offsets = {}
+        var_table_size = 0
+        for name, _, dtype in self.variables:
+            var_offsets[name] = (var_table_size, dtype)
+            var_table_size += DTYPE_META[dtype].size
+
+        label_offsets = {}
+        symbols = self.symbols
+        for i, label_id in enumerate(self.label_ids):
+            if label_id >= 0:
+                label_offsets[symbols[label_id]] = instr_offsets[i]
+
+        return Layout(instr_offsets, instr_offsets[-1], var_offsets, var_table_size, label_offsets)
+
+    def place_memory_addresses(self, mem_table: dict):
+        """Write the address of each name into the space left for it in the payload."""
+        symbols = self.symbols
+        for position, symbol_id in zip(self.reloc_positions, self.reloc_symbols):
+            U32.pack_into(self.payload, position, mem_table[symbols[symbol_id]])
+
+    def write_bytes(self, buffer, offset: int) -> int:
+        """Write every instruction into buffer starting at offset, and return the offset after the last one."""
+        opcodes = self.opcodes
+        operand_kinds = self.operand_kinds
+        payload_offsets = self.payload_offsets
+        with memoryview(self.payload) as payload:
+            for i in range(len(opcodes)):
+                start = payload_offsets[i]
+                end = payload_offsets[i + 1]
+                buffer[offset] = opcodes[i]
+                buffer[offset + 1] = operand_kinds[i]
+                offset += 2
+                buffer[offset: offset + end - start] = payload[start:end]
+                offset += end - start
+        return offset
+
+
 class AssemblyError(Exception):
     """
     Raised when an error has happened, to inform the user of it in a standard way.
@@ -647,10 +1045,215 @@ class AssemblyError(Exception):
         self.line_no = line_no
         self.description = description
 
+    def __reduce__(self):
+        # Exceptions are pickled with their message as the only argument, which doesn't fit __init__
+        return AssemblyError, (self.line_no, self.description)
+
+
+class EventTrace:
+    """
+    Writes the commentary for the GUI in interactive mode. Each event is a line holding its name and then (if it has
+    one) its payload as JSON. Lines are collected up and written buffer_size characters at a time, events more
+    detailed than verbosity are left out, and once max_chars have been written everything apart from the end event is
+    dropped. If file is None, lines go to whatever sys.stdout is when they are written.
+    """
+    def __init__(self, file=None, verbosity=VERBOSITY_BYTES, max_chars=DEFAULT_TRACE_LIMIT, buffer_size=65536):
+        self.file = file
+        self.verbosity = verbosity
+        self.max_chars = max_chars
+        self.buffer_size = buffer_size
+
+        self.buffer = []
+        self.buffered = 0
+        self.written = 0
+        self.dropped = 0
+
+    def emit(self, name: str, payload=None):
+        if EVENT_LEVELS.get(name, VERBOSITY_LINES) > self.verbosity:
+            return
+
+        line = name + "\n" if payload is None else name + " " + json.dumps(payload) + "\n"
+        if name == "end":
+            if self.dropped:
+                self._add("truncated {}\n".format(json.dumps([self.dropped])))
+        elif self.dropped or self.max_chars is not None and self.written + self.buffered + len(line) > self.max_chars:
+            # Each event is a change to what the earlier ones built up, so nothing after a dropped one can be kept
+            self.dropped += 1
+            return
+        self._add(line)
+
+    def _add(self, line: str):
+        self.buffer.append(line)
+        self.buffered += len(line)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            file = sys.stdout if self.file is None else self.file
+            file.write("".join(self.buffer))
+            self.written += self.buffered
+            self.buffer = []
+            self.buffered = 0
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+
+
+# Receives the events in interactive mode. main() replaces it with one writing to TRACE_PATH.
+EVENTS = EventTrace(buffer_size=0)
+
+
+class PhaseProfiler:
+    """
+    Measures each phase of assembly: its wall time, CPU time and (if trace_memory is set) the most memory it had
+    allocated at once, through tracemalloc. Counts of what was assembled are kept alongside. While it is PROFILER, the
+    assembler reports to it; main() and assemble() take one as their profiler argument.
+    tracemalloc makes everything several times slower, so times taken while tracing mean little. To have both, time
+    one run without tracing and trace another, then add_peaks() from the traced one to the timed one.
+    """
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.phases = []
+        self.counts = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        # Unless something else is already tracing, memory is only traced during the phase, so peak_bytes is the most
+        # that the phase itself had allocated at once
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        elif self.trace_memory and hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            record = {"name": name,
+                      "wall_seconds": time.perf_counter() - start_wall,
+                      "cpu_seconds": time.process_time() - start_cpu}
+            if self.trace_memory:
+                record["peak_bytes"] = tracemalloc.get_traced_memory()[1] - start_memory
+            if started_tracing:
+                tracemalloc.stop()
+            self.phases.append(record)
+
+    def add_peaks(self, traced: "PhaseProfiler"):
+        """Take the peak_bytes of each phase from traced, which traced memory in another run with the same phases."""
+        if [record["name"] for record in traced.phases] != [record["name"] for record in self.phases]:
+            raise ValueError("The traced run went through different phases")
+        for record, traced_record in zip(self.phases, traced.phases):
+            record["peak_bytes"] = traced_record["peak_bytes"]
+
+    def count(self, **counts):
+        self.counts.update(counts)
+
+    def count_lines(self, lines):
+        """Pass lines through, counting them as they go."""
+        self.counts["lines"] = 0
+        for line in lines:
+            self.counts["lines"] += 1
+            yield line
+
+    def report(self) -> dict:
+        totals = {"wall_seconds": sum(record["wall_seconds"] for record in self.phases),
+                  "cpu_seconds": sum(record["cpu_seconds"] for record in self.phases)}
+        if self.phases and all("peak_bytes" in record for record in self.phases):
+            totals["peak_bytes"] = max(record["peak_bytes"] for record in self.phases)
+        return {"version": ASSEMBLER_VERSION, "phases": self.phases, "total": totals, "counts": self.counts}
+
+    def to_json(self) -> str:
+        return json.dumps(self.report(), indent=2)
+
+
+class NoPhase:
+    """Stands in for PhaseProfiler.phase() when nothing is being profiled."""
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NO_PHASE = NoPhase()
+
+# The PhaseProfiler being reported to, if there is one
+PROFILER = None
+
+
+@contextmanager
+def profiling(profiler):
+    """Make profiler (which can be None) the PROFILER until the end of the with block."""
+    global PROFILER
+    previous_profiler = PROFILER
+    PROFILER = profiler
+    try:
+        yield profiler
+    finally:
+        PROFILER = previous_profiler
+
+
+def profile_phase(name: str):
+    """A context manager around a phase of assembly, which times it if something is being profiled."""
+    return NO_PHASE if PROFILER is None else PROFILER.phase(name)
+
+
+def profile_count(**counts):
+    if PROFILER is not None:
+        PROFILER.count(**counts)
+
 
 # ---------- FUNCTIONS
 
 
+def describe_line_changes(old_lines: list, new_lines: list) -> list:
+    """
+    The edits which turn old_lines into new_lines, as [start, number of lines removed, lines inserted] lists. They
+    are given last first, so each start is still right once the edits before it have been made. new_lines must be
+    old_lines with some lines changed (keeping the same length) or with some lines taken out.
+    """
+    edits = []
+    if len(old_lines) == len(new_lines):
+        for i, (old, new) in enumerate(zip(old_lines, new_lines)):
+            if old == new:
+                continue
+            if edits and edits[-1][0] + edits[-1][1] == i:
+                edits[-1][1] += 1
+                edits[-1][2].append(new)
+            else:
+                edits.append([i, 1, [new]])
+    else:
+        j = 0
+        for i, old in enumerate(old_lines):
+            if j < len(new_lines) and old == new_lines[j]:
+                j += 1
+            elif edits and edits[-1][0] + edits[-1][1] == i:
+                edits[-1][1] += 1
+            else:
+                edits.append([i, 1, []])
+
+    edits.reverse()
+    return edits
+
+
+def describe_sections(lines: list) -> list:
+    """
+    The (start, end) range of lines in each of the meta, data and text sections of the normalised lines, not
+    including the section headers.
+    """
+    headers = [(i, line[len("section."):]) for i, line in enumerate(lines) if line.startswith("section.")]
+    ranges = {}
+    for (i, name), (next_i, _) in zip(headers, headers[1:] + [(len(lines), None)]):
+        ranges[name] = [i + 1, next_i]
+    return [ranges.get(name, [0, 0]) for name in ("meta", "data", "text")]
+
+
 
 
 def normalise_text(text: str) -> str:
@@ -662,6 +1265,7 @@ def normalise_text(text: str) -> str:
     # 1.1. Split text into lines
 
     lines = text.split("\n")
+    if INTERACTIVE_MODE: original_lines = lines.copy()
 
     for i, line in enumerate(lines):
         # 1.2. For each line, if there is a semicolon, remove everything after the first semicolon
@@ -670,17 +1274,19 @@ def normalise_text(text: str) -> str:
         # 1.3. Strip all whitespace from the start and end of every line
         lines[i] = lines[i].strip()
 
-    if INTERACTIVE_MODE: print("remove_comments", json.dumps(["\n".join(lines)]))
+    # In interactive mode, each step is described by the lines it changed rather than the whole text
+    if INTERACTIVE_MODE: EVENTS.emit("remove_comments", describe_line_changes(original_lines, lines))
 
     # 1.4. Remove empty lines
+    if INTERACTIVE_MODE: uncompacted_lines = lines
     lines = [line for line in lines if line != ""]
-    if INTERACTIVE_MODE: print("remove_empty_lines", json.dumps(["\n".join(lines)]))
+    if INTERACTIVE_MODE: EVENTS.emit("remove_empty_lines", describe_line_changes(uncompacted_lines, lines))
 
     # 1.5. Remove duplicate whitespace
-    multiple_whitespace = re.compile(r"\s+")
+    if INTERACTIVE_MODE: spaced_lines = lines.copy()
     for i, line in enumerate(lines):
-        lines[i] = multiple_whitespace.sub(" ", line)
-    if INTERACTIVE_MODE: print("remove_dup_wspace", json.dumps(["\n".join(lines)]))
+        lines[i] = MULTIPLE_WHITESPACE.sub(" ", line)
+    if INTERACTIVE_MODE: EVENTS.emit("remove_dup_wspace", describe_line_changes(spaced_lines, lines))
 
     # 1.6. Put the lines back together
     normalised_text = "\n".join(line.strip() for line in lines)
@@ -724,7 +1330,7 @@ def divide_and_contextualise(section_dict: dict) -> (dict, str):
     :return:
     """
 
-    if INTERACTIVE_MODE: print("start_proc_meta")
+    if INTERACTIVE_MODE: EVENTS.emit("start_proc_meta")
 
     # 4.1. Split the meta section into lines and interpret them
     # Create the dict based on META_CONFIG_DEFAULT
@@ -735,107 +1341,247 @@ def divide_and_contextualise(section_dict: dict) -> (dict, str):
 
     # Go through the lines and split on an = sign, then act on that
     for line in meta_lines:
-        if INTERACTIVE_MODE: print("read_meta_line", json.dumps([line]))
-        item, value = line.split("=")
-        if INTERACTIVE_MODE: print("ustd_meta_line", json.dumps(["Config item {item} has value {value}".format(item=item, value=value),
-            item, value]))
+        item, value = parse_meta_line(line)
         config_dict.update(**{item: value})
 
     # Config dict done, moving on to the big part: instructions
     instruction_list = []
 
-    if INTERACTIVE_MODE: print("start_proc_data")
+    if INTERACTIVE_MODE: EVENTS.emit("start_proc_data")
 
     # Start with the data section, adding each one as a DataInstruction instance
     data_lines = [x.strip() for x in section_dict["data"].split("\n") if x.strip()]
     for line in data_lines:
-        if INTERACTIVE_MODE: print("read_data_line", json.dumps([line]))
-        # Takes the form name VAR type initial
-        name, type_and_initial = [x.strip() for x in line.split("VAR") if x.strip()]
-        dtype, initial = type_and_initial.split()
-        if INTERACTIVE_MODE: print("ustd_data_line", json.dumps([
-            "Variable '{name}' has type '{type}' and initial value '{initial}'".format(name=name, type=dtype,
-                                                                                       initial=initial),
-                                                                                       name, dtype, initial]))
-
-        instruction_list.append(DataInstruction(len(instruction_list), name, initial, dtype))
+        instruction_list.append(parse_data_line(line, len(instruction_list)))
 
-    if INTERACTIVE_MODE: print("start_proc_text")
+    if INTERACTIVE_MODE: EVENTS.emit("start_proc_text")
 
     # Next move onto the text section
     text_lines = [x.strip() for x in section_dict["text"].split("\n") if x.strip()]
     for line in text_lines:
-        if INTERACTIVE_MODE: print("read_text_line", json.dumps([line]))
-
-        # Split into basic tokens
-        parts = line.split()
-
-        # See if the first part is in the list of opcodes. If not then it is likely a label
-        label = ""
-        if not parts[0].upper() in OPCODE_NAMES:
-            # The first must be a label; check that the second is the opcode
-            label = parts[0]
-            del parts[0]    # Remove the label from the list
-
-        # Now we can assume parts[0] is the opcode
-        # Next is the type. parts[1] could be a data type or it could not be
-        dtype = 0
-        if len(parts) > 1:
-            if parts[1].lower() in ("char", "uchar", "short", "ushort", "int", "uint", "float"):
-                dtype = parts[1].lower()
-                del parts[1]
-            elif parts[1].upper() == "1B":
-                dtype = "char"
-                del parts[1]
-            elif parts[1].upper() == "2B":
-                dtype = "short"
-                del parts[1]
-            elif parts[1].upper() == "4B":
-                dtype = "int"
-                del parts[1]
-            else:
-                dtype = "char"
-
-        # If not then assume the data type is unspecified
-        mnemonic = parts[0]
-        del parts[0]
-
-        # The list of parts should now just consist of the operands, separated by a space
-        if len(parts) == 0:
-            # No operands
-            operand1 = None
-            operand2 = None
-        elif len(parts) == 1:
-            operand1 = interpret_operand(parts[0])
-            operand2 = None
-        elif len(parts) == 2:
-            operand1 = interpret_operand(parts[0])
-            operand2 = interpret_operand(parts[1])
+        instruction_list.append(parse_text_line(line, len(instruction_list)))
+
+    return config_dict, instruction_list
+
+
+def parse_meta_line(line: str) -> (str, str):
+    """Interpret a line of the meta section, returning the config item and its value."""
+    if INTERACTIVE_MODE: EVENTS.emit("read_meta_line", [line])
+    item, value = line.split("=")
+    if INTERACTIVE_MODE: EVENTS.emit("ustd_meta_line", ["Config item {item} has value {value}".format(item=item, value=value),
+        item, value])
+    return item, value
+
+
+def parse_data_line(line: str, instr_num: int) -> DataInstruction:
+    """Interpret a line of the data section as a DataInstruction."""
+    if INTERACTIVE_MODE: EVENTS.emit("read_data_line", [line])
+    # Takes the form name VAR type initial
+    name, type_and_initial = [x.strip() for x in line.split("VAR") if x.strip()]
+    dtype, initial = type_and_initial.split()
+    if INTERACTIVE_MODE: EVENTS.emit("ustd_data_line", [
+        "Variable '{name}' has type '{type}' and initial value '{initial}'".format(name=name, type=dtype,
+                                                                                   initial=initial),
+                                                                                   name, dtype, initial])
+
+    return DataInstruction(instr_num, name, initial, dtype)
+
+
+def parse_text_line(line: str, instr_num: int) -> TextInstruction:
+    """Interpret a line of the text section as a TextInstruction."""
+    if INTERACTIVE_MODE: EVENTS.emit("read_text_line", [line])
+
+    # Split into basic tokens
+    parts = line.split()
+
+    # See if the first part is in the list of opcodes. If not then it is likely a label
+    label = ""
+    if not parts[0].upper() in OPCODE_NAMES:
+        # The first must be a label; check that the second is the opcode
+        label = parts[0]
+        del parts[0]    # Remove the label from the list
+
+    # Now we can assume parts[0] is the opcode
+    # Next is the type. parts[1] could be a data type or it could not be
+    dtype = 0
+    if len(parts) > 1:
+        if parts[1].lower() in ("char", "uchar", "short", "ushort", "int", "uint", "float"):
+            dtype = parts[1].lower()
+            del parts[1]
+        elif parts[1].upper() == "1B":
+            dtype = "char"
+            del parts[1]
+        elif parts[1].upper() == "2B":
+            dtype = "short"
+            del parts[1]
+        elif parts[1].upper() == "4B":
+            dtype = "int"
+            del parts[1]
         else:
-            raise Exception("Invalid length of {}".format(len(parts)))
+            dtype = "char"
+
+    # If not then assume the data type is unspecified
+    mnemonic = parts[0]
+    del parts[0]
+
+    # The list of parts should now just consist of the operands, separated by a space
+    if len(parts) == 0:
+        # No operands
+        operand1 = None
+        operand2 = None
+    elif len(parts) == 1:
+        operand1 = intern_operand(parts[0])
+        operand2 = None
+    elif len(parts) == 2:
+        operand1 = intern_operand(parts[0])
+        operand2 = intern_operand(parts[1])
+    else:
+        raise Exception("Invalid length of {}".format(len(parts)))
 
-        # We now have both operands; that's everything
-        instruction_list.append(TextInstruction(instr_num=len(instruction_list),
-                                                opcode=mnemonic,
-                                                dtype=dtype,
-                                                label=label,
-                                                op1=operand1,
-                                                op2=operand2))
+    # We now have both operands; that's everything
+    instruction = TextInstruction(instr_num=instr_num,
+                                  opcode=mnemonic,
+                                  dtype=dtype,
+                                  label=label,
+                                  op1=operand1,
+                                  op2=operand2)
 
-        if INTERACTIVE_MODE:
-            print("ustd_text_line",
-                  json.dumps(["Instruction {num}. Opcode={opcode}, type={type}, label={label}, op1={op1}, op2={op2}".format(
-                num=len(instruction_list) - 1,
-                opcode=mnemonic,
-                type=dtype,
-                label=label,
-                op1=operand1,
-                op2=operand2
-            ),
-            label, mnemonic, dtype, str(operand1), str(operand2)]))
-        
-    return config_dict, instruction_list
+    # Check now that the opcode exists for this type, rather than finding out when it is encoded
+    if (instruction.opcode_mnemonic, instruction.data_type) not in OPCODE_TABLE:
+        raise AssemblyError(-1, describe_opcode_error(instruction.opcode_mnemonic, instruction.data_type))
 
+    if INTERACTIVE_MODE:
+        EVENTS.emit("ustd_text_line",
+              ["Instruction {num}. Opcode={opcode}, type={type}, label={label}, op1={op1}, op2={op2}".format(
+            num=instr_num,
+            opcode=mnemonic,
+            type=dtype,
+            label=label,
+            op1=operand1,
+            op2=operand2
+        ),
+        label, mnemonic, dtype, str(operand1), str(operand2)])
+
+    return instruction
+
+
+# ---------- STREAMING
+# These do the same job as normalise_text(), split_into_sections() and divide_and_contextualise(), but work one line
+# at a time so that the source never has to be held in memory all at once. They are chained together by
+# contextualise_lines().
+
+
+def iter_normalised_lines(lines, numbered=False):
+    """
+    Generator version of normalise_text(). Yields each line without comments or extra whitespace, skipping any
+    that are left empty. If numbered is set, yields (line number, line) pairs instead, counting from 1.
+    """
+    for line_no, line in enumerate(lines, 1):
+        line = normalise_line(line)
+        if line:
+            yield (line_no, line) if numbered else line
+
+
+def normalise_line(line: str) -> str:
+    """Normalise a single line: remove any comment, strip it and collapse whitespace. Empty lines stay empty."""
+    line = line.split(";", 1)[0].strip()
+    return MULTIPLE_WHITESPACE.sub(" ", line) if line else line
+
+
+def iter_section_lines(lines, numbered=False):
+    """
+    Generator version of split_into_sections(). Takes normalised lines and yields (section name, line) pairs.
+    If numbered is set, takes and yields the line numbers too, as (line number, line) and (section, line, line number).
+    Once the lines run out, raises an AssemblyError if any of the required sections was never seen.
+    """
+    section = None
+    seen = set()
+    for item in lines:
+        line_no, line = item if numbered else (0, item)
+        if line.startswith("section."):
+            section = line[len("section."):]
+            seen.add(section)
+        elif section is not None:
+            yield (section, line, line_no) if numbered else (section, line)
+
+    # All sections have to be present, so check that
+    for section in ("meta", "data", "text"):
+        if section not in seen:
+            raise AssemblyError(-1, "No {} section".format(section))
+
+
+def iter_contextualised(section_lines, numbered=False):
+    """
+    Generator version of the line handling in divide_and_contextualise(). Yields a (section name, record) pair for
+    each line, where the record is a (item, value) tuple for the meta section and an Instruction for the others.
+    If numbered is set, the line number is passed through as a third item.
+    Instructions are numbered within their own section; contextualise_lines() gives them their final numbers.
+    """
+    data_count = 0
+    text_count = 0
+    for item in section_lines:
+        section, line = item[0], item[1]
+        if section == "meta":
+            record = parse_meta_line(line)
+        elif section == "data":
+            record = parse_data_line(line, data_count)
+            data_count += 1
+        elif section == "text":
+            record = parse_text_line(line, text_count)
+            text_count += 1
+        else:
+            continue
+        yield (section, record, item[2]) if numbered else (section, record)
+
+
+def contextualise_lines(lines, as_table=False) -> (dict, list):
+    """
+    Streaming equivalent of normalise_text(), split_into_sections() and divide_and_contextualise() together. lines
+    can be any iterable of source lines, such as an open file. Only the config dict and the instructions are kept.
+    If as_table is set, the instructions are returned as an InstructionTable (with source line numbers) so that no
+    Instruction objects are kept at all. When profiled, the three stages are one phase, since they are interleaved.
+    """
+    if PROFILER is not None:
+        lines = PROFILER.count_lines(lines)
+
+    with profile_phase("normalise_split_contextualise"):
+        config_dict = META_CONFIG_DEFAULT.copy()
+
+        if as_table:
+            data_table = InstructionTable()
+            text_table = InstructionTable()
+            numbered_lines = iter_section_lines(iter_normalised_lines(lines, numbered=True), numbered=True)
+            for section, record, line_no in iter_contextualised(numbered_lines, numbered=True):
+                if section == "meta":
+                    item, value = record
+                    config_dict[item] = value
+                elif section == "data":
+                    data_table.append(record, line_no)
+                else:
+                    text_table.append(record, line_no)
+
+            # The data instructions always come first, whatever order the sections were in
+            data_table.extend(text_table)
+            return config_dict, data_table
+
+        data_instructions = []
+        text_instructions = []
+
+        for section, record in iter_contextualised(iter_section_lines(iter_normalised_lines(lines))):
+            if section == "meta":
+                item, value = record
+                config_dict[item] = value
+            elif section == "data":
+                data_instructions.append(record)
+            else:
+                text_instructions.append(record)
+
+        # The data instructions always come first, whatever order the sections were in
+        for instruction in text_instructions:
+            instruction.instruction_num += len(data_instructions)
+        instruction_list = data_instructions + text_instructions
+
+        return config_dict, instruction_list
 
 
 def interpret_operand(string: str) -> Operand:
@@ -853,83 +1599,124 @@ def interpret_operand(string: str) -> Operand:
     if not string:
         raise ValueError("Cannot interpret an empty operand")
 
-    # Is it a register name?
-    if string.lower() in REGISTERS.keys():
-        # Yes it is
-        return RegisterOperand(string)
+    token = classify_operand(string)
 
-    # Is it an immediate value?
-    try:
-        val = int(string)
-        return ImmediateOperand(val)
-    except ValueError:
-        # it could be an immediate float
-        try:
-            val = float(string)
-            return ImmediateOperand(val)
-        except ValueError:
-            pass        # Not an immediate value
+    if token is None:
+        # A badly formed arithmetic expression gets a more helpful error from ArithmeticOperand
+        if string[0] == "[" and string[-1] == "]":
+            return ArithmeticOperand(string[1: -1])
+
+        # If it was none of those then it is invalid
+        raise ValueError("Invalid operand: {}".format(string))
+
+    if token.kind == "register":
+        return RegisterOperand(token.a)
+    elif token.kind == "immediate":
+        return ImmediateOperand(token.a)
+    elif token.kind == "address":
+        return AddressOperand(token.a)
+    else:
+        return ArithmeticOperand(string[1: -1], token)
+
+
+@lru_cache(maxsize=OPERAND_CACHE_SIZE)
+def intern_operand(string: str) -> Operand:
+    """
+    Cached version of interpret_operand(). The same text always gives back the same frozen operand object (as long
+    as it is still in the cache), so common operands like esp and [esp] are only built and encoded once.
+    """
+    operand = interpret_operand(string)
+    operand.freeze()
+    return operand
+
+
+def classify_operand(string: str) -> OperandToken:
+    """
+    Work out what type of operand a (stripped) string is in a single regular expression match, and return its
+    parts as an OperandToken. Returns None if it is not a valid operand.
+    """
+    m = OPERAND_PATTERN.fullmatch(string)
+    if m is None:
+        return None
 
-    # Is it an address label/variable?
-    if string.isidentifier():
-        return AddressOperand(string)
+    imm, name, a = m.group("imm", "name", "a")
 
-    # Is it an arithmetic expression?
-    if string[0] == "[" and string[-1] == "]":
-        return ArithmeticOperand(string[1: -1])
+    if name is not None:
+        if name.lower() in REGISTERS:
+            return OperandToken("register", 1, name.lower(), None, None)
+        return OperandToken("address", 5, name, None, None)
 
-    # If it was none of those then it is invalid
-    raise ValueError("Invalid operand: {}".format(string))
+    if imm is not None:
+        if m.group("frac") is None and m.group("frac2") is None and m.group("exp") is None:
+            return OperandToken("immediate", None, int(imm), None, None)
+        return OperandToken("immediate", None, float(imm), None, None)
 
+    form = ARITHMETIC_FORMS.get(m.group("op1", "op2"))
+    if form is None:
+        return None
+    return OperandToken("arithmetic", form, a, m.group("b"), m.group("c"))
 
-def record_labels_and_variables(instruction_list):
+
+def compute_layout(instruction_list) -> Layout:
     """
-    Analyse the instruction list to create a table mapping variable/label names to the 
-    memory addresses they refer to.
+    Work out where everything in the instruction list will be placed in a single pass. The instruction offsets are a
+    prefix sum of the instruction lengths, so the start address of instruction n is instr_offsets[n] and the total
+    size of the instructions is the final entry. Variable offsets are relative to the end of the instructions.
     """
-    # Create the empty tables
-    label_table = {}
-    var_table = {}
-    mem_table = {}
+    if isinstance(instruction_list, InstructionTable):
+        return instruction_list.layout()
 
-    # Loop through the instructions
-    for instruction in instruction_list:
-        # If the instruction is a DataInstruction, add it to the variable table with its relative position
+    instr_offsets = [0] * (len(instruction_list) + 1)
+    var_offsets = {}
+    label_offsets = {}
+
+    text_size = 0
+    var_table_size = 0
+    for i, instruction in enumerate(instruction_list):
         if isinstance(instruction, DataInstruction):
-            if INTERACTIVE_MODE: print("found_var [{name}] [{mrel}] [{type}]".format(
-                name=instruction.name,
-                mrel=calculate_var_table_size(var_table),
-                type=instruction.data_type
-            ))
-            var_table[instruction.name] = (calculate_var_table_size(var_table), instruction.data_type)
-
-        # If the instruction is a TextInstruction and has a label, add it to the label table
+            var_offsets[instruction.name] = (var_table_size, instruction.data_type)
+            var_table_size += DTYPE_META[instruction.data_type].size
         elif isinstance(instruction, TextInstruction):
-            if INTERACTIVE_MODE: print("found_label [{lname}] [{instrnum}]".format(
-                lname=instruction.label,
-                instrnum=instruction.instruction_num
-            ))
             if instruction.label != "":
-                label_table[instruction.label] = instruction.instruction_num
-
-        # If it was neither of these types, what's it doing here?
+                label_offsets[instruction.label] = text_size
         else:
             raise ValueError("Item in instruction list is neither \
             DataInstruction nor TextInstruction: {}".format(instruction))
 
+        instr_offsets[i] = text_size
+        text_size += instruction.get_bytes_length()
 
-    # Calculate the total size of the text section
-    total_text_section_size = sum(instr.get_bytes_length() for instr in instruction_list)
+    instr_offsets[len(instruction_list)] = text_size
+
+    return Layout(instr_offsets, text_size, var_offsets, var_table_size, label_offsets)
+
+
+def record_labels_and_variables(instruction_list, layout=None):
+    """
+    Analyse the instruction list to create a table mapping variable/label names to the 
+    memory addresses they refer to. A layout from compute_layout() can be passed in if one has already been made.
+    """
+    if layout is None:
+        layout = compute_layout(instruction_list)
+
+    mem_table = {}
+
+    if INTERACTIVE_MODE:
+        for instruction in instruction_list:
+            if isinstance(instruction, DataInstruction):
+                EVENTS.emit("found_var", [instruction.name, layout.var_offsets[instruction.name][0],
+                                          instruction.data_type])
+            else:
+                EVENTS.emit("found_label", [instruction.label, instruction.instruction_num])
 
     # Add all the variables to the memory address table
-    for name, (offset, _) in var_table.items():
-        mem_table[name] = total_text_section_size + offset
+    for name, (offset, _) in layout.var_offsets.items():
+        mem_table[name] = layout.text_size + offset
 
     # Add all the labels to the memory address table
-    for name, instr_num in label_table.items():
-        mem_table[name] = calculate_instr_start_address(instr_num, instruction_list)
+    mem_table.update(layout.label_offsets)
 
-    if INTERACTIVE_MODE: print("mem_offsets", json.dumps(mem_table))
+    if INTERACTIVE_MODE: EVENTS.emit("mem_offsets", mem_table)
 
     # That's done, so return it
     return mem_table
@@ -954,32 +1741,62 @@ def calculate_instr_start_address(instr_num, instruction_list):
 
 def encode_metadata(config_dict: dict) -> bytes:
     """Takes the meta dictionary and writes it into bytes."""
-    encoded = b""
-    for key, value in config_dict.items():
-        encoded += key.encode() + b"=" + str(value).encode() + b"&"
-    encoded += b"\x00\x00\x00\x00"
+    encoded = b"".join(key.encode() + b"=" + str(value).encode() + b"&" for key, value in config_dict.items())
 
-    return encoded
+    return encoded + b"\x00\x00\x00\x00"
 
 
-def encode_instruction_list(instruction_list: list, memory_table: dict) -> bytes:
+def encode_instruction_list(instruction_list: list, memory_table: dict) -> bytearray:
     """Turn the full instruction list into bytes."""
-    encoded = b""
+    encoded = bytearray(sum(instr.get_bytes_length() for instr in instruction_list))
+    with memoryview(encoded) as view:
+        write_instruction_list(view, 0, instruction_list, memory_table)
+    return encoded
+
+
+def encode_program(config_dict: dict, instruction_list: list, memory_table: dict, layout: Layout = None,
+                   data: bytes = b"") -> bytearray:
+    """
+    Turn the metadata and instruction list into the full bytecode. The output buffer is allocated once, at the size
+    given by the layout, and every instruction is written straight into it. data (a data image) goes after them.
+    """
+    if layout is None:
+        layout = compute_layout(instruction_list)
+
+    metadata = encode_metadata(config_dict)
+    if INTERACTIVE_MODE: EVENTS.emit("conv_meta", list(metadata))
+
+    bytecode = bytearray(len(metadata) + layout.text_size + len(data))
+    with memoryview(bytecode) as view:
+        view[:len(metadata)] = metadata
+        if isinstance(instruction_list, InstructionTable):
+            end = instruction_list.write_bytes(view, len(metadata))
+        else:
+            end = write_instruction_list(view, len(metadata), instruction_list, memory_table)
+        view[end:] = data
+
+    assert end + len(data) == len(bytecode), "Instructions did not fill the space given by the layout"
+    return bytecode
+
+
+def write_instruction_list(buffer, offset: int, instruction_list: list, memory_table: dict) -> int:
+    """Write each instruction into buffer, starting at offset. Returns the offset after the last instruction."""
     for instr in instruction_list:
-        b = instr.get_bytes(memory_table)
+        end = instr.write_bytes(buffer, offset, memory_table)
         if INTERACTIVE_MODE:
-            print("conv_instr [{opcode}] [{opbyte}] {op1} {op2}".format(
-                opcode=b[0],
-                opbyte=b[1],
-                op1=list(instr.get_op1_bytes(memory_table)),
-                op2=list(instr.get_op2_bytes(memory_table))
-            ))
-        encoded += b
-    return encoded
+            # The last item is where the instruction's bytes start
+            EVENTS.emit("conv_instr", [buffer[offset], buffer[offset + 1], list(instr.get_op1_bytes(memory_table)),
+                                       list(instr.get_op2_bytes(memory_table)), offset])
+        offset = end
+    return offset
 
 
 def place_memory_addresses(mem_table: dict, instruction_list: list):
     """Replace textual references in the instructions with the right memory addresses."""
+    if isinstance(instruction_list, InstructionTable):
+        instruction_list.place_memory_addresses(mem_table)
+        return
+
     for instr in instruction_list:
         if isinstance(instr, DataInstruction):
             continue    # These don't have operands
@@ -991,6 +1808,403 @@ def place_memory_addresses(mem_table: dict, instruction_list: list):
             instr.operand2 = AddressOperand(mem_table[instr.operand2.addr])
 
 
+# ---------- PEEPHOLE OPTIMISATION
+# Used with -O. Each rule looks at a few neighbouring text instructions and replaces them with fewer. Since an
+# instruction with a label can be jumped to, only the first of the instructions a rule replaces may have one, and that
+# label moves onto whatever takes their place (or onto the next instruction, if nothing does).
+
+
+def immediate_change(instruction):
+    """If instruction adds or subtracts a uint immediate to a register, the register's name and the signed amount."""
+    if isinstance(instruction, TextInstruction) and instruction.opcode_mnemonic in ("ADD", "SUB") \
+            and instruction.data_type == "uint" and isinstance(instruction.operand1, RegisterOperand) \
+            and isinstance(instruction.operand2, ImmediateOperand) and isinstance(instruction.operand2.value, int):
+        amount = instruction.operand2.value
+        return instruction.operand1.name, amount if instruction.opcode_mnemonic == "ADD" else -amount
+    return None
+
+
+def is_stack_top(operand) -> bool:
+    """True if operand is [esp]."""
+    return isinstance(operand, ArithmeticOperand) and operand.get_bit_designation() == ARITHMETIC_FORMS[None, None] \
+        and operand.a == "esp"
+
+
+def uses_esp(operand) -> bool:
+    if isinstance(operand, RegisterOperand):
+        return operand.name == "esp"
+    if isinstance(operand, ArithmeticOperand):
+        return "esp" in (operand.a, operand.b, operand.c)
+    return False
+
+
+def peephole_merge_add_sub(instructions: list, i: int):
+    """ADD/SUB uint reg n, followed by more ADD/SUB uint on the same register, become one instruction (or none)."""
+    first = immediate_change(instructions[i])
+    if first is None:
+        return None
+
+    register, total = first
+    end = i + 1
+    while end < len(instructions) and instructions[end].label == "":
+        change = immediate_change(instructions[end])
+        if change is None or change[0] != register:
+            break
+        total += change[1]
+        end += 1
+
+    if end == i + 1 or abs(total) >= 2 ** 32:
+        return None
+    if total == 0:
+        return end - i, []
+    return end - i, [TextInstruction(instructions[i].instruction_num, "ADD" if total > 0 else "SUB", "uint",
+                                     instructions[i].operand1, intern_operand(str(abs(total))), instructions[i].label)]
+
+
+def peephole_drop_self_mov(instructions: list, i: int):
+    """MOV 4B reg reg does nothing."""
+    instruction = instructions[i]
+    if isinstance(instruction, TextInstruction) and instruction.opcode_mnemonic == "MOV" \
+            and instruction.data_type == "int" and isinstance(instruction.operand1, RegisterOperand) \
+            and instruction.operand1 == instruction.operand2:
+        return 1, []
+    return None
+
+
+def peephole_push_pop(instructions: list, i: int):
+    """
+    A push of x (SUB uint esp 4, MOV 4B [esp] x) followed straight away by a pop into y (MOV 4B y [esp],
+    ADD uint esp 4) is the same as MOV 4B y x, as long as neither x nor y depends on esp.
+    """
+    if i + 4 > len(instructions) or immediate_change(instructions[i]) != ("esp", -4):
+        return None
+
+    # Everything from here on is a text instruction, since the data instructions all come first
+    sub, push, pop, add = instructions[i: i + 4]
+    if any(instruction.label != "" for instruction in (push, pop, add)) or immediate_change(add) != ("esp", 4):
+        return None
+    for mov in (push, pop):
+        if mov.opcode_mnemonic != "MOV" or mov.data_type != "int":
+            return None
+    if not is_stack_top(push.operand1) or not is_stack_top(pop.operand2):
+        return None
+
+    source = push.operand2
+    destination = pop.operand1
+    if uses_esp(source) or uses_esp(destination):
+        return None
+    if source == destination:
+        return 4, []
+    return 4, [TextInstruction(sub.instruction_num, "MOV", "int", destination, source, sub.label)]
+
+
+def peephole_jump_to_next(instructions: list, i: int, renames: dict):
+    """A JMP to the instruction straight after it."""
+    instruction = instructions[i]
+    if isinstance(instruction, TextInstruction) and instruction.opcode_mnemonic == "JMP" \
+            and isinstance(instruction.operand1, AddressOperand) and isinstance(instruction.operand1.addr, str) \
+            and i + 1 < len(instructions) and instructions[i + 1].label != "" \
+            and resolve_rename(instruction.operand1.addr, renames) == instructions[i + 1].label:
+        return 1, []
+    return None
+
+
+# Every rule, in the order they are tried, by the name used when reporting how often each was used
+PEEPHOLE_RULES = (
+    ("merge_add_sub", lambda instructions, i, renames: peephole_merge_add_sub(instructions, i)),
+    ("drop_self_mov", lambda instructions, i, renames: peephole_drop_self_mov(instructions, i)),
+    ("push_pop", lambda instructions, i, renames: peephole_push_pop(instructions, i)),
+    ("jump_to_next", peephole_jump_to_next)
+)
+
+
+def resolve_rename(name: str, renames: dict) -> str:
+    while name in renames:
+        name = renames[name]
+    return name
+
+
+def optimise_instructions(instruction_list: list) -> (list, dict):
+    """
+    Leave out any blocks of code which can never run, then apply the peephole rules to a list of instructions until
+    none of them match any more. Returns the new list (the instructions given are not changed) and how many times
+    each rule was used, with the number of blocks left out as "unreachable". If an InstructionTable is given, an
+    InstructionTable comes back, with each row keeping the source line of the instruction it came from.
+    """
+    instructions, unreachable = drop_unreachable(instruction_list)
+    hits = {"unreachable": unreachable}
+    hits.update((name, 0) for name, _ in PEEPHOLE_RULES)
+    renames = {}    # Labels which were taken off a removed instruction, and the label to use instead
+
+    applied = True
+    while applied:
+        applied = False
+        output = []
+        i = 0
+        while i < len(instructions):
+            for name, rule in PEEPHOLE_RULES:
+                match = rule(instructions, i, renames)
+                if match is None:
+                    continue
+                consumed, replacement = match
+                label = instructions[i].label
+                if not replacement and label != "":
+                    # The label has to go onto the next instruction, so there has to be one
+                    if i + consumed == len(instructions):
+                        continue
+                    following = copy(instructions[i + consumed])
+                    if following.label == "":
+                        following.label = label
+                    else:
+                        renames[label] = following.label
+                    instructions[i + consumed] = following
+
+                hits[name] += 1
+                applied = True
+                output += replacement
+                i += consumed
+                break
+            else:
+                output.append(instructions[i])
+                i += 1
+        instructions = output
+
+    # Point everything at the labels which are left, and number the instructions again
+    origins = [instruction.instruction_num for instruction in instructions]
+    for i, instruction in enumerate(instructions):
+        operands = (getattr(instruction, "operand1", None), getattr(instruction, "operand2", None))
+        renamed = [AddressOperand(resolve_rename(operand.addr, renames))
+                   if isinstance(operand, AddressOperand) and operand.addr in renames else operand
+                   for operand in operands]
+        if instruction.instruction_num != i or renamed != list(operands):
+            instruction = instructions[i] = copy(instruction)
+            instruction.instruction_num = i
+            if isinstance(instruction, TextInstruction):
+                instruction.operand1, instruction.operand2 = renamed
+
+    if isinstance(instruction_list, InstructionTable):
+        table = InstructionTable()
+        for instruction, origin in zip(instructions, origins):
+            table.append(instruction, instruction_list.source_lines[origin])
+        return table, hits
+    return instructions, hits
+
+
+def describe_peephole_hits(hits: dict) -> str:
+    return "Peephole optimisation: " + ", ".join("{} {}".format(name, count) for name, count in hits.items())
+
+
+# ---------- RAW DATA
+# Used with --raw-data. The data section isn't turned into MOVs which the interpreter has to run; the variables' initial
+# values are packed into a data image after the code instead, so copying the program into memory sets them all at
+# once. Variables which start at zero are put after all the others and left out of the image: memory starts zeroed,
+# so they only need to fit in mem_amt.
+
+# Where each variable goes (relative to the end of the code), the bytes of the data image and the size of the zeroed
+# variables after it
+DataLayout = namedtuple("DataLayout", ["var_offsets", "image", "bss_size"])
+
+
+def data_value_bytes(variable: DataInstruction) -> bytes:
+    """The bytes variable starts with in memory."""
+    value = float(variable.value) if variable.data_type == "float" else int(variable.value)
+    try:
+        return DATA_STRUCTS[variable.data_type].pack(value)
+    except struct.error:
+        raise AssemblyError(-1, "Value {} does not fit in variable {} of type {}".format(variable.value, variable.name,
+                                                                                   variable.data_type))
+
+
+def split_data(instruction_list) -> (list, list):
+    """Separate the data instructions from the text instructions. An InstructionTable gives a table of text rows."""
+    variables = [instruction for instruction in instruction_list if isinstance(instruction, DataInstruction)]
+    if not isinstance(instruction_list, InstructionTable):
+        return variables, [instruction for instruction in instruction_list if isinstance(instruction, TextInstruction)]
+
+    text = InstructionTable()
+    for i, instruction in enumerate(instruction_list):
+        if isinstance(instruction, TextInstruction):
+            text.append(instruction, instruction_list.source_lines[i])
+    return variables, text
+
+
+def layout_data(variables: list) -> DataLayout:
+    """Place the variables which start with a value first, in order, then the ones which start at zero."""
+    values = [data_value_bytes(variable) for variable in variables]
+    var_offsets = {}
+    image = bytearray()
+    for variable, value in zip(variables, values):
+        if any(value):
+            var_offsets[variable.name] = (len(image), variable.data_type)
+            image += value
+
+    bss_size = 0
+    for variable, value in zip(variables, values):
+        if not any(value):
+            var_offsets[variable.name] = (len(image) + bss_size, variable.data_type)
+            bss_size += len(value)
+    return DataLayout(var_offsets, bytes(image), bss_size)
+
+
+# ---------- CONTAINER
+
+
+def encode_symbol_table(symbols: dict) -> bytes:
+    """Encode a dict mapping each name to (address, kind) as a symbol table section."""
+    records = []
+    names = []
+    name_offset = 0
+    for name in sorted(symbols):
+        address, kind = symbols[name]
+        encoded_name = name.encode()
+        records.append(SYMBOL_RECORD.pack(address, name_offset, len(encoded_name), kind))
+        names.append(encoded_name)
+        name_offset += len(encoded_name)
+    return U32.pack(len(records)) + b"".join(records) + b"".join(names)
+
+
+def encode_line_table(lines) -> bytes:
+    """Encode (code address, source line) pairs as a line table section."""
+    lines = sorted(lines)
+    return U32.pack(len(lines)) + b"".join(LINE_RECORD.pack(address, line) for address, line in lines)
+
+
+def encode_container(config_dict: dict, code: bytes, symbols: dict = None, lines=None, entry: int = 0) -> bytearray:
+    """Put the metadata, code and (if given) the symbol and line tables together into a v2 container."""
+    sections = [encode_metadata(config_dict)[:-4], code,
+                encode_symbol_table(symbols) if symbols is not None else b"",
+                encode_line_table(lines) if lines is not None else b""]
+
+    header_size = CONTAINER_HEADER.size + CONTAINER_SECTION.size * CONTAINER_SECTION_COUNT
+    container = bytearray(header_size + sum(len(section) for section in sections))
+    CONTAINER_HEADER.pack_into(container, 0, CONTAINER_MAGIC, CONTAINER_VERSION, CONTAINER_SECTION_COUNT, entry)
+
+    offset = header_size
+    for i, section in enumerate(sections):
+        CONTAINER_SECTION.pack_into(container, CONTAINER_HEADER.size + CONTAINER_SECTION.size * i,
+                                    offset if section else 0, len(section))
+        container[offset: offset + len(section)] = section
+        offset += len(section)
+
+    return container
+
+
+def encode_container_program(config_dict: dict, instruction_list, memory_table: dict,
+                             layout: Layout = None, data: bytes = b"") -> bytearray:
+    """
+    Like encode_program(), but gives a v2 container with a symbol table. If the instructions are in an InstructionTable
+    which knows where they came from, there is a line table as well.
+    """
+    if layout is None:
+        layout = compute_layout(instruction_list)
+
+    code = bytearray(layout.text_size + len(data))
+    with memoryview(code) as view:
+        if isinstance(instruction_list, InstructionTable):
+            end = instruction_list.write_bytes(view, 0)
+        else:
+            end = write_instruction_list(view, 0, instruction_list, memory_table)
+        view[end:] = data
+    assert end + len(data) == len(code), "Instructions did not fill the space given by the layout"
+
+    symbols = {name: (address, SYMBOL_LABEL if name in layout.label_offsets else SYMBOL_VARIABLE)
+               for name, address in memory_table.items()}
+
+    lines = None
+    if isinstance(instruction_list, InstructionTable) and any(instruction_list.source_lines):
+        lines = [(address, line) for address, line in zip(layout.instr_offsets, instruction_list.source_lines) if line]
+
+    return encode_container(config_dict, code, symbols, lines)
+
+
+def is_container(image) -> bool:
+    return bytes(image[:len(CONTAINER_MAGIC)]) == CONTAINER_MAGIC
+
+
+def container_section(image, section: int) -> (int, int):
+    """The (offset, length) of a section in a v2 container. The header is all that is read."""
+    magic, version, section_count, _ = CONTAINER_HEADER.unpack_from(image, 0)
+    if magic != CONTAINER_MAGIC or version != CONTAINER_VERSION:
+        raise ValueError("Not a version {} container".format(CONTAINER_VERSION))
+    if section >= section_count:
+        return 0, 0
+    return CONTAINER_SECTION.unpack_from(image, CONTAINER_HEADER.size + CONTAINER_SECTION.size * section)
+
+
+def find_symbol(image, name: str):
+    """
+    Look up a name in a v2 container's symbol table with a binary search, without decoding the rest of the table.
+    Returns (address, kind), or None if the name isn't there.
+    """
+    offset, length = container_section(image, SECTION_SYMBOLS)
+    if length == 0:
+        return None
+
+    count, = U32.unpack_from(image, offset)
+    names_start = offset + 4 + count * SYMBOL_RECORD.size
+    wanted = name.encode()
+
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        address, name_offset, name_length, kind = SYMBOL_RECORD.unpack_from(image,
+                                                                            offset + 4 + middle * SYMBOL_RECORD.size)
+        found = bytes(image[names_start + name_offset: names_start + name_offset + name_length])
+        if found == wanted:
+            return address, kind
+        elif found < wanted:
+            low = middle + 1
+        else:
+            high = middle
+    return None
+
+
+def decode_metadata(metadata: bytes) -> dict:
+    """Turn key=value& metadata back into a config dict."""
+    config_dict = {}
+    for pair in bytes(metadata).decode().split("&"):
+        if pair:
+            key, value = pair.split("=")
+            config_dict[key] = int(value)
+    return config_dict
+
+
+def read_image(image) -> Image:
+    """
+    Read bytecode in either format. image can be bytes or anything else supporting the buffer protocol, such as an
+    mmap; code is a memoryview into it rather than a copy.
+    """
+    view = memoryview(image)
+    if not is_container(view):
+        # The original format: the metadata, then 4 zero bytes, then the code. bytes, bytearray and mmap can all
+        # search for the zeroes without being copied.
+        code_offset = (image if hasattr(image, "find") else bytes(view)).find(b"\x00\x00\x00\x00") + 4
+        return Image(1, decode_metadata(view[:code_offset - 4]), view[code_offset:], code_offset, 0, None, None)
+
+    _, version, _, entry = CONTAINER_HEADER.unpack_from(view, 0)
+    meta_offset, meta_length = container_section(view, SECTION_META)
+    code_offset, code_length = container_section(view, SECTION_CODE)
+
+    symbols = None
+    offset, length = container_section(view, SECTION_SYMBOLS)
+    if length:
+        count, = U32.unpack_from(view, offset)
+        names_start = offset + 4 + count * SYMBOL_RECORD.size
+        symbols = {}
+        for address, name_offset, name_length, kind in SYMBOL_RECORD.iter_unpack(view[offset + 4: names_start]):
+            name = bytes(view[names_start + name_offset: names_start + name_offset + name_length]).decode()
+            symbols[name] = (address, kind)
+
+    lines = None
+    offset, length = container_section(view, SECTION_LINES)
+    if length:
+        count, = U32.unpack_from(view, offset)
+        lines = list(LINE_RECORD.iter_unpack(view[offset + 4: offset + 4 + count * LINE_RECORD.size]))
+
+    return Image(version, decode_metadata(view[meta_offset: meta_offset + meta_length]),
+                 view[code_offset: code_offset + code_length], code_offset, entry, symbols, lines)
+
+
 def print_bytes_as_hex(bytes_: bytes, rowlen: int):
     for i, byte in enumerate(bytes_):
         print(format(byte, ">02X") + " ", end="")
@@ -998,55 +2212,203 @@ def print_bytes_as_hex(bytes_: bytes, rowlen: int):
             print()
 
 
-def main(asmfile: str, out_format: str, interactive=False):
-    global INTERACTIVE_MODE
-    INTERACTIVE_MODE = interactive
-
-    if INTERACTIVE_MODE:
-        outfile = open("../GUI/asmout.txt", "w")
-        sys.stdout = outfile
-
-    with open(asmfile, "rt") as file:
-        text = file.read()
-
-    # Now the text is available
-
+def contextualise_text(text: str, show=True) -> (dict, list):
+    """
+    Steps 1-3 of assembly, done on the whole text at once. Each stage is printed as it is finished (unless show is
+    unset); in interactive mode, that means the GUI's events. Outside interactive mode the instructions come back as
+    an InstructionTable.
+    """
     # 1. PERFORM TEXT NORMALISATION
 
-    if INTERACTIVE_MODE: print("start_text", json.dumps([text]))
-    normalised_text = normalise_text(text)
-    if not INTERACTIVE_MODE: print(normalised_text)
+    if INTERACTIVE_MODE: EVENTS.emit("start_text", [text])
+    profile_count(lines=text.count("\n") + 1)
+    with profile_phase("normalise"):
+        normalised_text = normalise_text(text)
+    if show and not INTERACTIVE_MODE: print(normalised_text)
 
     # 2. SPLIT DOCUMENT INTO SECTIONS
-    section_dict = split_into_sections(normalised_text)
-    if not INTERACTIVE_MODE: pprint(section_dict)
-    if INTERACTIVE_MODE: print("split", json.dumps([section_dict["meta"], section_dict["data"], section_dict["text"]]))
+    with profile_phase("split"):
+        section_dict = split_into_sections(normalised_text)
+    if show and not INTERACTIVE_MODE: pprint(section_dict)
+    # The GUI is given the range of normalised lines in each section, rather than the text again
+    if INTERACTIVE_MODE: EVENTS.emit("split", describe_sections(normalised_text.split("\n")))
 
     # 3. DIVIDE LINES AND CONTEXTUALISE
-    config_dict, instruction_list = divide_and_contextualise(section_dict)
+    with profile_phase("divide_and_contextualise"):
+        config_dict, instruction_list = divide_and_contextualise(section_dict)
+
+        # The GUI wants to hear about each instruction, but otherwise the compact table is used from here on
+        if not INTERACTIVE_MODE:
+            instruction_list = InstructionTable.from_instructions(instruction_list)
+
+    return config_dict, instruction_list
+
 
+def layout_and_encode(config_dict: dict, instruction_list, container=False, raw_data=False) -> (bytearray, dict):
+    """
+    Steps 4-5 of assembly. Returns the bytecode (as a v2 container with symbol and line tables if container is set)
+    and the memory table. If raw_data is set, the variables are given a data image instead of MOVs.
+    """
     # 4. RECORD LABELS/VARIABLES
-    if INTERACTIVE_MODE: print("start_lv_detect")
-    mem_table = record_labels_and_variables(instruction_list)
+    if INTERACTIVE_MODE: EVENTS.emit("start_lv_detect")
+    profile_count(instructions=len(instruction_list))
+    with profile_phase("layout"):
+        data = b""
+        if raw_data:
+            variables, instruction_list = split_data(instruction_list)
+            data_layout = layout_data(variables)
+            data = data_layout.image
+            layout = compute_layout(instruction_list)._replace(var_offsets=data_layout.var_offsets,
+                                                               var_table_size=len(data) + data_layout.bss_size)
+
+            memory_size = int(config_dict["mem_amt"]) * 1024
+            if layout.text_size + layout.var_table_size > memory_size:
+                raise AssemblyError(-1, "Program needs {} bytes of memory but mem_amt only gives {}".format(
+                    layout.text_size + layout.var_table_size, memory_size))
+            config_dict = dict(config_dict)
+            config_dict[META_DATA_SIZE] = len(data)
+            config_dict[META_BSS_SIZE] = data_layout.bss_size
+        else:
+            layout = compute_layout(instruction_list)
+        mem_table = record_labels_and_variables(instruction_list, layout)
+    profile_count(labels=len(layout.label_offsets), variables=len(layout.var_offsets))
 
     # 5. CONVERT EACH LINE TO BYTES
-    place_memory_addresses(mem_table, instruction_list)
+    with profile_phase("place_memory_addresses"):
+        place_memory_addresses(mem_table, instruction_list)
+    with profile_phase("encode"):
+        if container:
+            bytecode = encode_container_program(config_dict, instruction_list, mem_table, layout, data)
+        else:
+            bytecode = encode_program(config_dict, instruction_list, mem_table, layout, data)
+    profile_count(bytes=len(bytecode))
+
+    if INTERACTIVE_MODE: EVENTS.emit("end", {"length": len(bytecode)})
+    return bytecode, mem_table
+
+
+# ---------- LIBRARY INTERFACE
+# For use by other Python code. These never print anything, whatever mode the command line assembler is in.
 
-    bytecode = b""
-    bytecode += encode_metadata(config_dict)
-    if INTERACTIVE_MODE:
-        print("conv_meta", json.dumps(list(bytecode)))
-    bytecode += encode_instruction_list(instruction_list, mem_table)
+
+def assemble(source, container=False, optimise=False, raw_data=False, profiler=None) -> Assembled:
+    """
+    Assemble source, which can be the text of a program or any iterable of its lines, entirely in memory. Returns an
+    Assembled holding the bytecode (as bytes) and the symbol table. If container is set, the bytecode is a v2
+    container holding symbol and line tables too. If optimise is set, the peephole rules are applied first. If
+    raw_data is set, the variables are set by a data image after the code rather than by MOVs. If a PhaseProfiler
+    is given as profiler, each phase is recorded in it.
+    """
+    bytecode, mem_table, config_dict = assemble_buffer(source, container, optimise, raw_data, profiler)
+    return Assembled(bytes(bytecode), mem_table, config_dict)
+
+
+def assemble_buffer(source, container=False, optimise=False, raw_data=False, profiler=None) -> (bytearray, dict, dict):
+    """
+    The body of assemble(), returning the bytearray the bytecode was encoded into (without copying it), the memory
+    table and the config dictionary.
+    """
+    global INTERACTIVE_MODE
+    if isinstance(source, str):
+        source = source.split("\n")
+
+    was_interactive = INTERACTIVE_MODE
+    INTERACTIVE_MODE = False
+    try:
+        with profiling(profiler):
+            config_dict, instruction_list = contextualise_lines(source, as_table=True)
+            if optimise:
+                with profile_phase("optimise"):
+                    instruction_list, _ = optimise_instructions(instruction_list)
+            bytecode, mem_table = layout_and_encode(config_dict, instruction_list, container, raw_data)
+    finally:
+        INTERACTIVE_MODE = was_interactive
+
+    return bytecode, mem_table, config_dict
+
+
+def assemble_file(path: str, container=False, optimise=False, raw_data=False, profiler=None) -> Assembled:
+    """Assemble the file at path, reading it one line at a time. Returns an Assembled like assemble() does."""
+    with open(path, "rt") as file:
+        return assemble(file, container, optimise, raw_data, profiler)
+
+
+def main(asmfile: str, out_format: str, interactive=False, stream=False, verbosity=VERBOSITY_BYTES,
+         max_trace_chars=DEFAULT_TRACE_LIMIT, container=False, optimise=False, raw_data=False, profiler=None):
+    """
+    Assemble asmfile and output it in out_format. If stream is set (and the GUI is not running), the file is read
+    one line at a time by contextualise_lines() instead of being loaded and split up as a whole. In interactive mode
+    the commentary goes to TRACE_PATH instead, with verbosity and max_trace_chars passed on to its EventTrace. If
+    container is set, the output is a v2 container; the file is then always streamed, to keep its line numbers. If
+    optimise is set, the peephole rules are applied before layout, and how often each was used goes to stderr. If
+    raw_data is set, the variables get a data image instead of MOVs. The GUI always shows the program as written, so
+    optimise and raw_data do nothing in interactive mode. If a PhaseProfiler is given as profiler, each phase is
+    recorded in it.
+    """
+    global INTERACTIVE_MODE
+    INTERACTIVE_MODE = interactive
+    with profiling(profiler):
+        return run_main(asmfile, out_format, stream, verbosity, max_trace_chars, container, optimise, raw_data)
+
+
+def profile_main(asmfile: str, out_format: str, **options) -> PhaseProfiler:
+    """
+    Assemble asmfile with main() while profiling it, as --profile does. The phases are timed in this run, and their
+    memory is measured by tracing a second run with nothing output.
+    """
+    profiler = PhaseProfiler()
+    main(asmfile, out_format, profiler=profiler, **options)
+
+    traced = PhaseProfiler(trace_memory=True)
+    with open(os.devnull, "wt") as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+        main(asmfile, None, profiler=traced, **options)
+    profiler.add_peaks(traced)
+    return profiler
+
+
+def run_main(asmfile: str, out_format: str, stream, verbosity, max_trace_chars, container, optimise, raw_data):
+    """The body of main(), once the mode and profiler are set up."""
+    global EVENTS
 
     if INTERACTIVE_MODE:
-        print("end", json.dumps(list(bytecode)))
+        with open(asmfile, "rt") as file:
+            text = file.read()
+
+        EVENTS = EventTrace(open(TRACE_PATH, "w"), verbosity, max_trace_chars)
+        try:
+            layout_and_encode(*contextualise_text(text))
+        finally:
+            EVENTS.close()
         return
+    elif out_format == "return":
+        # Nothing is shown, so there is no need for the printed stages in between. The encoder's own buffer is
+        # returned, as copying it would double the memory needed for a large image.
+        with open(asmfile, "rt") as file:
+            return assemble_buffer(file, container, optimise, raw_data, PROFILER)[0]
+
+    if stream or container:
+        # 1-3. NORMALISE, SPLIT AND CONTEXTUALISE LINE BY LINE
+        with open(asmfile, "rt") as file:
+            config_dict, instruction_list = contextualise_lines(file, as_table=True)
+    else:
+        with open(asmfile, "rt") as file:
+            text = file.read()
+
+        # Now the text is available
+        config_dict, instruction_list = contextualise_text(text)
+
+    if optimise:
+        with profile_phase("optimise"):
+            instruction_list, hits = optimise_instructions(instruction_list)
+        print(describe_peephole_hits(hits), file=sys.stderr)
+
+    bytecode, _ = layout_and_encode(config_dict, instruction_list, container, raw_data)
 
     # Output it as the user wanted
     if out_format == "hex":
         print_bytes_as_hex(bytecode, 16)
     elif out_format == "binstr":
-        print(bytecode)
+        print(bytes(bytecode))
     elif out_format == "return":    # This one is for if the assembler.py module is loaded by another python file
         return bytecode
     elif out_format == "file":
@@ -1057,20 +2419,43 @@ def main(asmfile: str, out_format: str, interactive=False):
 
 if __name__ == "__main__":
     # Interpret the information from the command line arguments
-    import sys
-
-    if len(sys.argv) > 1:
-        if sys.argv[1].lower() == "<ask>":
+    from argparse import ArgumentParser
+
+    arg_parser = ArgumentParser(description="Assemble a file into bytecode")
+    arg_parser.add_argument("file", nargs="?", help="the assembly file, or <ask> to be asked for it")
+    arg_parser.add_argument("out_format", nargs="?", help="hex, binstr or file")
+    arg_parser.add_argument("--stream", action="store_true", help="read the file one line at a time")
+    arg_parser.add_argument("--container", action="store_true",
+                            help="output a v2 container with symbol and line tables")
+    arg_parser.add_argument("-O", dest="optimise", action="store_true", help="apply the peephole optimisations")
+    arg_parser.add_argument("--raw-data", action="store_true",
+                            help="set the variables with a data image after the code instead of MOVs")
+    arg_parser.add_argument("--profile", nargs="?", const="-", metavar="PATH",
+                            help="write the time and memory each phase took as JSON to PATH (or stderr)")
+    args = arg_parser.parse_intermixed_args()
+
+    if args.file is not None:
+        if args.file.lower() == "<ask>":
             file = input("Input file: ")
         else:
-            file = sys.argv[1]
+            file = args.file
 
         # Determine the output format
-        if len(sys.argv) > 2:
-            out_format = sys.argv[2]
+        if args.out_format is not None:
+            out_format = args.out_format
         else:
             out_format = input("What output format (hex, binstr or file)? ")
 
-        main(file, out_format)
+        options = {"stream": args.stream, "container": args.container, "optimise": args.optimise,
+                   "raw_data": args.raw_data}
+        if args.profile is None:
+            main(file, out_format, **options)
+        else:
+            profiler = profile_main(file, out_format, **options)
+            if args.profile == "-":
+                print(profiler.to_json(), file=sys.stderr)
+            else:
+                with open(args.profile, "wt") as profile_file:
+                    profile_file.write(profiler.to_json())
     else:
         print("Assembly file is unspecified")
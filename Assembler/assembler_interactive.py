@@ -5,14 +5,22 @@ This is the file that gets called when the GUI is running and wants a commentary
 import assembler
 
 if __name__ == "__main__":
-    import sys
+    from argparse import ArgumentParser
 
-    if len(sys.argv) > 1:
-        if sys.argv[1].lower() == "<ask>":
+    arg_parser = ArgumentParser(description="Assemble a file, writing a commentary for the GUI")
+    arg_parser.add_argument("file", nargs="?", help="the assembly file, or <ask> to be asked for it")
+    arg_parser.add_argument("--verbosity", type=int, default=assembler.VERBOSITY_BYTES,
+                            help="0 for just the stages, 1 to add each line, 2 to add each instruction's bytes")
+    arg_parser.add_argument("--max-trace-chars", type=int, default=assembler.DEFAULT_TRACE_LIMIT,
+                            help="stop writing the commentary once it reaches this size")
+    args = arg_parser.parse_args()
+
+    if args.file is not None:
+        if args.file.lower() == "<ask>":
             file = input("Input file: ")
         else:
-            file = sys.argv[1]
+            file = args.file
 
-        assembler.main(file, "", interactive=True)
+        assembler.main(file, "", interactive=True, verbosity=args.verbosity, max_trace_chars=args.max_trace_chars)
     else:
-        print("Assembly file is unspecified")
\ No newline at end of file
+        print("Assembly file is unspecified")
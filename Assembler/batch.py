@@ -0,0 +1,119 @@
+"""
+Assembles many files at once by spreading them over a pool of worker processes. Each worker imports the assembler
+once and then works through as many files as it is given, so the cost of starting Python is paid once per worker
+rather than once per file.
+Run from the command line as
+python batch.py [-j WORKERS] [--out-dir DIR] [--cache-dir DIR] file1.asm file2.asm ...
+"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import os
+import sys
+import time
+
+from assembler import AssemblyError, assemble_file
+from cache import AssemblyCache
+
+# The outcome for one file. Exactly one of bytecode (with symbols) and error is set. source_size is the size of the
+# file in bytes, and cached is set if the bytecode came from the cache.
+BatchResult = namedtuple("BatchResult", ["path", "bytecode", "symbols", "error", "source_size", "cached"])
+
+# The outcome of a whole batch. results are in the same order as the paths given.
+BatchReport = namedtuple("BatchReport", ["results", "seconds", "bytes_in", "bytes_out"])
+
+# How many paths are sent to a worker at a time
+CHUNK_SIZE = 16
+
+# The AssemblyCache each process uses for each cache directory
+_caches = {}
+
+
+def assemble_path(path: str, cache_dir: str = None) -> BatchResult:
+    """Assemble one file (using the cache in cache_dir, if given), returning any failure instead of raising it."""
+    try:
+        source_size = os.path.getsize(path)
+        if cache_dir is None:
+            assembled = assemble_file(path)
+            cached = False
+        else:
+            if cache_dir not in _caches:
+                _caches[cache_dir] = AssemblyCache(cache_dir)
+            cache = _caches[cache_dir]
+            hits = cache.hits
+            assembled = cache.assemble_file(path)
+            cached = cache.hits > hits
+    except AssemblyError as e:
+        return BatchResult(path, None, None, e, 0, False)
+    except Exception as e:
+        # Plenty of mistakes in a file are only caught as a KeyError or ValueError, so put them in the same form
+        return BatchResult(path, None, None, AssemblyError(-1, "{}: {}".format(type(e).__name__, e)), 0, False)
+    return BatchResult(path, assembled.bytecode, assembled.symbols, None, source_size, cached)
+
+
+def assemble_many(paths, workers: int = None, executor=None, cache_dir: str = None) -> BatchReport:
+    """
+    Assemble every file in paths. The work is spread over workers processes (as many as there are CPUs if it is
+    None); with workers=1 everything is done in this process. An existing executor can be passed in so that its warm
+    workers are reused between batches; it is left running afterwards. If cache_dir is given, unchanged files are
+    taken from the AssemblyCache there.
+    """
+    paths = list(paths)
+    start = time.perf_counter()
+    job = partial(assemble_path, cache_dir=cache_dir)
+
+    if executor is not None:
+        results = list(executor.map(job, paths, chunksize=CHUNK_SIZE))
+    elif workers == 1 or len(paths) <= 1:
+        results = [job(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(job, paths, chunksize=CHUNK_SIZE))
+
+    seconds = time.perf_counter() - start
+    bytes_in = sum(result.source_size for result in results)
+    bytes_out = sum(len(result.bytecode) for result in results if result.error is None)
+    return BatchReport(results, seconds, bytes_in, bytes_out)
+
+
+def describe_throughput(report: BatchReport) -> str:
+    """A one-line summary of how many files were assembled, and how fast."""
+    failed = sum(1 for result in report.results if result.error is not None)
+    cached = sum(1 for result in report.results if result.cached)
+    seconds = max(report.seconds, 1e-9)
+    return "Assembled {} files ({} failed, {} cached) in {:.3f}s: " \
+           "{:.1f} files/s, {:.1f} KB/s in, {:.1f} KB/s out".format(
+               len(report.results), failed, cached, report.seconds, len(report.results) / seconds,
+               report.bytes_in / seconds / 1024, report.bytes_out / seconds / 1024)
+
+
+def main(paths: list, workers: int = None, out_dir: str = None, cache_dir: str = None) -> int:
+    """Assemble paths, writing each to out_dir (if given) as a .bin file. Returns the number of failures."""
+    report = assemble_many(paths, workers, cache_dir=cache_dir)
+
+    failures = 0
+    for result in report.results:
+        if result.error is not None:
+            failures += 1
+            print("{}: {}".format(result.path, result.error), file=sys.stderr)
+        elif out_dir is not None:
+            name = os.path.splitext(os.path.basename(result.path))[0] + ".bin"
+            with open(os.path.join(out_dir, name), "wb") as file:
+                file.write(result.bytecode)
+
+    print(describe_throughput(report))
+    return failures
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    arg_parser = ArgumentParser(description="Assemble many files using a pool of worker processes")
+    arg_parser.add_argument("files", nargs="+", help="the assembly files")
+    arg_parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes")
+    arg_parser.add_argument("--out-dir", help="directory to write the .bin files to")
+    arg_parser.add_argument("--cache-dir", help="directory to keep a cache of assembled files in")
+    args = arg_parser.parse_args()
+
+    sys.exit(1 if main(args.files, args.workers, args.out_dir, args.cache_dir) else 0)
@@ -0,0 +1,4 @@
+"""
+Benchmarks for the assembler. These are not run by the test suite; run them from the Assembler directory, e.g.
+python -m benchmarks.bench_layout
+"""
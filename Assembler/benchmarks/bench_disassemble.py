@@ -0,0 +1,34 @@
+"""
+Benchmark for the disassembler. Assembles each kind of program from benchmarks.generators at increasing sizes, times
+decode_instructions() on the code and reports the throughput in megabytes of bytecode per second.
+"""
+
+import sys
+import time
+
+from assembler import assemble, read_image
+from benchmarks.generators import GENERATORS
+from disassemble import decode_instructions
+
+SIZES = (1000, 10000, 100000, 1000000)
+
+
+def main(sizes=SIZES):
+    print("{:<18}  {:>10}  {:>12}  {:>10}  {:>8}".format("program", "lines", "bytes", "seconds", "MB/s"))
+    for name, generator in GENERATORS.items():
+        for size in sizes:
+            code = read_image(assemble(generator(size)).bytecode).code
+
+            start = time.perf_counter()
+            decode_instructions(code)
+            t = time.perf_counter() - start
+
+            print("{:<18}  {:>10}  {:>12}  {:>10.4f}  {:>8.2f}".format(name, size, len(code), t, len(code) / t / 1e6))
+            del code
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main([int(x) for x in sys.argv[1:]])
+    else:
+        main()
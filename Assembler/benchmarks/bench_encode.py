@@ -0,0 +1,39 @@
+"""
+Benchmark for bytecode emission. Times encode_program() on synthetic programs of increasing size and reports the
+throughput in megabytes of bytecode per second.
+"""
+
+import sys
+import time
+
+from assembler import compute_layout, record_labels_and_variables, place_memory_addresses, encode_program
+from benchmarks.bench_layout import make_instruction_list, fit_exponent
+
+SIZES = (1000, 10000, 100000, 1000000)
+
+
+def main(sizes=SIZES):
+    times = []
+    print("{:>10}  {:>12}  {:>10}  {:>8}".format("instrs", "bytes", "seconds", "MB/s"))
+    for size in sizes:
+        instruction_list = make_instruction_list(size)
+        layout = compute_layout(instruction_list)
+        mem_table = record_labels_and_variables(instruction_list, layout)
+        place_memory_addresses(mem_table, instruction_list)
+
+        start = time.perf_counter()
+        bytecode = encode_program({"mem_amt": 4}, instruction_list, mem_table, layout)
+        t = time.perf_counter() - start
+        times.append(t)
+
+        print("{:>10}  {:>12}  {:>10.4f}  {:>8.2f}".format(size, len(bytecode), t, len(bytecode) / t / 1e6))
+        del instruction_list, bytecode
+
+    print("\nGrowth exponent: {:.2f}".format(fit_exponent(sizes, times)))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main([int(x) for x in sys.argv[1:]])
+    else:
+        main()
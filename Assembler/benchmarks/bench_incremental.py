@@ -0,0 +1,105 @@
+"""
+Benchmark for incremental reassembly. Each kind of program from benchmarks.generators is built once by an
+IncrementalAssembler, then edited one line at a time in the middle of the section holding most of its lines: a line is
+inserted, changed without changing its size, changed to be longer and then removed again. Each edit is timed (taking
+the best of a few runs, each from the same starting point) and checked against a full run of the assembler, and any
+edit taking longer than its program's budget is reported, with the exit status then 1.
+
+An edit which changes the size of the code moves every variable, and every label after it, so it costs time in
+proportion to the number of those and of the places referring to them, however few lines changed. The budgets (for
+programs of 100k lines, about twice what they take now) are set by that: data_heavy has a variable on nearly every
+line, and jump_dense a label on every other one.
+
+    python -m benchmarks.bench_incremental [--size LINES] [--budget MS] [--programs PROGRAM ...]
+"""
+
+from argparse import ArgumentParser
+import math
+import sys
+import time
+
+from assembler import assemble
+from benchmarks.generators import GENERATORS
+from incremental import IncrementalAssembler
+
+DEFAULT_SIZE = 100000
+REPEATS = 3
+
+# The most milliseconds any one edit of each program can take at DEFAULT_SIZE lines
+BUDGETS_MS = {"straight_line": 10.0, "jump_dense": 50.0, "data_heavy": 100.0, "arithmetic_forms": 10.0}
+
+# The line each edit leaves in the middle of the program, or None once it has been removed. The text section gets
+# an instruction and the data section a variable.
+EDITS = {
+    "text": (("insert", "ADD int eax 1"), ("same_size", "ADD int eax 2"), ("resize", "ADD int eax 70000"),
+             ("delete", None)),
+    "data": (("insert", "inserted VAR int 1"), ("same_size", "inserted VAR int 2"),
+             ("resize", "inserted VAR int 70000"), ("delete", None)),
+}
+
+
+def edited_versions(text: str):
+    """Yield (edit name, text) for each of the EDITS in turn, in the middle of the section with the most lines."""
+    lines = text.split("\n")
+    data = lines.index("section.data")
+    code = lines.index("section.text")
+    section = "data" if code - data > len(lines) - code else "text"
+    middle = (data + code) // 2 if section == "data" else (code + len(lines)) // 2
+
+    for name, line in EDITS[section]:
+        yield name, "\n".join(lines[:middle] + ([] if line is None else [line]) + lines[middle:])
+
+
+def time_edits(text: str, repeats: int = REPEATS) -> (float, dict):
+    """The time of a full build of text, and of each edit after it (the best of repeats), in seconds."""
+    assembler = IncrementalAssembler()
+    start = time.perf_counter()
+    assembler.assemble(text)
+    full_time = time.perf_counter() - start
+
+    edit_times = {}
+    previous = text
+    for name, version in edited_versions(text):
+        best = math.inf
+        for _ in range(repeats):
+            assembler.assemble(previous)
+            start = time.perf_counter()
+            bytecode = assembler.assemble(version)
+            best = min(best, time.perf_counter() - start)
+        if assembler.last_full_rebuild or bytecode != assemble(version).bytecode:
+            raise AssertionError("The {} edit wasn't reassembled incrementally to the right bytes".format(name))
+        edit_times[name] = best
+        previous = version
+    return full_time, edit_times
+
+
+def main(size: int = DEFAULT_SIZE, budget_ms: float = None, programs=tuple(GENERATORS)) -> list:
+    """
+    Time every program at size lines, returning every (program, edit, milliseconds, budget) over the budget, which is
+    budget_ms if given and the program's own budget from BUDGETS_MS otherwise.
+    """
+    failures = []
+    print("{:<18}  {:>8}  {}".format("program", "full ms",
+                                     "  ".join("{:>9}".format(name) for name, _ in EDITS["text"])))
+    for program in programs:
+        full_time, edit_times = time_edits(GENERATORS[program](size))
+        print("{:<18}  {:>8.1f}  {}".format(program, full_time * 1000,
+                                            "  ".join("{:>9.2f}".format(t * 1000) for t in edit_times.values())))
+        budget = BUDGETS_MS[program] if budget_ms is None else budget_ms
+        failures += [(program, name, t * 1000, budget) for name, t in edit_times.items() if t * 1000 > budget]
+
+    for program, name, ms, budget in failures:
+        print("FAIL: the {} edit of {} took {:.2f}ms, over the budget of {}ms".format(name, program, ms, budget))
+    return failures
+
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser(description="Time one-line edits with the incremental assembler")
+    arg_parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="the number of lines in each program")
+    arg_parser.add_argument("--budget", type=float, help="the most milliseconds an edit of any program can take, "
+                                                         "instead of each program's own budget")
+    arg_parser.add_argument("--programs", nargs="+", choices=sorted(GENERATORS), default=list(GENERATORS),
+                            help="the kinds of program to generate")
+    args = arg_parser.parse_args()
+
+    sys.exit(1 if main(args.size, args.budget, args.programs) else 0)
@@ -0,0 +1,73 @@
+"""
+Benchmark for the layout pass (record_labels_and_variables). Times the pass on synthetic instruction lists of
+increasing size and estimates how the time grows with the number of instructions. A growth exponent near 1 means the
+pass scales linearly.
+"""
+
+import math
+import sys
+import time
+
+from assembler import DataInstruction, TextInstruction, RegisterOperand, ImmediateOperand, AddressOperand, \
+    record_labels_and_variables
+
+SIZES = (1000, 10000, 100000, 1000000)
+
+
+def make_instruction_list(size: int, label_every: int = 4, var_every: int = 50) -> list:
+    """Make a list of roughly size instructions, with a label every few instructions and some variables."""
+    eax = RegisterOperand("eax")
+    five = ImmediateOperand("5")
+
+    num_vars = max(1, size // var_every)
+    instruction_list = [DataInstruction(i, "v{}".format(i), "5", "int") for i in range(num_vars)]
+
+    for i in range(num_vars, size):
+        if i % label_every == 0:
+            instruction_list.append(TextInstruction(i, "JMP", "", AddressOperand("l{}".format(i)), None,
+                                                    "l{}".format(i)))
+        else:
+            instruction_list.append(TextInstruction(i, "ADD", "int", eax, five))
+
+    return instruction_list
+
+
+def time_layout(instruction_list: list, repeats: int = 3) -> float:
+    """Best-of-n time for the layout pass."""
+    best = math.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        record_labels_and_variables(instruction_list)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def fit_exponent(sizes, times) -> float:
+    """Least squares fit of log(time) against log(size). The gradient is the growth exponent."""
+    xs = [math.log(x) for x in sizes]
+    ys = [math.log(y) for y in times]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    num = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    den = sum((x - mean_x) ** 2 for x in xs)
+    return num / den
+
+
+def main(sizes=SIZES):
+    times = []
+    print("{:>10}  {:>12}  {:>14}".format("instrs", "seconds", "us per instr"))
+    for size in sizes:
+        instruction_list = make_instruction_list(size)
+        t = time_layout(instruction_list)
+        times.append(t)
+        print("{:>10}  {:>12.4f}  {:>14.3f}".format(size, t, t / size * 1e6))
+        del instruction_list
+
+    print("\nGrowth exponent: {:.2f}".format(fit_exponent(sizes, times)))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main([int(x) for x in sys.argv[1:]])
+    else:
+        main()
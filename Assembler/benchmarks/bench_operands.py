@@ -0,0 +1,78 @@
+"""
+Micro-benchmark for operand interpretation. Times interpret_operand() over a million operands, and compares it with
+the previous approach (a cascade of int()/float() attempts and up to five uncompiled regex searches), which is kept
+here as a reference.
+"""
+
+import re
+import sys
+import time
+
+from assembler import REGISTERS, classify_operand, interpret_operand
+
+# A mix of operands like those the compiler emits
+OPERANDS = ("esp", "[esp]", "4", "ecx", "[esi]", "eax", "-100", "2.5", "loop", "[eax*4]", "[ebp+4]",
+            "[eax*ebx+4]", "[ebp+ecx*4]", "temp", "65536", "out")
+
+LEGACY_TYPES = (
+    (10, r"^(?P<a>[a-zA-Z0-9]+)\+(?P<b>[a-zA-Z0-9]+)\*(?P<c>[a-zA-Z0-9]+)$"),
+    (9, r"^(?P<a>[a-zA-Z0-9]+)\*(?P<b>[a-zA-Z0-9]+)\+(?P<c>[a-zA-Z0-9]+)$"),
+    (8, r"^(?P<a>[a-zA-Z0-9]+)\+(?P<b>[a-zA-Z0-9]+)$"),
+    (7, r"^(?P<a>[a-zA-Z0-9]+)\*(?P<b>[a-zA-Z0-9]+)$"),
+    (6, r"^(?P<a>[a-zA-Z0-9]+)$")
+)
+
+
+def legacy_classify_arithmetic(asm_str: str):
+    """The old ArithmeticOperand parsing: search each pattern in turn, then match the winner again."""
+    for designation, pattern in LEGACY_TYPES:
+        if re.search(pattern, asm_str) is not None:
+            m = re.match(pattern, asm_str)
+            return designation, m.group("a"), m.groupdict().get("b"), m.groupdict().get("c")
+    raise ValueError(asm_str)
+
+
+def legacy_interpret_operand(string: str):
+    """The old interpret_operand() classification, returning the kind and parts rather than an object."""
+    string = string.strip()
+    if string.lower() in REGISTERS.keys():
+        return "register", string.lower()
+    try:
+        return "immediate", int(string)
+    except ValueError:
+        try:
+            return "immediate", float(string)
+        except ValueError:
+            pass
+    if string.isidentifier():
+        return "address", string
+    if string[0] == "[" and string[-1] == "]":
+        return "arithmetic", legacy_classify_arithmetic(string[1: -1])
+    raise ValueError(string)
+
+
+def time_function(function, operands) -> float:
+    start = time.perf_counter()
+    for operand in operands:
+        function(operand)
+    return time.perf_counter() - start
+
+
+def main(count=1000000):
+    operands = [OPERANDS[i % len(OPERANDS)] for i in range(count)]
+
+    legacy = time_function(legacy_interpret_operand, operands)
+    current = time_function(classify_operand, operands)
+    objects = time_function(interpret_operand, operands)
+
+    print("Classifying {} operands".format(count))
+    print("    legacy cascade       {:8.3f} s".format(legacy))
+    print("    classify_operand()   {:8.3f} s  ({:.2f}x faster)".format(current, legacy / current))
+    print("    interpret_operand()  {:8.3f} s  (including building the operand objects)".format(objects))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
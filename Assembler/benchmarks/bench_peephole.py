@@ -0,0 +1,47 @@
+"""
+Measures what the peephole optimiser (-O) saves. For each program, prints the number of instructions and the size of
+the bytecode with and without it, and how often each rule was used. With no arguments, the test program and the
+compiler's sample output are used.
+"""
+
+import glob
+import os
+import sys
+
+from assembler import assemble_file, contextualise_lines, optimise_instructions
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FILES = [os.path.join(HERE, "..", "testing", "fibonacci.asm")] + \
+    sorted(glob.glob(os.path.join(HERE, "..", "..", "Compiler", "testing", "outputs", "*.asm")))
+
+
+def measure(path: str):
+    """(instructions before, after, bytes before, after, rule hits) for the program at path."""
+    with open(path, "rt") as file:
+        _, instruction_list = contextualise_lines(file)
+    optimised, hits = optimise_instructions(instruction_list)
+    size = len(assemble_file(path).bytecode)
+    optimised_size = len(assemble_file(path, optimise=True).bytecode)
+    return len(instruction_list), len(optimised), size, optimised_size, hits
+
+
+def main(paths=DEFAULT_FILES):
+    print("{:<28}  {:>13}  {:>13}  {}".format("file", "instrs", "bytes", "rules used"))
+    for path in paths:
+        name = os.path.basename(path)
+        try:
+            before, after, size, optimised_size, hits = measure(path)
+        except Exception as e:
+            print("{:<28}  failed to assemble: {}".format(name, e))
+            continue
+
+        used = ", ".join("{} {}".format(rule, count) for rule, count in hits.items() if count)
+        print("{:<28}  {:>5} -> {:<5}  {:>5} -> {:<5}  {}".format(name, before, after, size, optimised_size,
+                                                                  used or "-"))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(sys.argv[1:])
+    else:
+        main()
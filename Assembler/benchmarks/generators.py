@@ -0,0 +1,82 @@
+"""
+Generators of synthetic programs for the benchmarks. Each takes the number of lines wanted (roughly; the section
+headers are extra) and some options for the shape of the program, and gives the program's text. GENERATORS has each
+of them by name.
+"""
+
+from itertools import cycle
+
+REGISTERS = ("eax", "ebx", "ecx", "edx")
+DATA_TYPES = ("char", "uchar", "short", "ushort", "int", "uint", "float")
+
+
+def program(data: list, text: list) -> str:
+    """Put the sections together, with enough memory for everything (no line takes more than 14 bytes)."""
+    memory = (len(data) + len(text)) * 14 // 1024 + 1
+    return "\n".join(["section.meta", "mem_amt={}".format(memory), "section.data"] + data + ["section.text"] + text)
+
+
+def straight_line(lines: int, variables: int = 16) -> str:
+    """Arithmetic and MOVs between registers, immediates and variables, with no jumps at all."""
+    data = ["v{} VAR int {}".format(i, i) for i in range(variables)]
+    shapes = cycle(("ADD int {r} {n}", "MOV 4B {r} v{v}", "SUB uint {r} {n}", "MUL int {r} {s}",
+                    "MOV 4B v{v} {r}", "XOR 4B {r} {s}"))
+    text = []
+    for i in range(max(0, lines - variables - 1)):
+        text.append(next(shapes).format(r=REGISTERS[i % 4], s=REGISTERS[(i + 1) % 4], n=i % 1000,
+                                        v=i % variables))
+    return program(data, text + ["HLT"])
+
+
+def jump_dense(lines: int, label_every: int = 2, span: int = 64) -> str:
+    """
+    A label every label_every lines, and jumps (of every kind) to labels up to span labels away in either
+    direction.
+    """
+    jumps = cycle(("JMP", "JE", "JNE", "JLT", "JLE", "JGT", "JGE"))
+    count = max(1, lines - 1)
+    labels = (count + label_every - 1) // label_every
+    text = []
+    for i in range(count):
+        line = "CMP int eax {}".format(i % 100) if i % 3 == 0 else \
+            "{} l{}".format(next(jumps), (i // label_every + (i % span) - span // 2) % labels)
+        if i % label_every == 0:
+            line = "l{} {}".format(i // label_every, line)
+        text.append(line)
+    return program([], text + ["HLT"])
+
+
+def data_heavy(lines: int, text_lines: int = 8, zero_every: int = 4) -> str:
+    """Mostly data section: variables of every type, with every zero_every-th one starting at zero."""
+    count = max(1, lines - text_lines)
+    data = []
+    for i in range(count):
+        dtype = DATA_TYPES[i % len(DATA_TYPES)]
+        if i % zero_every == 0:
+            value = "0"
+        elif dtype == "float":
+            value = "{}.5".format(i % 1000)
+        else:
+            value = str(i % 100)
+        data.append("d{} VAR {} {}".format(i, dtype, value))
+    text = ["MOV 4B eax d{}".format(i % count) for i in range(text_lines - 1)]
+    return program(data, text + ["HLT"])
+
+
+def arithmetic_forms(lines: int) -> str:
+    """MOVs to and from memory using every form of arithmetic operand."""
+    forms = cycle(("[{a}]", "[{a}*{k}]", "[{a}+{b}]", "[{a}*{k}+{b}]", "[{a}+{b}*{k}]"))
+    text = []
+    for i in range(max(0, lines - 1)):
+        operand = next(forms).format(a=REGISTERS[i % 4], b=REGISTERS[(i + 2) % 4], k=(1, 2, 4, 8)[i % 4])
+        text.append("MOV 4B {} {}".format(operand, REGISTERS[(i + 1) % 4]) if i % 2 else
+                    "MOV 4B {} {}".format(REGISTERS[(i + 1) % 4], operand))
+    return program([], text + ["HLT"])
+
+
+GENERATORS = {
+    "straight_line": straight_line,
+    "jump_dense": jump_dense,
+    "data_heavy": data_heavy,
+    "arithmetic_forms": arithmetic_forms
+}
@@ -0,0 +1,46 @@
+"""
+Profiles the assembly of every file given (or the test program and the compiler's sample output, if none are) and
+prints one JSON document holding the report of each, keyed by file name, for CI to keep and compare between runs.
+Files which fail to assemble are reported with their error instead.
+
+Each file is assembled as a whole text, as scaling.py does, so that normalisation, the section split and
+divide_and_contextualise are reported as phases of their own. The phases are timed in one run and their memory is
+traced in another, as tracemalloc would slow the timed run down several times over.
+"""
+
+import json
+import os
+import sys
+
+from assembler import PhaseProfiler, contextualise_text, layout_and_encode, profiling
+from benchmarks.bench_peephole import DEFAULT_FILES
+
+
+def profile_text(text: str, profiler: PhaseProfiler) -> PhaseProfiler:
+    with profiling(profiler):
+        layout_and_encode(*contextualise_text(text, show=False))
+    return profiler
+
+
+def profile_file(path: str, trace_memory=True) -> dict:
+    try:
+        with open(path, "rt") as file:
+            text = file.read()
+        profiler = profile_text(text, PhaseProfiler())
+        if trace_memory:
+            profiler.add_peaks(profile_text(text, PhaseProfiler(trace_memory=True)))
+    except Exception as e:
+        return {"error": str(e)}
+    return profiler.report()
+
+
+def main(paths=DEFAULT_FILES):
+    reports = {os.path.basename(path): profile_file(path) for path in paths}
+    print(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(sys.argv[1:])
+    else:
+        main()
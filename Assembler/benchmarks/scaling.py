@@ -0,0 +1,155 @@
+"""
+Scaling benchmark for the whole assembler. Assembles each kind of program from benchmarks.generators at sizes from a
+thousand to a million lines, timing every phase with a PhaseProfiler, and fits the growth exponent of each phase's
+time against the number of lines. A phase whose exponent is above its bound is reported, and the exit status is then
+1, so this can be run by CI. The bound is 1.3 unless told otherwise, which leaves room for the noise of a shared
+machine, with tighter bounds for layout (1.25) and encode (1.2), single passes which have fitted at 1.22 or below.
+place_memory_addresses gets 1.5: it is one dict lookup per reference, and once a million names no longer fit in the
+CPU's caches each lookup takes about twice as long, so data_heavy fits at 1.3 to 1.4 between 10^5 and 10^6 lines.
+
+Only the sizes from ten thousand lines up are fitted (unless fewer than two are being run), since at a thousand
+lines the fixed cost of each phase is most of its time, and each time is the best of three runs. Of those, only times
+of at least 10ms are fitted, as shorter ones are mostly noise, and only if they cover at least a tenfold range of
+sizes, since noise in a line through nearby points gives a wildly wrong slope. A phase without such times is reported
+as too fast to fit, and isn't checked against any bound.
+
+    python -m benchmarks.scaling --programs straight_line jump_dense --phase-bound layout=1.2 --json scaling.json
+"""
+
+from argparse import ArgumentParser
+import gc
+import json
+import sys
+
+from assembler import PhaseProfiler, assemble, contextualise_text, layout_and_encode, profiling
+from benchmarks.bench_layout import fit_exponent
+from benchmarks.generators import GENERATORS
+
+SIZES = (1000, 10000, 100000, 1000000)
+DEFAULT_BOUND = 1.3
+DEFAULT_PHASE_BOUNDS = {"layout": 1.25, "encode": 1.2, "place_memory_addresses": 1.5}
+DEFAULT_REPEATS = 3
+
+# The smallest size fitted, if at least two sizes are at least this
+MIN_FIT_SIZE = 10000
+
+# Times below this are too short to fit a line through, and are raised to it
+MIN_SECONDS = 1e-6
+
+# Times below this are left out of the fit, as they are mostly noise
+MIN_FIT_SECONDS = 0.01
+
+# The fitted times must be for sizes at least this many times apart
+MIN_FIT_RANGE = 10
+
+
+def profile_text(text: str, stream=False) -> dict:
+    """
+    The wall time of each phase of assembling text, by phase name. As with timeit, the garbage collector is turned off
+    while timing, since how long its passes take depends on everything else alive in the process.
+    """
+    profiler = PhaseProfiler(trace_memory=False)
+    gc.collect()
+    gc.disable()
+    try:
+        if stream:
+            assemble(text, profiler=profiler)
+        else:
+            # The same phases as main() goes through, without printing each stage
+            with profiling(profiler):
+                layout_and_encode(*contextualise_text(text, show=False))
+    finally:
+        gc.enable()
+    return {phase["name"]: phase["wall_seconds"] for phase in profiler.phases}
+
+
+def measure(generator, sizes, repeats: int = 1, stream=False) -> dict:
+    """Best-of-repeats times for each phase, as {phase name: [time at each size]}."""
+    times = {}
+    for size in sizes:
+        text = generator(size)
+        best = {}
+        for _ in range(repeats):
+            for name, seconds in profile_text(text, stream).items():
+                best[name] = min(seconds, best.get(name, seconds))
+        for name, seconds in best.items():
+            times.setdefault(name, []).append(max(seconds, MIN_SECONDS))
+        del text
+    return times
+
+
+def fitted_sizes(sizes) -> list:
+    """The indexes of the sizes which the exponents are fitted to."""
+    large = [i for i, size in enumerate(sizes) if size >= MIN_FIT_SIZE]
+    return large if len(large) >= 2 else list(range(len(sizes)))
+
+
+def phase_exponent(sizes, times, fitted) -> float:
+    """
+    The growth exponent fitted to the times at the fitted indexes which are at least MIN_FIT_SECONDS, or None if
+    those don't cover a range of MIN_FIT_RANGE in size.
+    """
+    points = [(sizes[i], times[i]) for i in fitted if times[i] >= MIN_FIT_SECONDS]
+    if not points or max(points)[0] < min(points)[0] * MIN_FIT_RANGE:
+        return None
+    return fit_exponent(*zip(*points))
+
+
+def check_bounds(results: dict, bound: float, phase_bounds: dict) -> list:
+    """Every (program, phase, exponent, bound) where the exponent is above its bound. Unfitted phases are passed."""
+    failures = []
+    for program, phases in results.items():
+        for name, result in phases.items():
+            limit = phase_bounds.get(name, bound)
+            if result["exponent"] is not None and result["exponent"] > limit:
+                failures.append((program, name, result["exponent"], limit))
+    return failures
+
+
+def main(sizes=SIZES, programs=tuple(GENERATORS), repeats: int = DEFAULT_REPEATS, bound: float = DEFAULT_BOUND,
+         phase_bounds: dict = None, stream=False) -> (dict, list):
+    phase_bounds = dict(DEFAULT_PHASE_BOUNDS, **(phase_bounds or {}))
+    fitted = fitted_sizes(sizes)
+    results = {}
+    for program in programs:
+        times = measure(GENERATORS[program], sizes, repeats, stream)
+        results[program] = {}
+        for name, phase_times in times.items():
+            results[program][name] = {"seconds": phase_times,
+                                      "exponent": phase_exponent(sizes, phase_times, fitted)}
+
+        print("\n{} ({})".format(program, ", ".join(map(str, sizes))))
+        print("{:>30}  {}  {:>8}".format("phase", "  ".join("{:>10}".format("seconds") for _ in sizes), "exponent"))
+        for name, result in results[program].items():
+            exponent = "too fast to fit" if result["exponent"] is None else "{:>8.2f}".format(result["exponent"])
+            print("{:>30}  {}  {}".format(name, "  ".join("{:>10.4f}".format(t) for t in result["seconds"]), exponent))
+
+    failures = check_bounds(results, bound, phase_bounds)
+    for program, name, exponent, limit in failures:
+        print("FAIL: {} grows as lines^{:.2f} in {}, above the bound of {}".format(name, exponent, program, limit))
+    return results, failures
+
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser(description="Time each phase of the assembler at increasing program sizes")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="the numbers of lines to try")
+    arg_parser.add_argument("--max-size", type=int, help="leave out the sizes above this")
+    arg_parser.add_argument("--programs", nargs="+", choices=sorted(GENERATORS), default=list(GENERATORS),
+                            help="the kinds of program to generate")
+    arg_parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="take the best of this many runs")
+    arg_parser.add_argument("--bound", type=float, default=DEFAULT_BOUND,
+                            help="the highest growth exponent allowed for any phase")
+    arg_parser.add_argument("--phase-bound", action="append", default=[], metavar="PHASE=BOUND",
+                            help="a different bound for one phase, replacing any default one")
+    arg_parser.add_argument("--stream", action="store_true", help="assemble line by line, as assemble() does")
+    arg_parser.add_argument("--json", metavar="PATH", help="also write the results to PATH as JSON")
+    args = arg_parser.parse_args()
+
+    sizes = [size for size in args.sizes if args.max_size is None or size <= args.max_size]
+    phase_bounds = {name: float(value) for name, value in (item.split("=") for item in args.phase_bound)}
+    results, failures = main(sizes, args.programs, args.repeats, args.bound, phase_bounds, args.stream)
+
+    if args.json is not None:
+        with open(args.json, "wt") as file:
+            json.dump({"sizes": sizes, "results": results, "failures": failures}, file, indent=2)
+    sys.exit(1 if failures else 0)
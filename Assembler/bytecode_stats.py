@@ -0,0 +1,221 @@
+"""
+Static statistics of bytecode, to see what compiled programs are made of: how often each opcode and each kind of
+operand is used, how big the immediates are, how many of the instructions are jumps and how long an instruction is on
+average. Images (in either format) are decoded by the disassembler's decode loop, which only has to find where each
+instruction starts; the opcode, operand byte and length of every instruction are then gathered from the code with
+those offsets, and all of the histograms are counted from the gathered arrays in bulk.
+
+NumPy is used for the arrays and histograms if it is installed. Without it the same counts are made with the standard
+library, only more slowly.
+
+A directory is searched for .bin files, so a whole build can be looked at in one run, spread over a pool of worker
+processes as batch.py does. The totals and the statistics of each file can be written as JSON and as CSV, with one
+row for each (file, table, key), so that the output for two versions of the compiler can be compared.
+Run from the command line as
+python bytecode_stats.py [-j WORKERS] [--json PATH] [--csv PATH] file_or_directory ...
+"""
+
+from array import array
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import json
+import os
+import sys
+
+from assembler import OPCODES, read_image
+from cfg import JUMPS
+from disassemble import ARITHMETIC_FORMATS, OPCODE_TABLE, OPERAND_LENGTHS, instruction_code, iter_code
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The name of each opcode, as the assembler's table has it
+OPCODE_NAMES = {value: name for name, value in OPCODES.items()}
+
+# The opcodes of every jump
+JUMP_OPCODES = tuple(opcode for opcode, info in enumerate(OPCODE_TABLE) if info is not None and info.mnemonic in JUMPS)
+
+# The name of each kind of operand, by its number in the operand byte. Kind 0 is no operand, and isn't counted.
+KIND_NAMES = ("none", "register", "imm8", "imm16", "imm32", "address") + \
+    tuple(ARITHMETIC_FORMATS[kind].format("a", "b", "c") for kind in sorted(ARITHMETIC_FORMATS))
+
+# The kinds of immediate operand, and the size of each
+IMMEDIATE_KINDS = (2, 3, 4)
+
+# The number of bins in each histogram: every byte value, every nibble and every length an instruction can have
+OPCODE_BINS = 256
+KIND_BINS = 16
+LENGTH_BINS = 2 + 2 * max(OPERAND_LENGTHS) + 1
+
+# How many paths are sent to a worker at a time
+CHUNK_SIZE = 16
+
+# The histograms of one image (or of many added together), as lists of ints. lengths[n] is the number of instructions
+# n bytes long, and kinds counts the first and second operands together.
+Counts = namedtuple("Counts", ["code_bytes", "opcodes", "kinds", "lengths"])
+
+# The outcome for one file. Exactly one of counts and error is set.
+StatsResult = namedtuple("StatsResult", ["path", "counts", "error"])
+
+
+def instruction_starts(code) -> array:
+    """The offset of every instruction in code, found by the disassembler's decode loop."""
+    return array("I", (raw.start_byte for raw in iter_code(code)))
+
+
+def count_code(code) -> Counts:
+    """The histograms of the instructions in code."""
+    starts = instruction_starts(code)
+    if numpy is not None:
+        code = numpy.frombuffer(code, numpy.uint8)
+        starts = numpy.frombuffer(starts, numpy.uint32).astype(numpy.intp)
+        operands = code[starts + 1]
+        kinds = numpy.concatenate((operands >> 4, operands & 0x0F))
+        lengths = numpy.diff(starts, append=len(code))
+        return Counts(len(code), numpy.bincount(code[starts], minlength=OPCODE_BINS).tolist(),
+                      numpy.bincount(kinds, minlength=KIND_BINS).tolist(),
+                      numpy.bincount(lengths, minlength=LENGTH_BINS).tolist())
+
+    code = memoryview(code)
+    operands = bytes(code[start + 1] for start in starts)
+    kinds = bytes(operand >> 4 for operand in operands) + bytes(operand & 0x0F for operand in operands)
+    ends = starts[1:] + array("I", [len(code)])
+    return Counts(len(code), histogram(bytes(code[start] for start in starts), OPCODE_BINS),
+                  histogram(kinds, KIND_BINS), histogram([end - start for start, end in zip(starts, ends)], LENGTH_BINS))
+
+
+def histogram(values, bins: int) -> list:
+    """How many times each of 0 to bins - 1 is in values, without NumPy."""
+    counter = Counter(values)
+    return [counter[value] for value in range(bins)]
+
+
+def count_image(bytecode) -> Counts:
+    """The histograms of the instructions in bytecode (in either format). Raw data after the code isn't counted."""
+    return count_code(instruction_code(read_image(bytecode)))
+
+
+def count_path(path: str) -> StatsResult:
+    """The histograms of one file, returning any failure instead of raising it."""
+    try:
+        with open(path, "rb") as file:
+            counts = count_image(file.read())
+    except Exception as e:
+        return StatsResult(path, None, "{}: {}".format(type(e).__name__, e))
+    return StatsResult(path, counts, None)
+
+
+def add_counts(counts: list) -> Counts:
+    """All of counts added together, bin by bin."""
+    if not counts:
+        return Counts(0, [0] * OPCODE_BINS, [0] * KIND_BINS, [0] * LENGTH_BINS)
+    if numpy is not None:
+        return Counts(*(numpy.sum(numpy.array(column, dtype=numpy.int64), axis=0).tolist()
+                        for column in zip(*counts)))
+    return Counts(sum(c.code_bytes for c in counts),
+                  *([sum(column) for column in zip(*histograms)] for histograms in list(zip(*counts))[1:]))
+
+
+def summarise(counts: Counts) -> dict:
+    """The statistics shown for some Counts, with every histogram keyed by name and empty bins left out."""
+    instructions = sum(counts.opcodes)
+    jumps = sum(counts.opcodes[opcode] for opcode in JUMP_OPCODES)
+    return {
+        "instructions": instructions,
+        "code_bytes": counts.code_bytes,
+        "average_length": counts.code_bytes / instructions if instructions else 0.0,
+        "jump_density": jumps / instructions if instructions else 0.0,
+        "opcodes": {OPCODE_NAMES.get(opcode, hex(opcode)): n for opcode, n in enumerate(counts.opcodes) if n},
+        "operand_kinds": {KIND_NAMES[kind]: counts.kinds[kind] for kind in range(1, len(KIND_NAMES))
+                          if counts.kinds[kind]},
+        "immediate_sizes": {str(OPERAND_LENGTHS[kind]): counts.kinds[kind] for kind in IMMEDIATE_KINDS},
+        "lengths": {str(length): n for length, n in enumerate(counts.lengths) if n},
+    }
+
+
+def find_images(paths) -> list:
+    """paths, with each directory replaced by the .bin files anywhere under it, in order."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, subdirectories, files in os.walk(path):
+                subdirectories.sort()
+                found.extend(os.path.join(directory, name) for name in sorted(files) if name.endswith(".bin"))
+        else:
+            found.append(path)
+    return found
+
+
+def collect(paths, workers: int = None) -> list:
+    """
+    The StatsResult of every file in paths (after directories are searched), in order. The work is spread over
+    workers processes (as many as there are CPUs if it is None); with workers=1 everything is done in this process.
+    """
+    paths = find_images(paths)
+    if workers == 1 or len(paths) <= 1:
+        return [count_path(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(count_path, paths, chunksize=CHUNK_SIZE))
+
+
+def report(results: list) -> dict:
+    """The totals of results and the statistics of each file, ready to be written as JSON."""
+    counted = [result for result in results if result.error is None]
+    return {
+        "total": dict(summarise(add_counts([result.counts for result in counted])), files=len(counted)),
+        "files": {result.path: summarise(result.counts) for result in counted},
+        "errors": {result.path: result.error for result in results if result.error is not None},
+    }
+
+
+def csv_rows(stats: dict):
+    """The rows of the CSV form of a report(): path, table, key, value. The totals have the path "TOTAL"."""
+    yield "path", "table", "key", "value"
+    for path, summary in [("TOTAL", stats["total"])] + list(stats["files"].items()):
+        for key, value in summary.items():
+            if isinstance(value, dict):
+                for name, n in value.items():
+                    yield path, key, name, n
+            else:
+                yield path, "summary", key, value
+
+
+def main(paths: list, workers: int = None, json_path: str = None, csv_path: str = None) -> int:
+    """Print the totals of every file in paths, writing everything to json_path and csv_path if given."""
+    results = collect(paths, workers)
+    stats = report(results)
+
+    for path, error in stats["errors"].items():
+        print("{}: {}".format(path, error), file=sys.stderr)
+    total = stats["total"]
+    print("{} files, {} instructions in {} bytes: {:.2f} bytes per instruction, {:.1%} jumps".format(
+        total["files"], total["instructions"], total["code_bytes"], total["average_length"], total["jump_density"]))
+    for title, key in (("opcode", "opcodes"), ("operand kind", "operand_kinds"), ("immediate size", "immediate_sizes")):
+        print("\n{:<16}  {:>12}  {:>7}".format(title, "count", "share"))
+        whole = max(sum(total[key].values()), 1)
+        for name, n in sorted(total[key].items(), key=lambda item: -item[1]):
+            print("{:<16}  {:>12}  {:>7.1%}".format(name, n, n / whole))
+
+    if json_path is not None:
+        with open(json_path, "wt") as file:
+            json.dump(stats, file, indent=2)
+    if csv_path is not None:
+        with open(csv_path, "wt", newline="") as file:
+            csv.writer(file).writerows(csv_rows(stats))
+    return len(stats["errors"])
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    arg_parser = ArgumentParser(description="Count what some bytecode is made of")
+    arg_parser.add_argument("paths", nargs="+", help="the bytecode files, or directories of .bin files")
+    arg_parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes")
+    arg_parser.add_argument("--json", metavar="PATH", help="write the statistics to PATH as JSON")
+    arg_parser.add_argument("--csv", metavar="PATH", help="write the statistics to PATH as CSV")
+    args = arg_parser.parse_args()
+
+    sys.exit(1 if main(args.paths, args.workers, args.json, args.csv) else 0)
@@ -0,0 +1,140 @@
+"""
+An on-disk cache of assembled programs, so that sources which haven't changed since the last build don't have to be
+assembled again. Entries are keyed by a hash of the normalised source (so changes to comments and spacing don't
+count), ASSEMBLER_VERSION and META_CONFIG_DEFAULT, and each one holds the bytecode and memory table.
+Several builds can share a cache directory at once: every entry is written to a temporary file and then renamed into
+place, so a reader only ever sees a whole entry. Once the cache grows beyond its size limit the least recently used
+entries are deleted.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import tempfile
+
+from assembler import ASSEMBLER_VERSION, META_CONFIG_DEFAULT, U32, Assembled, assemble, normalise_line
+
+# The default limit on the total size of the cache directory
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Added to the end of every entry's file name
+ENTRY_SUFFIX = ".asmcache"
+
+
+def cache_key(lines) -> str:
+    """The key for a program, given its lines. Lines which normalise to the same text give the same key."""
+    digest = hashlib.sha256()
+    digest.update(ASSEMBLER_VERSION.encode())
+    digest.update(json.dumps(META_CONFIG_DEFAULT, sort_keys=True).encode())
+    for line in lines:
+        line = normalise_line(line)
+        if line:
+            digest.update(b"\n" + line.encode())
+    return digest.hexdigest()
+
+
+def encode_entry(assembled: Assembled) -> bytes:
+    """An entry is the length of a JSON header, the header (holding the symbols and config) and then the bytecode."""
+    header = json.dumps({"symbols": assembled.symbols, "config": assembled.config}).encode()
+    return U32.pack(len(header)) + header + assembled.bytecode
+
+
+def decode_entry(entry: bytes) -> Assembled:
+    header_length, = U32.unpack_from(entry, 0)
+    header = json.loads(entry[4: 4 + header_length].decode())
+    return Assembled(entry[4 + header_length:], header["symbols"], header["config"])
+
+
+class AssemblyCache:
+    """
+    A cache of assembled programs kept in directory, which is created if needed. hits, misses and evictions count
+    what this object has done (not other processes using the same directory).
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # An estimate of the size of the directory, so that it only has to be looked through when it might be full
+        self._size = sum(size for _, size, _ in self._entries())
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key: str) -> Assembled:
+        """The cached program with this key, or None if there isn't one."""
+        path = self.path_for(key)
+        try:
+            with open(path, "rb") as file:
+                assembled = decode_entry(file.read())
+            os.utime(path)    # The modification time records when an entry was last used
+        except (OSError, ValueError, KeyError, struct.error):
+            # Missing, or evicted while being read, or damaged. Either way it is assembled again.
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return assembled
+
+    def put(self, key: str, assembled: Assembled):
+        """Store a program under key, then evict old entries if the cache is now too big."""
+        entry = encode_entry(assembled)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(entry)
+            os.replace(temp_path, self.path_for(key))
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+        self._size += len(entry)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def assemble(self, text: str) -> Assembled:
+        """Like assembler.assemble(), but gives back the cached result if there is one."""
+        lines = text.split("\n")
+        key = cache_key(lines)
+        assembled = self.get(key)
+        if assembled is None:
+            assembled = assemble(lines)
+            self.put(key, assembled)
+        return assembled
+
+    def assemble_file(self, path: str) -> Assembled:
+        with open(path, "rt") as file:
+            return self.assemble(file.read())
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits within max_bytes."""
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue    # Another process got there first
+            self._size -= size
+            self.evictions += 1
+
+    def _entries(self):
+        """Yields (last used time, size, path) for every entry."""
+        for dir_entry in os.scandir(self.directory):
+            if dir_entry.name.endswith(ENTRY_SUFFIX):
+                try:
+                    stat = dir_entry.stat()
+                except OSError:
+                    continue
+                yield stat.st_mtime, stat.st_size, dir_entry.path
@@ -0,0 +1,246 @@
+"""
+Control flow graphs. A program is split into basic blocks, runs of instructions which are always executed from the
+first to the last: each block starts at the start of the program, at a label or after a jump or HLT. Each block is
+linked to the blocks execution can go to after it, by falling through or by jumping. From those links, the graph
+works out which blocks can be reached at all and which blocks dominate which (a block dominates another if every way
+of getting to the other goes through it).
+
+Graphs are made from a list of FlowNodes, one per instruction. flow_nodes() makes them from a list of instructions
+(or an InstructionTable), where jumps refer to labels by name; the disassembler makes them from decoded bytecode,
+where jumps refer to addresses. graph_of() caches the graphs it builds by a hash of those nodes, so the assembler,
+the disassembler and any profiler asking about the same program share one graph. The cache only holds graphs weakly:
+a graph (and the program in it) is dropped once nothing else is using it.
+"""
+
+from bisect import bisect_right
+from collections import namedtuple
+from weakref import WeakValueDictionary
+
+CONDITIONAL_JUMPS = frozenset(("JE", "JNE", "JLT", "JLE", "JGT", "JGE"))
+JUMPS = CONDITIONAL_JUMPS | {"JMP"}
+
+# Used as the target of a jump whose destination is only known when it runs, such as one to a register
+UNKNOWN_TARGET = "?"
+
+# What one instruction means for the control flow. name is what jumps can use to refer to it (a label or an
+# address), or None. target is what it jumps to, or None if it isn't a jump.
+FlowNode = namedtuple("FlowNode", ["name", "mnemonic", "target"])
+
+# Instructions start to end - 1 of the program, and the indexes of the blocks that can run straight after them
+Block = namedtuple("Block", ["start", "end", "name", "successors"])
+
+# Every graph still in use, by the nodes_key() of what it was made from
+_graphs = WeakValueDictionary()
+
+
+def flow_nodes(instruction_list) -> (tuple, frozenset):
+    """
+    The FlowNodes of a list of Instruction objects, and the set of names used by an instruction other than as the
+    target of a jump. Since their address is used for something, code at those names could be run in ways the
+    graph can't see, so it is always counted as reachable.
+    """
+    nodes = []
+    referenced = set()
+    for instruction in instruction_list:
+        mnemonic = getattr(instruction, "opcode_mnemonic", "MOV")     # Data instructions are MOVs
+        operands = (getattr(instruction, "operand1", None), getattr(instruction, "operand2", None))
+        addresses = [getattr(operand, "addr", None) for operand in operands]
+
+        target = None
+        if mnemonic in JUMPS:
+            target = addresses[0] if isinstance(addresses[0], str) else UNKNOWN_TARGET
+            addresses = addresses[1:]
+        referenced.update(address for address in addresses if isinstance(address, str))
+
+        nodes.append(FlowNode(getattr(instruction, "label", "") or None, mnemonic, target))
+    return tuple(nodes), frozenset(referenced)
+
+
+class ControlFlowGraph:
+    """
+    The basic blocks of a program and the links between them. Block 0 is where the program starts. Reachability and
+    dominators are only worked out when first asked for.
+    """
+
+    def __init__(self, nodes: tuple, referenced: frozenset = frozenset()):
+        self.nodes = nodes
+        self.referenced = referenced
+        count = len(nodes)
+        positions = {node.name: i for i, node in enumerate(nodes) if node.name is not None}
+
+        leaders = {0} if count else set()
+        for i, node in enumerate(nodes):
+            if node.name is not None:
+                leaders.add(i)
+            if (node.target is not None or node.mnemonic == "HLT") and i + 1 < count:
+                leaders.add(i + 1)
+        self.block_starts = sorted(leaders)
+        self.block_names = {nodes[start].name: b for b, start in enumerate(self.block_starts)
+                            if nodes[start].name is not None}
+
+        self.blocks = []
+        for b, (start, end) in enumerate(zip(self.block_starts, self.block_starts[1:] + [count])):
+            last = nodes[end - 1]
+            successors = []
+            if last.target == UNKNOWN_TARGET:
+                successors += self.block_names.values()
+            elif last.target is not None and last.target in positions:
+                successors.append(self.block_names[last.target])
+            if last.mnemonic not in ("HLT", "JMP") and end < count:
+                successors.append(b + 1)
+            self.blocks.append(Block(start, end, nodes[start].name, tuple(sorted(set(successors)))))
+
+        self.predecessors = [[] for _ in self.blocks]
+        for b, block in enumerate(self.blocks):
+            for successor in block.successors:
+                self.predecessors[successor].append(b)
+
+        # The blocks execution can start from: the start of the program and anything whose address is used
+        roots = {self.block_names[name] for name in referenced if name in self.block_names}
+        if self.blocks:
+            roots.add(0)
+        self.roots = sorted(roots)
+
+        self._reachable = None
+        self._idom = None
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def block_of(self, instruction: int) -> int:
+        """The index of the block holding the given instruction."""
+        return bisect_right(self.block_starts, instruction) - 1
+
+    def block_named(self, name) -> int:
+        """The index of the block starting at the given label or address."""
+        return self.block_names[name]
+
+    @property
+    def reachable(self) -> list:
+        """reachable[b] is True if block b can ever be run."""
+        if self._reachable is None:
+            reachable = [False] * len(self.blocks)
+            stack = list(self.roots)
+            while stack:
+                b = stack.pop()
+                if not reachable[b]:
+                    reachable[b] = True
+                    stack.extend(self.blocks[b].successors)
+            self._reachable = reachable
+        return self._reachable
+
+    def unreachable_blocks(self) -> list:
+        return [b for b, reachable in enumerate(self.reachable) if not reachable]
+
+    @property
+    def immediate_dominators(self) -> list:
+        """
+        For each block, the closest block which dominates it, or None if it can't be reached. Roots are their own
+        immediate dominators. Worked out with the iterative algorithm of Cooper, Harvey and Kennedy.
+        """
+        if self._idom is None:
+            self._idom = self._find_dominators()
+        return self._idom
+
+    def _find_dominators(self) -> list:
+        # A made up block before all the roots means there is only one place to start from
+        start = len(self.blocks)
+        successors = [block.successors for block in self.blocks] + [tuple(self.roots)]
+        predecessors = [list(preds) for preds in self.predecessors] + [[]]
+        for root in self.roots:
+            predecessors[root].append(start)
+
+        # Number the blocks in postorder
+        postorder = []
+        visited = [False] * (start + 1)
+        visited[start] = True
+        stack = [(start, iter(successors[start]))]
+        while stack:
+            b, children = stack[-1]
+            for child in children:
+                if not visited[child]:
+                    visited[child] = True
+                    stack.append((child, iter(successors[child])))
+                    break
+            else:
+                stack.pop()
+                postorder.append(b)
+        number = {b: i for i, b in enumerate(postorder)}
+
+        idom = {start: start}
+
+        def intersect(a: int, b: int) -> int:
+            while a != b:
+                while number[a] < number[b]:
+                    a = idom[a]
+                while number[b] < number[a]:
+                    b = idom[b]
+            return a
+
+        changed = True
+        while changed:
+            changed = False
+            for b in reversed(postorder[:-1]):
+                new_idom = None
+                for pred in predecessors[b]:
+                    if pred in idom:
+                        new_idom = pred if new_idom is None else intersect(pred, new_idom)
+                if idom.get(b) != new_idom:
+                    idom[b] = new_idom
+                    changed = True
+
+        return [None if b not in idom else b if idom[b] == start else idom[b] for b in range(start)]
+
+    def dominators(self, b: int) -> list:
+        """Every block which dominates block b, from b itself up to its root."""
+        idom = self.immediate_dominators
+        if idom[b] is None:
+            return []
+        chain = [b]
+        while idom[b] != b:
+            b = idom[b]
+            chain.append(b)
+        return chain
+
+    def dominates(self, a: int, b: int) -> bool:
+        return a in self.dominators(b)
+
+
+def nodes_key(nodes: tuple, referenced: frozenset = frozenset()) -> tuple:
+    """What the graph cache is keyed by instead of the nodes themselves: their number and hashes."""
+    return len(nodes), hash(nodes), hash(referenced)
+
+
+def graph_from_nodes(nodes: tuple, referenced: frozenset = frozenset()) -> ControlFlowGraph:
+    """
+    The ControlFlowGraph for some FlowNodes. Asking again for the same nodes, while the graph is still in use, gives
+    back the same graph.
+    """
+    key = nodes_key(nodes, referenced)
+    graph = _graphs.get(key)
+    if graph is None or graph.nodes != nodes or graph.referenced != referenced:
+        graph = _graphs[key] = ControlFlowGraph(nodes, referenced)
+    return graph
+
+
+def graph_of(instruction_list) -> ControlFlowGraph:
+    """The (cached) ControlFlowGraph of a list of instructions or an InstructionTable."""
+    return graph_from_nodes(*flow_nodes(instruction_list))
+
+
+def drop_unreachable(instruction_list) -> (list, int):
+    """
+    The instructions of instruction_list which are in reachable blocks, and how many blocks were left out. The
+    instructions themselves are not copied or renumbered.
+    """
+    instructions = list(instruction_list)
+    graph = graph_of(instructions)
+    unreachable = graph.unreachable_blocks()
+    if not unreachable:
+        return instructions, 0
+
+    kept = []
+    for block, reachable in zip(graph.blocks, graph.reachable):
+        if reachable:
+            kept += instructions[block.start:block.end]
+    return kept, len(unreachable)
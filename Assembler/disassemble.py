@@ -4,180 +4,427 @@ The format of the output is the metadata then a list of commands.
 The metadata is in the format of key: value
 Each code line is formatted as:
 start_byte  opcode (dtype)  operand1    operand2
+Both the original format and v2 containers can be read. The symbol table of a container is printed too.
 
 The operands take the following formats:
  * An immediate value is just printed as a base-10 int
  * A register operand is printed as the name of the register
  * An arithmetic operand is printed like the assembly input format
  * A memory address is formatted with the letter M followed by the base-16 address
+If the image has raw data, the data image is printed after the instructions.
+With --cfg, the basic blocks of the code are printed after that.
+With --mmap, the file is memory-mapped and decoded straight from the mapping instead of being read in first, and with
+--range start:end only the instructions starting between those bytes of the code are decoded and printed (start has to
+be the start of an instruction), so looking at a small part of a large image costs no more than that part.
+With --asm, source which assembles back into the same bytes is printed instead; see recover.py.
+
+Other tools can use iter_instructions(), which decodes an image one instruction at a time without making any text;
+format_instruction() turns what it gives into the operands above.
 """
 
 from collections import namedtuple
-import io
+import mmap
+import os
 import struct
 import sys
+import traceback
+
+from assembler import OPCODES, REGISTERS, DTYPE_META, SECTION_META, SYMBOL_LABEL, META_DATA_SIZE, META_BSS_SIZE, \
+    STRUCTS, U32, container_section, read_image
+from cfg import JUMPS, UNKNOWN_TARGET, FlowNode, graph_from_nodes
+
+# What decoding needs to know about an opcode: its mnemonic, its data type ("" if it has none) and that type's size
+OpcodeInfo = namedtuple("OpcodeInfo", ["mnemonic", "dtype", "size"])
+
+
+def build_opcode_table() -> tuple:
+    """A 256-entry table of the OpcodeInfo for each opcode byte, with None for bytes which aren't an opcode."""
+    table = [None] * 256
+    for name, opcode in OPCODES.items():
+        mnemonic, _, dtype = name.partition("_")
+        table[opcode] = OpcodeInfo(mnemonic, dtype, DTYPE_META[dtype].size if dtype else 0)
+    return tuple(table)
+
+
+OPCODE_TABLE = build_opcode_table()
+REGISTER_NAMES = {number: name for name, number in REGISTERS.items()}
+
+# How each byte of an arithmetic operand is shown: the name of a register, or else the number
+ARITHMETIC_PARTS = tuple(REGISTER_NAMES.get(i, str(i)) for i in range(256))
+
+# How each form of arithmetic operand is shown, by its number in the operand byte
+ARITHMETIC_FORMATS = {6: "[{}]", 7: "[{}*{}]", 8: "[{}+{}]", 9: "[{}*{}+{}]", 10: "[{}+{}*{}]"}
 
-from assembler import OPCODES, REGISTERS, DTYPE_META
-
-# Get the OPCODES and REGISTERS dicts from the assembler file and swap everything round
-for mnemonic, opcode in OPCODES.copy().items():
-    OPCODES[opcode] = mnemonic
-
-for regname, regnum in REGISTERS.copy().items():
-    REGISTERS[regnum] = regname
-
-# A dict to map from the name of a data type to its struct designation
-DTYPE_STRUCT_FMT_STRINGS = {
-    "char": ">b",
-    "uchar": ">B",
-    "short": ">h",
-    "ushort": ">H",
-    "int": ">i",
-    "uint": ">I",
-    "float": ">f",
-    "1B": ">B",
-    "2B": ">H",
-    "4B": ">I",
-    "": ""
+# The number of bytes taken by each kind of operand, by its number in the operand byte
+OPERAND_LENGTHS = (0, 1, 1, 2, 4, 4, 1, 2, 2, 3, 3)
+
+# The struct format of each type of value. An immediate smaller than its type has been cut down from an unsigned
+# value, so it is read as unsigned (a float cut down like this is put back together by float_from_bits()).
+DTYPE_FORMATS = {
+    "char": "b",
+    "uchar": "B",
+    "short": "h",
+    "ushort": "H",
+    "int": "i",
+    "uint": "I",
+    "float": "f",
+    "1B": "B",
+    "2B": "H",
+    "4B": "I"
 }
+UNSIGNED_FORMATS = {1: "B", 2: "H", 4: "I"}
 
-Instruction = namedtuple("Instruction", "start_byte opcode dtype op1 op2")
 
-def dis(bytecode: bytes):
-    # There is a 4-byte buffer of zeroes between the config and instructions
-    config, text = bytecode.split(b"\x00\x00\x00\x00", maxsplit=1)
+class ArithmeticText(dict):
+    """The text of each arithmetic operand of one form, by its raw bytes, filled in as they are first seen."""
 
-    # Config section should be able to be interpreted as text
-    config = config.decode()
+    def __init__(self, form: str):
+        super().__init__()
+        self.form = form
 
-    # Split on & sign
-    kvpairs = [x for x in config.split("&") if x]
+    def __missing__(self, raw: bytes) -> str:
+        text = self[raw] = self.form.format(*[ARITHMETIC_PARTS[part] for part in raw])
+        return text
 
-    # Split each by = sign and make config dict
-    config_dict = {}
-    for pair in kvpairs:
-        key, value = pair.split("=")
-        config_dict[key] = int(value)
 
+ARITHMETIC_TEXT = {kind: ArithmeticText(form) for kind, form in ARITHMETIC_FORMATS.items()}
 
-    # Turn the text section into a byte stream so it can be consumed
-    text = io.BytesIO(text)
 
-    instruction_list = []
-    # Go on a loop. Consume the bytes as the interpreter would, generating a list of instructions.
-    while True:
-        # Calculate the starting byte of this instruction
-        start_byte = text.tell()
+class RegisterText(dict):
+    """The name of each register by its number, where any other number is an error."""
 
-        # At the end of the stream
-        if start_byte == len(bytecode) - 4 - len(config.encode()):
-            break
+    def __missing__(self, number: int):
+        raise ValueError("Unknown register 0x{:02x}".format(number))
 
-        # Making an instruction. First up should be an opcode.
-        opcode_byte = text.read(1)[0]   # The [0] turns it into an int.
-        opcode_desc = OPCODES[opcode_byte]
 
-        if "_" in opcode_desc:
-            mnemonic, dtype = opcode_desc.split("_")
-        else:
-            mnemonic, dtype = opcode_desc, ""
+REGISTER_TEXT = RegisterText(REGISTER_NAMES)
+
+
+def float_from_bits(bits: int) -> float:
+    return STRUCTS[">f"].unpack(U32.pack(bits))[0]
+
+
+def operand_field(dtype: str, kind: int) -> (str, object):
+    """
+    The struct format which reads an operand of the given kind for an instruction of the given data type, and the
+    function which turns what it reads into the operand:
+     * An immediate value is an int (or a float)
+     * A register is the name of the register
+     * A memory address is the letter M followed by the address
+     * An arithmetic operand is written like the assembly input format
+     * No operand at all is ""
+    Every operand is one field, so that any instruction is read by a single unpack_from().
+    """
+    if kind == 0:
+        return "0s", bytes.decode   # b"" decodes to ""
+    elif kind == 1:
+        return "B", REGISTER_TEXT.__getitem__
+    elif kind <= 4:
+        length = OPERAND_LENGTHS[kind]
+        if dtype and DTYPE_META[dtype].size == length:
+            return DTYPE_FORMATS[dtype], float if dtype == "float" else int
+        return UNSIGNED_FORMATS[length], float_from_bits if dtype == "float" else int
+    elif kind == 5:
+        return "I", "M{}".format
+    elif kind < len(OPERAND_LENGTHS):
+        return "{}s".format(OPERAND_LENGTHS[kind]), ARITHMETIC_TEXT[kind].__getitem__
+    raise ValueError("Unknown operand kind {}".format(kind))
 
-        # Read operand byte
-        op_byte = text.read(1)[0]
-        op1_desc = (op_byte & 0b11110000) >> 4
-        op2_desc = op_byte & 0b00001111
 
-        operand1 = interpret_operand(text, op1_desc, dtype)
-        operand2 = interpret_operand(text, op2_desc, dtype)
+# How to read an instruction with one opcode and operand byte: its size, the unpack_from() of a struct reading the
+# opcode, operand byte and both operands, its mnemonic and data type, and the functions turning each operand's field
+# into the operand
+InstructionLayout = namedtuple("InstructionLayout", ["size", "unpack_from", "mnemonic", "dtype", "convert1",
+                                                     "convert2"])
 
-        instruction_list.append(Instruction(start_byte, mnemonic, dtype, operand1, operand2))
 
+def instruction_layout(opcode: int, operand_byte: int) -> InstructionLayout:
+    info = OPCODE_TABLE[opcode]
+    if info is None:
+        raise ValueError("Unknown opcode 0x{:02x}".format(opcode))
+    format1, convert1 = operand_field(info.dtype, operand_byte >> 4)
+    format2, convert2 = operand_field(info.dtype, operand_byte & 0x0F)
+    layout_struct = struct.Struct(">BB" + format1 + format2)
+    return InstructionLayout(layout_struct.size, layout_struct.unpack_from, info.mnemonic, info.dtype, convert1,
+                             convert2)
 
-    # With the config dict and instruction list ready, do the printing
-    print("Disassembling {} bytes\n".format(len(bytecode)))
-    print("Config dictionary (took {} bytes)".format(len(config)))
+
+# The layout of every (opcode << 8 | operand byte) seen so far
+LAYOUTS = {}
+
+# The number of instruction lines written to the output at once
+CHUNK_LINES = 4096
+
+# An instruction as it is shown: its operands are turned into text as described in operand_field()
+Instruction = namedtuple("Instruction", "start_byte opcode dtype op1 op2")
+
+
+class RawInstruction(namedtuple("RawInstruction", "start_byte opcode operands field1 field2")):
+    """
+    An instruction as it was read, before anything is turned into text: its opcode and operand byte, and the field
+    read for each operand (an int or float, or the bytes of an arithmetic operand).
+    """
+    __slots__ = ()
+
+    @property
+    def mnemonic(self) -> str:
+        return OPCODE_TABLE[self.opcode].mnemonic
+
+    @property
+    def dtype(self) -> str:
+        return OPCODE_TABLE[self.opcode].dtype
+
+    @property
+    def kinds(self) -> (int, int):
+        return self.operands >> 4, self.operands & 0x0F
+
+    @property
+    def size(self) -> int:
+        return LAYOUTS[self.opcode << 8 | self.operands].size
+
+
+def dis(bytecode: bytes, show_cfg=False, byte_range=None):
+    """
+    Print a breakdown of bytecode (anything supporting the buffer protocol, such as an mmap). byte_range is the
+    (start, end) of the code to decode, where end can be None for the end of the code, and the start has to be the
+    start of an instruction; only the symbols and data in it are printed.
+    """
+    # Find the config and the code, in whichever format the bytecode is
+    image = read_image(bytecode)
+    config_dict = image.config
+    code = instruction_code(image)
+    code_length = len(code)
+    start, end = byte_range or (0, None)
+
+    print("Disassembling {} bytes (format version {})\n".format(len(bytecode), image.version))
+    if image.version == 1:
+        config_length = image.code_offset - 4
+    else:
+        config_length = container_section(bytecode, SECTION_META)[1]
+    print("Config dictionary (took {} bytes)".format(config_length))
     for key, value in config_dict.items():
         print("    {key}\t\t{value}".format(key=key, value=value))
 
-    # Print all the instructions
-    print("\nInstructions (took {} bytes)".format(len(bytecode) - len(config) - 4))
-    for start_byte, mnemonic, dtype, op1, op2 in instruction_list:
-        dtype_str = "(" + dtype + ")" if dtype else "     "
-        print("\t{start_byte}\t{mnemonic} {dtype_str}\t{op1}\t{op2}".format(start_byte=start_byte,
-                                                                            mnemonic=mnemonic,
-                                                                            dtype_str=dtype_str,
-                                                                            op1=op1,
-                                                                            op2=op2))
-
-
-
-def interpret_operand(text_stream: BytesIO, desc: str, dtype: str):
-    if desc == 0:
-        return ""
-    elif desc == 1:
-        # Register
-        regnum = text_stream.read(1)[0]
-        return REGISTERS[regnum]
-    elif desc == 2:
-        # 8-bit immediate operand
-        op_bytes = text_stream.read(1)
-        op_bytes = (b"\x00" * (DTYPE_META[dtype].size - 1)) + op_bytes
-        return struct.unpack(DTYPE_STRUCT_FMT_STRINGS[dtype], op_bytes)[0]
-    elif desc == 3:
-        # 16-bit immediate operand
-        op_bytes = text_stream.read(2)
-        op_bytes = (b"\x00" * (DTYPE_META[dtype].size - 2)) + op_bytes
-        return struct.unpack(DTYPE_STRUCT_FMT_STRINGS[dtype], op_bytes)[0]
-    elif desc == 4:
-        # 32-bit immediate operand
-        op_bytes = text_stream.read(4)
-        return struct.unpack(DTYPE_STRUCT_FMT_STRINGS[dtype], op_bytes)[0]
-    elif desc == 5:
-        # Memory address
-        op_bytes = text_stream.read(4)
-        return "M" + str(struct.unpack(">I", op_bytes)[0])
-    elif desc == 6:
-        # Arithmetic operand in the form "a"
-        a = read_arithmetic_part(text_stream)
-        return "[" + a + "]"
-    elif desc == 7:
-        # Arithmetic operand in the form "a*b"
-        a = read_arithmetic_part(text_stream)
-        b = read_arithmetic_part(text_stream)
-        return "[" + a + "*" + b + "]"
-    elif desc == 8:
-        # Arithmetic operand in the form "a+b"
-        a = read_arithmetic_part(text_stream)
-        b = read_arithmetic_part(text_stream)
-        return "[" + a + "*" + b + "]"
-    elif desc == 9:
-        # Arithmetic operand in the form "a*b+c"
-        a = read_arithmetic_part(text_stream)
-        b = read_arithmetic_part(text_stream)
-        c = read_arithmetic_part(text_stream)
-        return "[" + a + "*" + b + "+" + c + "]"
-    elif desc == 10:
-        # Arithmetic operand in the form "a+b*c"
-        a = read_arithmetic_part(text_stream)
-        b = read_arithmetic_part(text_stream)
-        c = read_arithmetic_part(text_stream)
-        return "[" + a + "+" + b + "*" + c + "]"
-
-
-def read_arithmetic_part(text_stream: BytesIO) -> str:
-    num = text_stream.read(1)[0]
-    if num in REGISTERS.keys():
-        return REGISTERS[num]
+    if image.symbols is not None:
+        print("\nSymbols")
+        for name, (address, kind) in sorted(image.symbols.items(), key=lambda item: item[1]):
+            if start <= address and (end is None or address < end):
+                print("    {address}\t{kind}\t{name}".format(address=address, name=name,
+                                                            kind="label" if kind == SYMBOL_LABEL else "var"))
+
+    # Print the instructions as they are decoded
+    if byte_range is None:
+        print("\nInstructions (took {} bytes)".format(code_length))
     else:
-        return str(num)
+        print("\nInstructions (took {} bytes, showing bytes {} to {})".format(
+            code_length, start, code_length if end is None else end))
+    write_instructions(code, start, end)
+
+    if META_DATA_SIZE in config_dict:
+        data_size = config_dict[META_DATA_SIZE]
+        print("\nData (took {} bytes, and {} more start at zero)".format(data_size, config_dict[META_BSS_SIZE]))
+        data_end = data_size if end is None else min(end - code_length, data_size)
+        for row in range(max(start - code_length, 0) // 16 * 16, data_end, 16):
+            print("\t{}\t{}".format(code_length + row, image.code[code_length + row: code_length + row + 16].hex()))
+
+    if show_cfg:
+        instruction_list = decode_instructions(code)
+        print_graph(graph_from_nodes(*flow_nodes_of(instruction_list)), instruction_list, code_length)
+
+
+def write_instructions(code, start: int = 0, stop: int = None):
+    """Write the line of each instruction starting between start and stop to stdout, CHUNK_LINES lines at a time."""
+    out = sys.stdout
+    lines = []
+    for raw in iter_code(code, start, stop):
+        lines.append(instruction_text(format_instruction(raw)))
+        if len(lines) == CHUNK_LINES:
+            out.write("\n".join(lines) + "\n")
+            lines.clear()
+    if lines:
+        out.write("\n".join(lines) + "\n")
+
+
+def parse_range(text: str) -> (int, int):
+    """Read a byte range written as start:end, where either can be left out."""
+    start, sep, end = text.partition(":")
+    if not sep:
+        raise ValueError("A range is written as start:end")
+    return int(start or 0), int(end) if end else None
+
+
+def instruction_code(image) -> memoryview:
+    """The instructions of an image, without the raw data which images with --raw-data have after them."""
+    return image.code[:len(image.code) - image.config.get(META_DATA_SIZE, 0)]
+
+
+def iter_instructions(bytecode, start: int = 0, stop: int = None):
+    """
+    Decode the instructions of bytecode (in either format) one at a time, as RawInstructions, starting from the
+    instruction at byte start of the code and ending with the last one starting before stop (if given). Nothing is
+    turned into text; format_instruction() does that.
+    """
+    return iter_code(instruction_code(read_image(bytecode)), start, stop)
+
+
+def iter_code(code, start: int = 0, stop: int = None):
+    """
+    Decode the instructions in code (anything supporting the buffer protocol) as the interpreter would, yielding
+    RawInstructions from the one at byte start up to the last one starting before stop. Everything is read in place
+    from a memoryview, one unpack_from() per instruction, so only those instructions are ever read.
+    """
+    view = memoryview(code)
+    end = len(view)
+    stop = end if stop is None else min(stop, end)
+    layouts = LAYOUTS
+    new = tuple.__new__
+
+    offset = start
+    while offset < stop:
+        # The opcode and operand byte decide how the rest of the instruction is read
+        layout = layouts.get(view[offset] << 8 | view[offset + 1] if offset + 1 < end else -1) or \
+            new_layout(view, offset)
+        try:
+            yield new(RawInstruction, (offset,) + layout.unpack_from(view, offset))
+        except struct.error:
+            raise ValueError("The instruction at byte {} runs past the end of the code".format(offset)) from None
+        offset += layout.size
+
+
+def new_layout(view: memoryview, offset: int) -> InstructionLayout:
+    """The layout of an instruction not in LAYOUTS yet, which is added to it."""
+    if offset + 1 >= len(view):
+        raise ValueError("The instruction at byte {} runs past the end of the code".format(offset))
+    try:
+        layout = LAYOUTS[view[offset] << 8 | view[offset + 1]] = instruction_layout(view[offset], view[offset + 1])
+    except ValueError as e:
+        raise ValueError("{} at byte {}".format(e, offset)) from None
+    return layout
+
+
+def format_instruction(raw: RawInstruction) -> Instruction:
+    """Turn the operands of a RawInstruction into text."""
+    layout = LAYOUTS[raw.opcode << 8 | raw.operands]
+    try:
+        return Instruction(raw.start_byte, layout.mnemonic, layout.dtype, layout.convert1(raw.field1),
+                           layout.convert2(raw.field2))
+    except ValueError as e:
+        raise ValueError("{} at byte {}".format(e, raw.start_byte)) from None
+
+
+def instruction_text(instruction: Instruction) -> str:
+    """The line dis() prints for an instruction."""
+    dtype_str = "(" + instruction.dtype + ")" if instruction.dtype else "     "
+    return "\t{start_byte}\t{mnemonic} {dtype_str}\t{op1}\t{op2}".format(start_byte=instruction.start_byte,
+                                                                       mnemonic=instruction.opcode,
+                                                                       dtype_str=dtype_str,
+                                                                       op1=instruction.op1,
+                                                                       op2=instruction.op2)
+
+
+def decode_instructions(code) -> list:
+    """
+    Decode all of the instructions in code, with their operands turned into text. This is the same as formatting
+    everything from iter_code(), but is done in one loop as it is what dis() and the control flow graph need.
+    """
+    view = memoryview(code)
+    end = len(view)
+    layouts = LAYOUTS
+
+    instruction_list = []
+    append = instruction_list.append
+    offset = 0
+    while offset < end:
+        layout = layouts.get(view[offset] << 8 | view[offset + 1] if offset + 1 < end else -1) or \
+            new_layout(view, offset)
+        size, unpack_from, mnemonic, dtype, convert1, convert2 = layout
+        try:
+            _, _, field1, field2 = unpack_from(view, offset)
+            append(Instruction(offset, mnemonic, dtype, convert1(field1), convert2(field2)))
+        except struct.error:
+            raise ValueError("The instruction at byte {} runs past the end of the code".format(offset)) from None
+        except ValueError as e:
+            raise ValueError("{} at byte {}".format(e, offset)) from None
+        offset += size
+
+    return instruction_list
+
+
+def flow_nodes_of(instruction_list: list) -> (tuple, frozenset):
+    """
+    The FlowNodes of decoded instructions, for building a control flow graph. Jumps refer to addresses, so an
+    instruction is named by its start byte if anything refers to it.
+    """
+    targets = []
+    referenced = set()
+    for instruction in instruction_list:
+        addresses = [int(op[1:]) if isinstance(op, str) and op.startswith("M") else None
+                     for op in (instruction.op1, instruction.op2)]
+        if instruction.opcode in JUMPS:
+            targets.append(UNKNOWN_TARGET if addresses[0] is None else addresses[0])
+            addresses = addresses[1:]
+        else:
+            targets.append(None)
+        referenced.update(address for address in addresses if address is not None)
+
+    names = referenced.union(targets)
+    nodes = tuple(FlowNode(instruction.start_byte if instruction.start_byte in names else None, instruction.opcode,
+                           target) for instruction, target in zip(instruction_list, targets))
+    return nodes, frozenset(referenced)
+
+
+def print_graph(graph, instruction_list: list, code_length: int):
+    """Print the basic blocks: their bytes, where they can go next, their immediate dominator and if they can run."""
+    print("\nBasic blocks")
+    idom = graph.immediate_dominators
+    for b, block in enumerate(graph.blocks):
+        end_byte = instruction_list[block.end].start_byte if block.end < len(instruction_list) else code_length
+        successors = ", ".join(map(str, block.successors)) or "-"
+        dominator = "unreachable" if idom[b] is None else "idom {}".format(idom[b])
+        print("    {b}\t{start}-{end}\t-> {successors}\t{dominator}".format(
+            b=b, start=instruction_list[block.start].start_byte, end=end_byte, successors=successors,
+            dominator=dominator))
 
 
 if __name__ == "__main__":
     # Interpret command line arguments
-    if len(sys.argv) > 1:
-        fname = sys.argv[1]
+    from argparse import ArgumentParser
+
+    arg_parser = ArgumentParser(description="Print a breakdown of some bytecode")
+    arg_parser.add_argument("file", nargs="?", help="the bytecode file")
+    arg_parser.add_argument("--cfg", action="store_true", help="print the basic blocks of the code too")
+    arg_parser.add_argument("--mmap", action="store_true", help="decode the file straight from a memory mapping of it")
+    arg_parser.add_argument("--range", type=parse_range, metavar="START:END", dest="byte_range",
+                            help="only decode the instructions starting between these bytes of the code")
+    arg_parser.add_argument("--asm", action="store_true",
+                            help="print source which assembles back into the same bytes instead")
+    args = arg_parser.parse_args()
+    if args.cfg and args.byte_range is not None:
+        arg_parser.error("--cfg needs the whole of the code, so can't be used with --range")
+    if args.asm and (args.cfg or args.byte_range is not None):
+        arg_parser.error("--asm recovers the whole program, so can't be used with --cfg or --range")
+
+    if args.file is not None:
+        fname = args.file
     else:
         fname = input("Bytecode file: ")
 
+    if args.asm:
+        from recover import recover_source
+
+        with open(fname, "rb") as file:
+            print(recover_source(file.read()).text)
+        sys.exit()
+
     with open(fname, "rb") as file:
-        dis(file.read())
\ No newline at end of file
+        # An empty file can't be mapped
+        if args.mmap and os.fstat(file.fileno()).st_size:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                try:
+                    dis(mapped, args.cfg, args.byte_range)
+                except BaseException as e:
+                    # The frames of the traceback still hold views of the mapping, which stop it being closed
+                    traceback.clear_frames(e.__traceback__)
+                    raise
+        else:
+            dis(file.read(), args.cfg, args.byte_range)
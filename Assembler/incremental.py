@@ -0,0 +1,473 @@
+"""
+Incremental reassembly, for tools (like the GUI) which assemble the same file again after every small edit.
+An IncrementalAssembler remembers the encoding of every line from the last run. Given a new version of the text, it
+finds the lines which changed (comparing the texts as strings, so only the changed lines are ever split out), parses
+and encodes only those and then rewrites only the addresses whose targets have moved.
+
+Each section is kept as a list of Blocks of up to a few hundred lines, each with its own bytes and with everything
+in it placed relative to its own start. An edit rebuilds only the blocks it touches, and where every block starts is
+a prefix sum over the blocks rather than the lines, so moving everything after an edit along costs nothing per line.
+An index of which blocks refer to each name then gives the only blocks whose addresses need rewriting, and a block
+rewrites all of its addresses at once by joining its code back together around them.
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import Counter, namedtuple
+from itertools import accumulate, chain, repeat
+
+from assembler import META_CONFIG_DEFAULT, DTYPE_META, U32, AssemblyError, AddressOperand, normalise_line, \
+    parse_meta_line, parse_data_line, parse_text_line, encode_metadata
+
+# The encoded form of one data or text line. code has zeroes in place of any addresses; relocs lists the
+# (position in code, name) of each one. var is (name, dtype) for a data line.
+LineCode = namedtuple("LineCode", ["code", "relocs", "label", "var"])
+
+# A section's lines run from start up to (not including) end, and are held in blocks. line_starts, byte_starts and
+# var_starts are the prefix sums over the blocks of their lines, bytes of code and bytes of variables, so block i
+# starts at line line_starts[i] of the section.
+Section = namedtuple("Section", ["start", "end", "blocks", "line_starts", "byte_starts", "var_starts"])
+
+# The most lines put in a block when blocks are made. A block being edited is only split up once it has grown to
+# twice this.
+BLOCK_LINES = 256
+
+
+def encode_line(section: str, line: str):
+    """Parse and encode one normalised line. Returns a LineCode, or (item, value) for a meta line."""
+    if section == "meta":
+        return parse_meta_line(line)
+
+    if section == "data":
+        instruction = parse_data_line(line, 0)
+        code = bytearray(instruction.get_bytes_length())
+        instruction.write_bytes(code, 0, {instruction.name: 0})
+        return LineCode(bytes(code), ((2, instruction.name),), "", (instruction.name, instruction.data_type))
+
+    instruction = parse_text_line(line, 0)
+    code = bytearray(instruction.get_bytes_length())
+    code[0] = instruction.get_opcode_num()
+    code[1] = instruction.get_operand_byte()
+    offset = 2
+    relocs = []
+    for operand in (instruction.operand1, instruction.operand2):
+        if isinstance(operand, AddressOperand) and isinstance(operand.addr, str):
+            relocs.append((offset, operand.addr))
+            offset += 4
+        elif operand is not None:
+            offset = operand.write_bytes(code, offset)
+    return LineCode(bytes(code), tuple(relocs), instruction.label, None)
+
+
+def common_prefix_length(a: list, b: list, limit: int) -> int:
+    """
+    The number of items (up to limit) at the start of a and b which are equal. Whole chunks are compared at once
+    so that most of the comparing is done by list equality rather than a Python loop.
+    """
+    i = 0
+    while i < limit:
+        j = min(i + 1024, limit)
+        if a[i:j] != b[i:j]:
+            break
+        i = j
+    while i < limit and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def common_suffix_length(a: list, b: list, limit: int) -> int:
+    """The number of items (up to limit) at the end of a and b which are equal."""
+    i = 0
+    while i < limit:
+        j = min(i + 1024, limit)
+        if a[len(a) - j:len(a) - i] != b[len(b) - j:len(b) - i]:
+            break
+        i = j
+    while i < limit and a[len(a) - 1 - i] == b[len(b) - 1 - i]:
+        i += 1
+    return i
+
+
+def common_prefix_chars(a: str, b: str) -> int:
+    """
+    The number of characters at the start of a and b which are equal. Chunks are compared with startswith(), so
+    neither string is copied more than once, and the chunk which differs is then narrowed down by halving it.
+    """
+    limit = min(len(a), len(b))
+    i = 0
+    step = 4096
+    while i < limit:
+        j = min(i + step, limit)
+        if not a.startswith(b[i:j], i):
+            break
+        i = j
+        step *= 2
+    else:
+        return limit
+
+    # a and b agree up to i, but not up to j
+    while j - i > 1:
+        middle = (i + j) // 2
+        if a.startswith(b[i:middle], i):
+            i = middle
+        else:
+            j = middle
+    return i
+
+
+def common_suffix_chars(a: str, b: str, limit: int) -> int:
+    """The number of characters (up to limit) at the end of a and b which are equal."""
+    i = 0
+    step = 4096
+    while i < limit:
+        j = min(i + step, limit)
+        if not a.endswith(b[len(b) - j:len(b) - i], 0, len(a) - i):
+            break
+        i = j
+        step *= 2
+    else:
+        return limit
+
+    while j - i > 1:
+        middle = (i + j) // 2
+        if a.endswith(b[len(b) - middle:len(b) - i], 0, len(a) - i):
+            i = middle
+        else:
+            j = middle
+    return i
+
+
+class Block:
+    """
+    A run of lines from one section. entries has a LineCode (or None for a blank line, or (item, value) for a meta
+    line) for each of them, and code is what they encode to, addresses included. names are the labels or variables
+    defined in the block, in order, and offsets where each is: a label's offset into code, or a variable's offset into
+    the block's share of the variables. parts is code cut up around its addresses: the bytes between them are at the
+    even indexes, and the address of site_names[i] goes at index 2i + 1.
+    """
+    __slots__ = ("entries", "code", "parts", "names", "offsets", "var_size", "site_names")
+
+    def __init__(self, entries: list):
+        self.entries = entries
+        self.names = []
+        self.offsets = []
+        self.site_names = []
+        positions = []
+
+        offset = 0
+        var_offset = 0
+        codes = []
+        for entry in entries:
+            if not isinstance(entry, LineCode):
+                continue
+            for position, name in entry.relocs:
+                positions.append(offset + position)
+                self.site_names.append(name)
+            if entry.label != "":
+                self.names.append(entry.label)
+                self.offsets.append(offset)
+            if entry.var is not None:
+                name, dtype = entry.var
+                self.names.append(name)
+                self.offsets.append(var_offset)
+                var_offset += DTYPE_META[dtype].size
+            codes.append(entry.code)
+            offset += len(entry.code)
+
+        self.code = b"".join(codes)
+        self.var_size = var_offset
+
+        self.parts = []
+        previous = 0
+        for position in positions:
+            self.parts += [self.code[previous:position], None]
+            previous = position + 4
+        self.parts.append(self.code[previous:])
+
+    def patch(self, packed: dict):
+        """
+        Write in every address in the block, given the packed address of each name. A name with no address fails with
+        a KeyError, as in a full run.
+        """
+        if self.site_names:
+            self.parts[1::2] = map(packed.__getitem__, self.site_names)
+            self.code = b"".join(self.parts)
+
+
+def make_blocks(entries: list) -> list:
+    return [Block(entries[i:i + BLOCK_LINES]) for i in range(0, len(entries), BLOCK_LINES)]
+
+
+def make_section(start: int, end: int, blocks: list) -> Section:
+    return Section(start, end, blocks, [0] + list(accumulate(len(block.entries) for block in blocks)),
+                   [0] + list(accumulate(len(block.code) for block in blocks)),
+                   [0] + list(accumulate(block.var_size for block in blocks)))
+
+
+class IncrementalAssembler:
+    """
+    Assembles successive versions of a program, reusing the work from the previous version wherever the lines are
+    unchanged. assemble() gives the same bytecode as assembler.main(..., "return") would.
+    """
+
+    def __init__(self):
+        self.text = None
+        self.sections = {}
+        self.config_dict = {}
+        self.metadata = b""
+
+        # The address of each name, packed into the 4 bytes written into the code
+        self.packed = {}
+
+        # The blocks which refer to each name, and how many times each name is defined. A name can be defined more
+        # than once, as in a full run; the last definition is the one used, and a label is used over a variable.
+        # duplicates holds every name defined more than once.
+        self.references = {}
+        self.definition_counts = Counter()
+        self.duplicates = set()
+
+        # How much work the last call to assemble() did
+        self.last_full_rebuild = False
+        self.last_lines_parsed = 0
+
+    def assemble(self, text: str) -> bytes:
+        """Assemble a new version of the program and return its bytecode."""
+        try:
+            if self.text is None:
+                self._full_build(text)
+            else:
+                self._update(text)
+        except Exception:
+            # Don't try to carry on from a half-finished update
+            self.text = None
+            raise
+
+        return b"".join([self.metadata] + [block.code for name in ("data", "text")
+                                           for block in self.sections[name].blocks])
+
+    # ---------- FULL BUILD
+
+    def _full_build(self, text: str):
+        lines = text.split("\n")
+        self.last_full_rebuild = True
+        self.last_lines_parsed = len(lines)
+        self.text = text
+
+        # Find where each section starts and ends
+        headers = [(i, line[len("section."):]) for i, line in enumerate(map(normalise_line, lines))
+                   if line.startswith("section.")]
+        ranges = {}
+        for (i, name), (next_i, _) in zip(headers, headers[1:] + [(len(lines), None)]):
+            ranges[name] = (i + 1, next_i)
+
+        # All sections have to be present, so check that
+        for name in ("meta", "data", "text"):
+            if name not in ranges:
+                raise AssemblyError(-1, "No {} section".format(name))
+
+        self.sections = {}
+        self.references = {}
+        self.definition_counts = Counter()
+        self.duplicates = set()
+        for name in ("meta", "data", "text"):
+            start, end = ranges[name]
+            blocks = make_blocks([self._parse(name, line) for line in lines[start:end]])
+            for block in blocks:
+                self._register(block, 1)
+            self.sections[name] = make_section(start, end, blocks)
+
+        self._rebuild_config()
+        self.packed = {name: U32.pack(address) for name, address in self._symbol_addresses()}
+        for name in ("data", "text"):
+            for block in self.sections[name].blocks:
+                block.patch(self.packed)
+
+    @staticmethod
+    def _parse(section: str, line: str):
+        line = normalise_line(line)
+        return encode_line(section, line) if line else None
+
+    def _register(self, block: Block, count: int):
+        """Add block to the reference index and count its definitions (count=1), or take it out again (count=-1)."""
+        for name in set(block.site_names):
+            if count > 0:
+                self.references.setdefault(name, set()).add(block)
+            else:
+                blocks = self.references[name]
+                blocks.discard(block)
+                if not blocks:
+                    del self.references[name]
+
+        counts = self.definition_counts
+        for name in block.names:
+            counts[name] += count
+            if counts[name] > 1:
+                self.duplicates.add(name)
+            else:
+                self.duplicates.discard(name)
+
+    def _rebuild_config(self):
+        self.config_dict = META_CONFIG_DEFAULT.copy()
+        for block in self.sections["meta"].blocks:
+            for entry in block.entries:
+                if entry is not None:
+                    item, value = entry
+                    self.config_dict[item] = value
+        self.metadata = encode_metadata(self.config_dict)
+
+    # ---------- INCREMENTAL UPDATE
+
+    def _update(self, text: str):
+        old = self.text
+        self.last_full_rebuild = False
+        self.last_lines_parsed = 0
+
+        # The changed characters are whatever is left after removing the common start and end, and the changed lines
+        # are the ones they are in
+        p = common_prefix_chars(old, text)
+        if p == len(old) == len(text):
+            return
+        q = common_suffix_chars(old, text, min(len(old), len(text)) - p)
+        region_start = old.rfind("\n", 0, p) + 1
+        i = old.count("\n", 0, region_start)
+        old_lines = self._region(old, region_start, len(old) - q)
+        lines = self._region(text, region_start, len(text) - q)
+
+        # Lines at either end of those can still be the same, if the edit added or removed whole lines
+        prefix = common_prefix_length(old_lines, lines, min(len(old_lines), len(lines)))
+        suffix = common_suffix_length(old_lines, lines, min(len(old_lines), len(lines)) - prefix)
+        i += prefix
+        old_lines = old_lines[prefix:len(old_lines) - suffix]
+        lines = lines[prefix:len(lines) - suffix]
+        old_end = i + len(old_lines)
+        self.text = text
+
+        # Adding, removing or editing a section header changes which section every later line is in
+        if any(normalise_line(line).startswith("section.") for line in old_lines + lines):
+            self._full_build(text)
+            return
+
+        line_shift = len(lines) - len(old_lines)
+
+        # Move the sections after the edit along, and find the one it is in (if any)
+        edited = None
+        for name, section in self.sections.items():
+            if section.start <= i <= section.end:
+                edited = name
+            elif section.start > i:
+                self.sections[name] = section._replace(start=section.start + line_shift,
+                                                       end=section.end + line_shift)
+        if edited is None:
+            return
+
+        section = self.sections[edited]
+        a = i - section.start
+        b = old_end - section.start
+        new_entries = [self._parse(edited, line) for line in lines]
+        self.last_lines_parsed = len(new_entries)
+
+        # The blocks holding lines a to b - 1 (or the one line a would go into) are made again with the new lines
+        line_starts = section.line_starts
+        count = len(section.blocks)
+        first = min(max(bisect_right(line_starts, a) - 1, 0), max(count - 1, 0))
+        last = min(max(bisect_left(line_starts, b), first + 1), count)
+        old_blocks = section.blocks[first:last]
+        entries = [entry for block in old_blocks for entry in block.entries]
+        entries[a - line_starts[first]: b - line_starts[first]] = new_entries
+        new_blocks = [Block(entries)] if 0 < len(entries) <= 2 * BLOCK_LINES else make_blocks(entries)
+
+        # Names defined more than once, before or after the edit, have to be looked for everywhere
+        touched = set(name for block in old_blocks + new_blocks for name in block.names)
+        ambiguous = touched & self.duplicates
+        for block in old_blocks:
+            self._register(block, -1)
+        for block in new_blocks:
+            self._register(block, 1)
+
+        blocks = section.blocks[:first] + new_blocks + section.blocks[last:]
+        self.sections[edited] = make_section(section.start, section.end + line_shift, blocks)
+        if edited == "meta":
+            self._rebuild_config()
+            return
+
+        self._relocate(edited, first, first + len(new_blocks), old_blocks, new_blocks, touched, ambiguous)
+
+    @staticmethod
+    def _region(text: str, start: int, end: int) -> list:
+        """The lines of text from the one starting at start to the one holding the character at end."""
+        stop = text.find("\n", end)
+        return text[start:len(text) if stop == -1 else stop].split("\n")
+
+    # ---------- ADDRESSES
+
+    def _block_addresses(self, data_blocks: (int, int) = (0, None), text_blocks: (int, int) = (0, None)):
+        """
+        The names defined in data blocks data_blocks[0] to data_blocks[1] - 1 and then in the text blocks text_blocks,
+        a block at a time, as (names, addresses) in the order a full run finds them.
+        """
+        data = self.sections["data"]
+        text = self.sections["text"]
+        data_size = data.byte_starts[-1]
+        total_size = data_size + text.byte_starts[-1]
+
+        for section, (start, stop), base in ((data, data_blocks, total_size), (text, text_blocks, data_size)):
+            starts = section.var_starts if section is data else section.byte_starts
+            for index, block in enumerate(section.blocks[start:stop], start):
+                if block.names:
+                    yield block.names, map((base + starts[index]).__add__, block.offsets)
+
+    def _symbol_addresses(self, data_blocks: (int, int) = (0, None), text_blocks: (int, int) = (0, None)):
+        """Every (name, address) from _block_addresses(), one at a time."""
+        for names, addresses in self._block_addresses(data_blocks, text_blocks):
+            yield from zip(names, addresses)
+
+    def _relocate(self, edited: str, first: int, stop: int, old_blocks: list, new_blocks: list, touched: set,
+                  ambiguous: set):
+        """
+        After blocks first to stop - 1 of the edited section were made again from old_blocks, work out which names
+        moved, then write in the addresses of every block referring to one of them, as well as those in the new blocks.
+        """
+        size_change = sum(len(block.code) for block in new_blocks) - sum(len(block.code) for block in old_blocks)
+        var_change = sum(block.var_size for block in new_blocks) - sum(block.var_size for block in old_blocks)
+
+        # Only the names in the new blocks can have moved unless something after them has been moved along. A
+        # change in the size of the code moves every variable, and one in the data section every label too.
+        ranges = {name: (len(self.sections[name].blocks), None) for name in ("data", "text")}
+        ranges[edited] = (first, stop)
+        if size_change or var_change:
+            ranges[edited] = (first, None)
+        if size_change:
+            ranges["data"] = (0, None)
+            if edited == "data":
+                ranges["text"] = (0, None)
+
+        # Every name in those blocks is taken to have moved, and given its new address a block at a time
+        packed = self.packed
+        pack = U32.pack
+        moved = set()
+        for names, addresses in self._block_addresses(ranges["data"], ranges["text"]):
+            packed.update(zip(names, map(pack, addresses)))
+            moved.update(names)
+
+        # A name no longer defined at all is dropped; anything still referring to it fails when it is patched
+        counts = self.definition_counts
+        for name in touched:
+            if counts[name] == 0:
+                packed.pop(name, None)
+                moved.add(name)
+
+        # A name defined more than once gets the address of the definition a full run would use
+        ambiguous = {name for name in ambiguous | (moved & self.duplicates) if counts[name]}
+        if ambiguous:
+            for name, address in self._symbol_addresses():
+                if name in ambiguous:
+                    packed[name] = pack(address)
+            moved |= ambiguous
+
+        # Once more names have moved than there are blocks, it is quicker to patch every block than to look them up
+        blocks = self.sections["data"].blocks + self.sections["text"].blocks
+        if len(moved) > len(blocks):
+            affected = blocks
+        else:
+            affected = set(new_blocks).union(chain.from_iterable(map(self.references.get, moved, repeat(()))))
+        for block in affected:
+            block.patch(packed)
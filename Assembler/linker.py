@@ -0,0 +1,230 @@
+"""
+Separate assembly. Each source file can be assembled on its own into an object, which keeps its code with the
+addresses left blank, the variables and labels it defines and a list of the places an address has to be written (its
+relocations). link() then puts objects together into one program.
+Run from the command line as
+python linker.py build [--container] -o program.bin file1.asm file2.asm ...
+which only reassembles a file if it has changed since its .o file was written, or use the separate steps
+python linker.py compile file1.asm ...
+python linker.py link [--container] -o program.bin file1.o file2.o ...
+
+Every label and variable is visible to every object, so the same name can't be defined in two of them. In the linked
+program, the data sections of all the objects come first (so that every variable is set up before anything else runs),
+then their text sections and finally their variables, each in the order the objects were given. Execution starts at
+the first object's text section once the variables are set up.
+"""
+
+from collections import namedtuple
+import json
+import os
+import sys
+
+from assembler import ASSEMBLER_VERSION, META_CONFIG_DEFAULT, DTYPE_META, U32, SYMBOL_LABEL, SYMBOL_VARIABLE, \
+    Assembled, AssemblyError, contextualise_lines, compute_layout, encode_metadata, encode_container
+
+# Object files start with this, then the length of a JSON header, the header and the code
+OBJECT_MAGIC = b"ASMO"
+
+# An assembled but unlinked source file.
+#  * config has only the meta section items the file set itself
+#  * code is its data instructions followed by its text instructions, with zeroes in place of addresses. The first
+#    data_size bytes are the data instructions.
+#  * variables lists the (name, dtype) of each variable in order
+#  * labels maps each label to its offset in code
+#  * relocations lists the (offset in code, name) of each address that has to be filled in
+ObjectFile = namedtuple("ObjectFile", ["config", "code", "data_size", "variables", "labels", "relocations"])
+
+
+def assemble_object(source) -> ObjectFile:
+    """Assemble source (the text of a program or any iterable of its lines) into an object."""
+    if isinstance(source, str):
+        source = source.split("\n")
+
+    config_dict, table = contextualise_lines(source, as_table=True)
+    layout = compute_layout(table)
+    code = bytearray(layout.text_size)
+    table.write_bytes(code, 0)
+
+    # The relocations are kept as places in the payload, so find the row each is in to get its place in the code.
+    # Row i's payload starts 2 * (i + 1) bytes further into the code than it does in the payload.
+    relocations = []
+    row = 0
+    for position, symbol_id in zip(table.reloc_positions, table.reloc_symbols):
+        while table.payload_offsets[row + 1] <= position:
+            row += 1
+        relocations.append((position + 2 * (row + 1), table.symbols[symbol_id]))
+
+    config = {item: value for item, value in config_dict.items()
+              if item not in META_CONFIG_DEFAULT or value != META_CONFIG_DEFAULT[item]}
+    variables = [(name, dtype) for name, _, dtype in table.variables]
+    return ObjectFile(config, bytes(code), layout.instr_offsets[len(variables)], variables, layout.label_offsets,
+                      relocations)
+
+
+def object_exports(obj: ObjectFile) -> set:
+    """The names an object defines."""
+    return {name for name, _ in obj.variables} | set(obj.labels)
+
+
+def object_imports(obj: ObjectFile) -> set:
+    """The names an object uses but doesn't define, which another object has to."""
+    return {name for _, name in obj.relocations} - object_exports(obj)
+
+
+def encode_object(obj: ObjectFile) -> bytes:
+    header = json.dumps({
+        "version": ASSEMBLER_VERSION,
+        "config": obj.config,
+        "data_size": obj.data_size,
+        "variables": obj.variables,
+        "labels": obj.labels,
+        "relocations": obj.relocations
+    }).encode()
+    return OBJECT_MAGIC + U32.pack(len(header)) + header + obj.code
+
+
+def decode_object(encoded: bytes) -> ObjectFile:
+    if encoded[:len(OBJECT_MAGIC)] != OBJECT_MAGIC:
+        raise ValueError("Not an object file")
+    header_length, = U32.unpack_from(encoded, len(OBJECT_MAGIC))
+    header_start = len(OBJECT_MAGIC) + 4
+    header = json.loads(encoded[header_start: header_start + header_length].decode())
+    if header["version"] != ASSEMBLER_VERSION:
+        raise ValueError("Object file is from assembler version {}".format(header["version"]))
+
+    return ObjectFile(header["config"], bytes(encoded[header_start + header_length:]), header["data_size"],
+                      [tuple(variable) for variable in header["variables"]], header["labels"],
+                      [tuple(relocation) for relocation in header["relocations"]])
+
+
+def link(objects: list, container=False) -> Assembled:
+    """
+    Put objects together into one program, returning an Assembled like assembler.assemble() does. The bytecode is
+    a v2 container (with a symbol table) if container is set.
+    """
+    # Work out where each object's data and text sections go
+    data_total = sum(obj.data_size for obj in objects)
+    code_size = data_total + sum(len(obj.code) - obj.data_size for obj in objects)
+    data_bases = []
+    text_bases = []
+    data_base = 0
+    text_base = data_total
+    for obj in objects:
+        data_bases.append(data_base)
+        text_bases.append(text_base - obj.data_size)    # So that an offset into obj.code can be added to it
+        data_base += obj.data_size
+        text_base += len(obj.code) - obj.data_size
+
+    # Give every name its address. Within an object a label hides a variable of the same name, as it does when a
+    # single file is assembled.
+    config_dict = META_CONFIG_DEFAULT.copy()
+    config_owners = {}
+    symbols = {}
+    kinds = {}
+    var_address = code_size
+    for i, obj in enumerate(objects):
+        local = {}
+        for name, dtype in obj.variables:
+            local[name] = (var_address, SYMBOL_VARIABLE)
+            var_address += DTYPE_META[dtype].size
+        for name, offset in obj.labels.items():
+            local[name] = (text_bases[i] + offset, SYMBOL_LABEL)
+
+        for name, (address, kind) in local.items():
+            if name in symbols:
+                raise AssemblyError(-1, "{} is defined in objects {} and {}".format(name, kinds[name][1], i))
+            symbols[name] = address
+            kinds[name] = (kind, i)
+
+        for item, value in obj.config.items():
+            if item in config_owners and config_dict[item] != value:
+                raise AssemblyError(-1, "Objects {} and {} set {} differently".format(config_owners[item], i, item))
+            config_dict[item] = value
+            config_owners[item] = i
+
+    # Copy in the code and fill in the addresses
+    code = bytearray(code_size)
+    for i, obj in enumerate(objects):
+        code[data_bases[i]: data_bases[i] + obj.data_size] = obj.code[:obj.data_size]
+        code[text_bases[i] + obj.data_size: text_bases[i] + len(obj.code)] = obj.code[obj.data_size:]
+        for offset, name in obj.relocations:
+            if name not in symbols:
+                raise AssemblyError(-1, "{} is used in object {} but never defined".format(name, i))
+            base = data_bases[i] if offset < obj.data_size else text_bases[i]
+            U32.pack_into(code, base + offset, symbols[name])
+
+    if container:
+        bytecode = encode_container(config_dict, code, {name: (symbols[name], kinds[name][0]) for name in symbols})
+    else:
+        bytecode = encode_metadata(config_dict) + code
+    return Assembled(bytes(bytecode), symbols, config_dict)
+
+
+def object_path(source_path: str) -> str:
+    return os.path.splitext(source_path)[0] + ".o"
+
+
+def compile_file(source_path: str) -> str:
+    """Assemble a source file into an object file next to it, and return the object file's path."""
+    with open(source_path, "rt") as file:
+        obj = assemble_object(file)
+    path = object_path(source_path)
+    with open(path, "wb") as file:
+        file.write(encode_object(obj))
+    return path
+
+
+def load_object(path: str) -> ObjectFile:
+    with open(path, "rb") as file:
+        return decode_object(file.read())
+
+
+def build(source_paths: list, container=False) -> (Assembled, list):
+    """
+    Link the source files together, reassembling only those which are newer than their object file (or which have
+    no usable one). Returns the linked program and the paths which were reassembled.
+    """
+    objects = []
+    rebuilt = []
+    for source_path in source_paths:
+        path = object_path(source_path)
+        obj = None
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source_path):
+            try:
+                obj = load_object(path)
+            except ValueError:
+                pass    # From another version of the assembler, or not an object file; make it again
+        if obj is None:
+            compile_file(source_path)
+            obj = load_object(path)
+            rebuilt.append(source_path)
+        objects.append(obj)
+    return link(objects, container), rebuilt
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    arg_parser = ArgumentParser(description="Assemble files separately and link them together")
+    arg_parser.add_argument("command", choices=["compile", "link", "build"])
+    arg_parser.add_argument("files", nargs="+", help="source files (compile and build) or object files (link)")
+    arg_parser.add_argument("-o", "--output", help="the file to write the linked program to")
+    arg_parser.add_argument("--container", action="store_true", help="link into a v2 container")
+    args = arg_parser.parse_args()
+
+    if args.command == "compile":
+        for source in args.files:
+            print(compile_file(source))
+        sys.exit(0)
+
+    if args.output is None:
+        arg_parser.error("link and build need an output file (-o)")
+
+    if args.command == "link":
+        program = link([load_object(path) for path in args.files], args.container)
+    else:
+        program, rebuilt = build(args.files, args.container)
+        print("Reassembled {} of {} files".format(len(rebuilt), len(args.files)))
+
+    with open(args.output, "wb") as file:
+        file.write(program.bytecode)
@@ -0,0 +1,311 @@
+"""
+Recovers assembly source from bytecode, so that existing bytecode can be read, patched or optimised like any other
+program. Assembling the recovered source again (with the flags it asks for at the end) gives back the same bytes.
+
+Addresses are turned back into names. A container's symbol table gives the real names; anything else is named after
+its address, L<address> for a label and V<address> for a variable. Every address used as an operand goes into an
+AddressIndex, a sorted array searched with a binary search, so recovery is O(n log n) in the size of the code.
+
+Variables come from the MOVs which set them at the start of the code or, in images with raw data, from the data
+image. An immediate value is written as whichever number the assembler would encode into the same bytes, preferring
+the value of the instruction's type (so a char is written as -56 rather than 200, which gives the same bytes), and a
+float as the shortest number which packs into the same bits. If a container has a line table, each instruction is
+put back on its line, with the meta section moved to the end to leave room; the assembler doesn't mind what order
+the sections are in.
+"""
+
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+import math
+import struct
+
+from assembler import OPCODES, DTYPE_META, SECTION_META, SYMBOL_VARIABLE, META_DATA_SIZE, META_BSS_SIZE, \
+    STRUCTS, DataInstruction, ImmediateOperand, classify_operand, container_section, data_value_bytes, read_image
+from disassemble import ARITHMETIC_FORMATS, OPERAND_LENGTHS, REGISTER_NAMES, format_instruction, instruction_code, \
+    iter_code
+
+# The type of variable written for each size. Four bytes could also be a float; see value_candidates().
+SIZE_DTYPES = {1: "uchar", 2: "ushort", 4: "uint"}
+
+# The opcodes of the MOVs which set variables, and the size of variable each sets
+DATA_MOV_SIZES = {OPCODES["MOV_1B"]: 1, OPCODES["MOV_2B"]: 2, OPCODES["MOV_4B"]: 4}
+
+# A MOV setting a variable has a memory address, then a 1, 2 or 4 byte immediate
+DATA_MOV_OPERANDS = (0x52, 0x53, 0x54)
+
+# The numbers which can be part of an arithmetic operand
+ARITHMETIC_NUMBERS = (1, 2, 4, 8)
+
+# A variable: where it is, its type and the text of its initial value. line is its source line, if known.
+Variable = namedtuple("Variable", ["address", "dtype", "value", "line"])
+
+# The result of recover_source(): the text of the program, and the flags it needs to be assembled with
+Recovered = namedtuple("Recovered", ["text", "container", "raw_data"])
+
+
+class AddressIndex:
+    """
+    The name of each address, kept as a sorted array of addresses with a binary search, so looking one up is
+    O(log n).
+    """
+
+    def __init__(self, names: dict):
+        self.addresses = array("I", sorted(names))
+        self.names = [names[address] for address in self.addresses]
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def __contains__(self, address: int) -> bool:
+        return self.name_of(address) is not None
+
+    def name_of(self, address: int):
+        """The name of address, or None if it doesn't have one."""
+        i = bisect_left(self.addresses, address)
+        if i < len(self.addresses) and self.addresses[i] == address:
+            return self.names[i]
+        return None
+
+
+def meta_items(bytecode, image) -> list:
+    """
+    The (key, value) pairs of the metadata, as the text they were written as (read_image() turns the values into
+    ints, which wouldn't give back the same bytes if they were written differently).
+    """
+    if image.version == 1:
+        metadata = bytes(bytecode[:image.code_offset - 4])
+    else:
+        offset, length = container_section(bytecode, SECTION_META)
+        metadata = bytes(bytecode[offset: offset + length])
+    return [tuple(pair.split("=")) for pair in metadata.decode().split("&") if pair]
+
+
+def float_text(raw: bytes):
+    """
+    The shortest text of a float which packs into the 4 bytes raw, written so that the assembler sees a float, or None
+    if it isn't finite.
+    """
+    value = STRUCTS[">f"].unpack(raw)[0]
+    if not math.isfinite(value):
+        return None
+    for precision in range(1, 10):
+        text = "{:.{}g}".format(value, precision)
+        if STRUCTS[">f"].pack(float(text)) == raw:
+            break
+    return text if "." in text or "e" in text else text + ".0"
+
+
+def value_candidates(size: int, raw: bytes) -> list:
+    """
+    The (type, value text) pairs which could have given the raw bytes of the value of a variable of the given size,
+    most readable first. A 4 byte value is written as a float if that is shorter than writing it as an int.
+    """
+    unsigned = int.from_bytes(raw, "big")
+    candidates = [(SIZE_DTYPES[size], str(unsigned))]
+    text = float_text(raw) if size == 4 and len(raw) == 4 else None
+    if text is not None:
+        candidates.insert(0 if len(text) < len(str(unsigned)) else 1, ("float", text))
+    return candidates
+
+
+def data_mov_variable(code: memoryview, record, address: int):
+    """The Variable set by record if it is a MOV setting the variable at address, or else None."""
+    size = DATA_MOV_SIZES.get(record.opcode)
+    if size is None or record.operands not in DATA_MOV_OPERANDS or record.field1 != address:
+        return None
+
+    value_start = record.start_byte + 6
+    raw = bytes(code[value_start: value_start + OPERAND_LENGTHS[record.operands & 0x0F]])
+    for dtype, value in value_candidates(size, raw):
+        variable = DataInstruction(0, "", value, dtype)
+        if variable.get_opcode_num() == record.opcode and variable.get_operand_byte() == record.operands and \
+                variable.get_op2_bytes(None) == raw:
+            return Variable(address, dtype, value, None)
+    return None
+
+
+def raw_data_variables(data: bytes, bss_size: int, start: int, boundaries) -> list:
+    """
+    Split the data image (at address start) and the zeroed memory after it into variables, with one starting at each
+    of the boundaries. Where nothing says where a variable starts, the largest that fits are used.
+    """
+    end = start + len(data) + bss_size
+    edges = sorted({address for address in boundaries if start <= address < end} | {start, start + len(data), end})
+
+    variables = []
+    for edge, next_edge in zip(edges, edges[1:]):
+        address = edge
+        while address < next_edge:
+            size = next(size for size in (4, 2, 1) if address + size <= next_edge)
+            raw = data[address - start: address - start + size] if address < start + len(data) else bytes(size)
+            variables.append(Variable(address, *raw_data_value(raw, address < start + len(data)), None))
+            address += size
+    return variables
+
+
+def raw_data_value(raw: bytes, in_image: bool) -> (str, str):
+    """The (type, value text) of a variable in the data image (or the zeroed memory after it) with the given bytes."""
+    # The data image only holds variables which don't start at zero
+    if in_image != any(raw):
+        raise ValueError("A variable in the data image starts at zero, so would be moved after it")
+    for dtype, value in value_candidates(len(raw), raw):
+        if data_value_bytes(DataInstruction(0, "", value, dtype)) == raw:
+            return dtype, value
+    raise ValueError("No variable starts with the bytes {}".format(raw.hex()))
+
+
+def immediate_text(kind: int, raw: bytes, typed) -> str:
+    """
+    The text of an immediate which the assembler would encode as the given kind of operand with the given bytes.
+    typed is its value as the instruction's type, which is used if it works.
+    """
+    unsigned = int.from_bytes(raw, "big")
+    candidates = [str(unsigned), str(unsigned - (1 << (8 * len(raw))))]
+    if len(raw) == 4:
+        candidates.insert(0 if isinstance(typed, float) else 2, float_text(raw))
+    if isinstance(typed, int):
+        candidates.insert(0, str(typed))
+
+    for text in candidates:
+        token = classify_operand(text) if text is not None else None
+        if token is None or token.kind != "immediate":
+            continue
+        operand = ImmediateOperand(token.a)
+        try:
+            if operand.get_bit_designation() == kind and operand.get_bytes() == raw:
+                return text
+        except struct.error:
+            pass    # Too big to encode at all
+    raise ValueError("The immediate {} can't be written so that it gives the same bytes".format(raw.hex()))
+
+
+def arithmetic_text(kind: int, raw: bytes) -> str:
+    parts = []
+    for part in raw:
+        if part in REGISTER_NAMES:
+            parts.append(REGISTER_NAMES[part])
+        elif part in ARITHMETIC_NUMBERS:
+            parts.append(str(part))
+        else:
+            raise ValueError("{} can't be part of an arithmetic operand".format(part))
+    return ARITHMETIC_FORMATS[kind].format(*parts)
+
+
+def instruction_source(code: memoryview, record, index: AddressIndex) -> str:
+    """The line of source which assembles into the instruction record."""
+    kinds = record.kinds
+    if kinds[0] == 0 and kinds[1] != 0:
+        raise ValueError("The instruction at byte {} has a second operand but no first".format(record.start_byte))
+
+    formatted = format_instruction(record)
+    parts = [record.mnemonic] + ([record.dtype] if record.dtype else [])
+    offset = record.start_byte + 2
+    for kind, field, typed in zip(kinds, (record.field1, record.field2), (formatted.op1, formatted.op2)):
+        raw = bytes(code[offset: offset + OPERAND_LENGTHS[kind]])
+        offset += OPERAND_LENGTHS[kind]
+        if kind == 0:
+            continue
+        elif kind == 1:
+            parts.append(REGISTER_NAMES[field])
+        elif kind <= 4:
+            parts.append(immediate_text(kind, raw, typed))
+        elif kind == 5:
+            parts.append(index.name_of(field))
+        else:
+            parts.append(arithmetic_text(kind, raw))
+
+    label = index.name_of(record.start_byte)
+    return " ".join(([label] if label is not None else []) + parts)
+
+
+def name_addresses(symbols, referenced: set, variables: list, text_starts: array) -> AddressIndex:
+    """
+    Name every variable, every symbol and every address used as an operand, checking that each is a variable or the
+    start of an instruction. Addresses without a symbol are named after themselves.
+    """
+    var_addresses = {variable.address for variable in variables}
+    names = {address: name for name, (address, _) in (symbols or {}).items()}
+
+    taken = set(names.values())
+    for address in sorted(referenced | var_addresses):
+        if address not in names:
+            name = ("V{}" if address in var_addresses else "L{}").format(address)
+            while name in taken:
+                name += "_"
+            names[address] = name
+            taken.add(name)
+
+    for address in names:
+        i = bisect_left(text_starts, address)
+        if address not in var_addresses and (i == len(text_starts) or text_starts[i] != address):
+            raise ValueError("Address {} is neither the start of an instruction nor of a variable".format(address))
+    return AddressIndex(names)
+
+
+def arrange_lines(meta: list, data: list, text: list, trailer: list) -> list:
+    """
+    Put the sections together. data and text are lists of (source line, line) pairs; if any source line is known,
+    each line is put back on its source line, and the meta section goes at the end so as not to be in the way.
+    """
+    if all(line_no is None for line_no, _ in data + text):
+        return ["section.meta"] + meta + ["section.data"] + [line for _, line in data] + \
+            ["section.text"] + [line for _, line in text] + trailer
+
+    lines = []
+    for header, section in (("section.data", data), ("section.text", text)):
+        lines.append(header)
+        for line_no, line in section:
+            if line_no is not None:
+                if line_no <= len(lines):
+                    raise ValueError("Line {} of the line table can't be kept".format(line_no))
+                lines.extend([""] * (line_no - 1 - len(lines)))
+            lines.append(line)
+    return lines + ["section.meta"] + meta + trailer
+
+
+def recover_source(bytecode) -> Recovered:
+    """
+    Recover the source of bytecode (in either format). Raises ValueError if it couldn't have come from the
+    assembler, or can't be written so that it assembles into the same bytes.
+    """
+    image = read_image(bytecode)
+    code = instruction_code(image)
+    code_length = len(code)
+    raw_data = META_DATA_SIZE in image.config
+    records = list(iter_code(code))
+    line_of = dict(image.lines or ())
+
+    # The MOVs at the start set the variables, unless they are in a data image
+    variables = []
+    if not raw_data:
+        address = code_length
+        for record in records:
+            variable = data_mov_variable(code, record, address)
+            if variable is None:
+                break
+            variables.append(variable._replace(line=line_of.get(record.start_byte)))
+            address += DTYPE_META[variable.dtype].size
+    text_records = records[len(variables):]
+
+    # Every address used as an operand, kept sorted like the instructions' start bytes
+    referenced = {field for record in text_records
+                  for kind, field in zip(record.kinds, (record.field1, record.field2)) if kind == 5}
+    if raw_data:
+        boundaries = referenced | {address for address, kind in (image.symbols or {}).values()
+                                   if kind == SYMBOL_VARIABLE}
+        variables = raw_data_variables(bytes(image.code[code_length:]), image.config[META_BSS_SIZE], code_length,
+                                       boundaries)
+    text_starts = array("I", (record.start_byte for record in text_records))
+    index = name_addresses(image.symbols, referenced, variables, text_starts)
+
+    meta = ["{}={}".format(key, value) for key, value in meta_items(bytecode, image)
+            if not raw_data or key not in (META_DATA_SIZE, META_BSS_SIZE)]
+    data = [(variable.line, "{} VAR {} {}".format(index.name_of(variable.address), variable.dtype, variable.value))
+            for variable in variables]
+    text = [(line_of.get(record.start_byte), instruction_source(code, record, index)) for record in text_records]
+
+    container = image.version != 1
+    flags = [flag for flag, used in (("--container", container), ("--raw-data", raw_data)) if used]
+    trailer = ["; Assemble with {}".format(" ".join(flags))] if flags else []
+    return Recovered("\n".join(arrange_lines(meta, data, text, trailer)) + "\n", container, raw_data)
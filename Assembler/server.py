@@ -0,0 +1,154 @@
+"""
+A long-running assembler, so that tools like the GUI don't have to start Python, import the assembler and build its
+tables every time they assemble something. The opcode tables and operand cache stay loaded between requests.
+
+Requests and responses are JSON objects, one per line. They are read from stdin (with responses on stdout), or from
+connections to a Unix socket if one is given:
+python server.py [--socket PATH]
+
+A request looks like
+{"id": 1, "path": "prog.asm", "format": "hex", "interactive": false}
+with "text" in place of "path" to send the source itself. format is "hex" (the default) or "list" (a list of ints).
+If interactive is set, each line of the GUI commentary (what assembler_interactive.py would write to asmout.txt) is
+sent back first as
+{"id": 1, "event": "start_text [...]"}
+and the request always finishes with one of
+{"id": 1, "ok": true, "bytecode": "...", "symbols": {...}}
+{"id": 1, "ok": false, "error": "...", "line": -1}
+An interactive request can also give "verbosity" and "max_trace_chars", as for assembler.EventTrace.
+"""
+
+import json
+import os
+import signal
+import socketserver
+import sys
+
+import assembler
+from assembler import AssemblyError, EventTrace, VERBOSITY_BYTES, DEFAULT_TRACE_LIMIT, assemble, contextualise_text, \
+    layout_and_encode
+
+OUTPUT_FORMATS = {
+    "hex": lambda bytecode: bytecode.hex(),
+    "list": list
+}
+
+
+class EventWriter:
+    """The file an EventTrace writes to for an interactive request. Passes on each line written to it."""
+
+    def __init__(self, emit):
+        self.emit = emit
+        self.pending = ""
+
+    def write(self, text: str):
+        lines = (self.pending + text).split("\n")
+        self.pending = lines.pop()
+        for line in lines:
+            self.emit(line)
+        return len(text)
+
+    def flush(self):
+        if self.pending:
+            self.emit(self.pending)
+            self.pending = ""
+
+
+def read_source(request: dict) -> str:
+    if "text" in request:
+        return request["text"]
+    with open(request["path"], "rt") as file:
+        return file.read()
+
+
+def handle_request(request: dict, send):
+    """Carry out one request, passing each response object to send."""
+    request_id = request.get("id")
+    try:
+        output_format = OUTPUT_FORMATS[request.get("format", "hex")]
+        text = read_source(request)
+
+        if request.get("interactive", False):
+            writer = EventWriter(lambda line: send({"id": request_id, "event": line}))
+            events, was_interactive = assembler.EVENTS, assembler.INTERACTIVE_MODE
+            assembler.EVENTS = EventTrace(writer, request.get("verbosity", VERBOSITY_BYTES),
+                                          request.get("max_trace_chars", DEFAULT_TRACE_LIMIT))
+            assembler.INTERACTIVE_MODE = True
+            try:
+                config_dict, instruction_list = contextualise_text(text)
+                bytecode, symbols = layout_and_encode(config_dict, instruction_list)
+            finally:
+                assembler.EVENTS.flush()
+                writer.flush()
+                assembler.EVENTS, assembler.INTERACTIVE_MODE = events, was_interactive
+        else:
+            bytecode, symbols, _ = assemble(text)
+    except AssemblyError as e:
+        send({"id": request_id, "ok": False, "error": e.description, "line": e.line_no})
+    except Exception as e:
+        send({"id": request_id, "ok": False, "error": "{}: {}".format(type(e).__name__, e), "line": -1})
+    else:
+        send({"id": request_id, "ok": True, "bytecode": output_format(bytes(bytecode)), "symbols": symbols})
+
+
+def serve(infile, outfile):
+    """Answer the requests on each line of infile until it ends."""
+    def send(response: dict):
+        outfile.write(json.dumps(response) + "\n")
+        outfile.flush()
+
+    for line in infile:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            send({"id": None, "ok": False, "error": "Bad request: {}".format(e), "line": -1})
+            continue
+        if not isinstance(request, dict):
+            send({"id": None, "ok": False, "error": "Bad request: not an object", "line": -1})
+            continue
+        handle_request(request, send)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        infile = (line.decode() for line in self.rfile)
+        serve(infile, TextSocketWriter(self.wfile))
+
+
+class TextSocketWriter:
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text: str):
+        self.wfile.write(text.encode())
+
+    def flush(self):
+        self.wfile.flush()
+
+
+def serve_socket(path: str):
+    """Answer requests on a Unix socket at path, one connection at a time, until interrupted."""
+    if os.path.exists(path):
+        os.remove(path)
+    with socketserver.UnixStreamServer(path, RequestHandler) as server:
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    arg_parser = ArgumentParser(description="Assemble programs sent as JSON lines, without restarting each time")
+    arg_parser.add_argument("--socket", help="listen on a Unix socket at this path instead of using stdin/stdout")
+    args = arg_parser.parse_args()
+
+    if args.socket is not None:
+        # Make sure the socket file is cleaned up when the server is stopped
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        serve_socket(args.socket)
+    else:
+        serve(sys.stdin, sys.stdout)
@@ -50,4 +50,19 @@ section.text
 MOV eax i
 MOV ebx x"""
 
-        self.assertEqual(normalise_text(text), normalised)
\ No newline at end of file
+        self.assertEqual(normalise_text(text), normalised)
+
+
+class Test_iter_normalised_lines(unittest.TestCase):
+    def test_A120(self):
+        self.assertEqual(list(iter_normalised_lines([" ", "\n", "\t", "; Comment"])), [])
+
+    def test_A121(self):
+        lines = ["  section.data ; A section\n", "i VAR ubyte \t 0\n", "\n", "   MOV ebx  x"]
+        self.assertEqual(list(iter_normalised_lines(lines)), ["section.data", "i VAR ubyte 0", "MOV ebx x"])
+
+    def test_A122(self):
+        text = """MOV   eax [ebx] ; Comment
+
+   ADD \t ecx  5"""
+        self.assertEqual(list(iter_normalised_lines(text.split("\n"))), normalise_text(text).split("\n"))
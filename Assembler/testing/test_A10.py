@@ -0,0 +1,72 @@
+import io
+import os
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import assembler
+from assembler import *
+
+FIBONACCI = os.path.join(os.path.dirname(__file__), "fibonacci.asm")
+
+
+class Test_assemble(unittest.TestCase):
+    def setUp(self):
+        with open(FIBONACCI) as file:
+            self.text = file.read()
+
+    def test_A1001(self):
+        # The same bytes as the command line assembler, without anything being printed
+        output = io.StringIO()
+        with redirect_stdout(output):
+            result = assemble(self.text)
+            expected = main(FIBONACCI, "return")
+        self.assertEqual(output.getvalue(), "")
+        self.assertIsInstance(result.bytecode, bytes)
+        self.assertEqual(result.bytecode, expected)
+
+    def test_A1002(self):
+        result = assemble(self.text)
+        self.assertEqual(set(result.symbols), {"temp", "i", "loop"})
+        self.assertEqual(result.symbols, record_labels_and_variables(
+            contextualise_lines(self.text.split("\n"))[1]))
+        self.assertEqual(result.config["mem_amt"], "2")
+
+    def test_A1003(self):
+        self.assertEqual(assemble(self.text.split("\n")), assemble(self.text))
+        self.assertEqual(assemble_file(FIBONACCI), assemble(self.text))
+
+    def test_A1004(self):
+        # Even if the GUI's mode was left on, nothing is printed
+        output = io.StringIO()
+        assembler.INTERACTIVE_MODE = True
+        try:
+            with redirect_stdout(output):
+                assemble(self.text)
+            self.assertTrue(assembler.INTERACTIVE_MODE)
+        finally:
+            assembler.INTERACTIVE_MODE = False
+        self.assertEqual(output.getvalue(), "")
+
+    def test_A1005(self):
+        with self.assertRaises(AssemblyError):
+            assemble("section.meta\nsection.data\nsection.text\nFOO int eax 1\n")
+
+    def test_A1006(self):
+        # main(..., "return") hands back the encoder's own buffer, without copying it
+        buffers = []
+
+        def keep_buffer(*args, **kwargs):
+            result = layout_and_encode(*args, **kwargs)
+            buffers.append(result[0])
+            return result
+
+        with mock.patch.object(assembler, "layout_and_encode", keep_buffer):
+            returned = main(FIBONACCI, "return")
+        self.assertIs(returned, buffers[0])
+        self.assertIsInstance(returned, bytearray)
+        self.assertEqual(returned, assemble_file(FIBONACCI).bytecode)
+
+
+if __name__ == '__main__':
+    unittest.main()
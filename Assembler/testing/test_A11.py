@@ -0,0 +1,57 @@
+import os
+import pickle
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+from assembler import *
+from batch import assemble_many, assemble_path, describe_throughput
+
+HERE = os.path.dirname(__file__)
+GOOD = [os.path.join(HERE, "fibonacci.asm")]
+BAD = [os.path.join(HERE, "for_normalisation1.asm"), os.path.join(HERE, "for_section_split1.asm")]
+
+
+class Test_assemble_many(unittest.TestCase):
+    def test_A1101(self):
+        error = pickle.loads(pickle.dumps(AssemblyError(3, "Bad line")))
+        self.assertEqual((error.line_no, error.description), (3, "Bad line"))
+        self.assertEqual(str(error), "Error on line 3: Bad line")
+
+    def test_A1102(self):
+        result = assemble_path(GOOD[0])
+        self.assertIsNone(result.error)
+        self.assertEqual(result.bytecode, assemble_file(GOOD[0]).bytecode)
+        self.assertEqual(result.source_size, os.path.getsize(GOOD[0]))
+
+        for path in BAD:
+            with self.subTest(path=path):
+                self.assertIsInstance(assemble_path(path).error, AssemblyError)
+
+    def test_A1103(self):
+        paths = GOOD * 5 + BAD
+        serial = assemble_many(paths, workers=1)
+        parallel = assemble_many(paths, workers=2)
+        self.assertEqual([result.path for result in parallel.results], paths)
+        self.assertEqual([result.bytecode for result in parallel.results],
+                         [result.bytecode for result in serial.results])
+        self.assertEqual([str(result.error) for result in parallel.results],
+                         [str(result.error) for result in serial.results])
+        self.assertEqual(parallel.bytes_out, 5 * len(assemble_file(GOOD[0]).bytecode))
+        self.assertIn("7 files (2 failed, 0 cached)", describe_throughput(parallel))
+
+    def test_A1104(self):
+        # The same pool can be used for more than one batch
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            for _ in range(2):
+                report = assemble_many(GOOD * 3, executor=pool)
+                self.assertTrue(all(result.error is None for result in report.results))
+
+    def test_A1105(self):
+        with tempfile.TemporaryDirectory() as directory:
+            missing = os.path.join(directory, "missing.asm")
+            self.assertIsNotNone(assemble_many([missing], workers=1).results[0].error)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+
+from assembler import *
+from cache import AssemblyCache, cache_key, decode_entry, encode_entry
+
+with open(os.path.join(os.path.dirname(__file__), "fibonacci.asm")) as _file:
+    FIBONACCI = _file.read()
+
+
+class Test_AssemblyCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = AssemblyCache(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_A1201(self):
+        # Comments and spacing don't change the key, but the code does
+        key = cache_key(FIBONACCI.split("\n"))
+        self.assertEqual(cache_key((FIBONACCI + "\n; a comment\n").replace(" ", "  ").split("\n")), key)
+        self.assertNotEqual(cache_key(FIBONACCI.replace("40", "41").split("\n")), key)
+
+    def test_A1202(self):
+        assembled = assemble(FIBONACCI)
+        self.assertEqual(decode_entry(encode_entry(assembled)), assembled)
+
+    def test_A1203(self):
+        first = self.cache.assemble(FIBONACCI)
+        second = self.cache.assemble(FIBONACCI + "\n; edited\n")
+        self.assertEqual(first, assemble(FIBONACCI))
+        self.assertEqual(second, first)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        # A new object sees what the first one stored
+        other = AssemblyCache(self.directory.name)
+        other.assemble(FIBONACCI)
+        self.assertEqual((other.hits, other.misses), (1, 0))
+
+    def test_A1204(self):
+        key = cache_key(FIBONACCI.split("\n"))
+        self.cache.assemble(FIBONACCI)
+        # A bad header, no entry at all and too little of one for the header's length
+        for entry in (b"\x00\x00\x00\x09{broken", b"", b"\x00\x00"):
+            with self.subTest(entry=entry):
+                with open(self.cache.path_for(key), "wb") as file:
+                    file.write(entry)
+                self.assertIsNone(self.cache.get(key))
+                self.assertEqual(self.cache.assemble(FIBONACCI), assemble(FIBONACCI))
+
+    def test_A1205(self):
+        def key(i):
+            return cache_key(FIBONACCI.replace("40", str(i)).split("\n"))
+
+        entry_size = len(encode_entry(assemble(FIBONACCI)))
+        cache = AssemblyCache(self.directory.name, max_bytes=entry_size * 2)
+        for i in range(3):
+            cache.assemble(FIBONACCI.replace("40", str(i)))
+            os.utime(cache.path_for(key(i)), (i, i))
+        self.assertEqual(cache.evictions, 1)
+        self.assertIsNone(cache.get(key(0)))
+
+        # Using entry 1 makes it more recent than entry 2, so entry 2 is the one to go next
+        self.assertIsNotNone(cache.get(key(1)))
+        cache.assemble(FIBONACCI.replace("40", "3"))
+        self.assertEqual(set(os.listdir(self.directory.name)),
+                         {os.path.basename(cache.path_for(key(i))) for i in (1, 3)})
+
+
+if __name__ == '__main__':
+    unittest.main()
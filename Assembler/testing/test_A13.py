@@ -0,0 +1,64 @@
+import io
+import json
+import os
+import unittest
+
+import assembler
+from assembler import *
+from server import EventWriter, serve
+
+FIBONACCI = os.path.join(os.path.dirname(__file__), "fibonacci.asm")
+
+
+def run_server(*requests):
+    """Send each request (a dict, or a raw line) to the server and return what it sent back."""
+    lines = [request if isinstance(request, str) else json.dumps(request) for request in requests]
+    outfile = io.StringIO()
+    serve(io.StringIO("\n".join(lines) + "\n"), outfile)
+    return [json.loads(line) for line in outfile.getvalue().splitlines()]
+
+
+class Test_server(unittest.TestCase):
+    def test_A1301(self):
+        lines = []
+        writer = EventWriter(lines.append)
+        writer.write("first ")
+        writer.write("event\nsecond\nthi")
+        self.assertEqual(lines, ["first event", "second"])
+        writer.flush()
+        self.assertEqual(lines, ["first event", "second", "thi"])
+
+    def test_A1302(self):
+        with open(FIBONACCI) as file:
+            text = file.read()
+        responses = run_server({"id": 1, "path": FIBONACCI}, {"id": 2, "text": text, "format": "list"})
+        expected = assemble_file(FIBONACCI)
+        self.assertEqual(responses, [
+            {"id": 1, "ok": True, "bytecode": expected.bytecode.hex(), "symbols": expected.symbols},
+            {"id": 2, "ok": True, "bytecode": list(expected.bytecode), "symbols": expected.symbols}
+        ])
+
+    def test_A1303(self):
+        previous = assembler.EVENTS
+        responses = run_server({"id": 7, "path": FIBONACCI, "interactive": True})
+        # Whatever was receiving events before is put back
+        self.assertIs(assembler.EVENTS, previous)
+        events = [response["event"] for response in responses[:-1]]
+        self.assertEqual(events[0].split(" ")[0], "start_text")
+        self.assertEqual(events[-1], "end " + json.dumps({"length": len(assemble_file(FIBONACCI).bytecode)}))
+        self.assertTrue(all(response["id"] == 7 for response in responses))
+        self.assertTrue(responses[-1]["ok"])
+        self.assertFalse(assembler.INTERACTIVE_MODE)
+
+    def test_A1304(self):
+        responses = run_server("not json", "[1]", "",
+                               {"id": 3, "text": "section.data\nsection.text"},
+                               {"id": 4, "path": FIBONACCI, "format": "octal"},
+                               {"id": 5, "path": FIBONACCI})
+        self.assertEqual([response["id"] for response in responses], [None, None, 3, 4, 5])
+        self.assertEqual([response["ok"] for response in responses], [False, False, False, False, True])
+        self.assertEqual(responses[2]["error"], "No meta section")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import io
+import json
+import unittest
+
+import assembler
+from assembler import *
+
+
+def apply_line_changes(lines, edits):
+    """What the GUI does with the edits from describe_line_changes()."""
+    lines = list(lines)
+    for start, count, inserted in edits:
+        lines[start:start + count] = inserted
+    return lines
+
+
+class Test_describe_line_changes(unittest.TestCase):
+    def test_A1401(self):
+        old = ["a", "b ;c", "d", "e;f", "g;"]
+        new = ["a", "b ", "d", "e", "g"]
+        edits = describe_line_changes(old, new)
+        self.assertEqual(edits, [[3, 2, ["e", "g"]], [1, 1, ["b "]]])
+        self.assertEqual(apply_line_changes(old, edits), new)
+
+    def test_A1402(self):
+        old = ["", "a", "", "", "b", ""]
+        new = ["a", "b"]
+        edits = describe_line_changes(old, new)
+        self.assertEqual(edits, [[5, 1, []], [2, 2, []], [0, 1, []]])
+        self.assertEqual(apply_line_changes(old, edits), new)
+
+    def test_A1403(self):
+        self.assertEqual(describe_line_changes(["a", "b"], ["a", "b"]), [])
+
+    def test_A1404(self):
+        lines = ["section.meta", "mem_amt=2", "section.text", "HLT", "HLT", "section.data"]
+        self.assertEqual(describe_sections(lines), [[1, 2], [6, 6], [3, 5]])
+
+
+class Test_EventTrace(unittest.TestCase):
+    def test_A1410(self):
+        file = io.StringIO()
+        trace = EventTrace(file, buffer_size=1000)
+        trace.emit("start_proc_meta")
+        trace.emit("read_meta_line", ["mem_amt=2"])
+        self.assertEqual(file.getvalue(), "")
+        trace.flush()
+        self.assertEqual(file.getvalue(), 'start_proc_meta\nread_meta_line ["mem_amt=2"]\n')
+
+    def test_A1411(self):
+        file = io.StringIO()
+        trace = EventTrace(file, verbosity=VERBOSITY_STAGES)
+        trace.emit("start_proc_text")
+        trace.emit("read_text_line", ["HLT"])
+        trace.emit("conv_instr", [0, 0, [], [], 14])
+        trace.flush()
+        self.assertEqual(file.getvalue(), "start_proc_text\n")
+
+    def test_A1412(self):
+        file = io.StringIO()
+        trace = EventTrace(file, max_chars=40, buffer_size=0)
+        for _ in range(10):
+            trace.emit("read_text_line", ["HLT"])
+        trace.emit("end", {"length": 20})
+        self.assertEqual(file.getvalue().splitlines(),
+                         ['read_text_line ["HLT"]', 'truncated [9]', 'end {"length": 20}'])
+
+    def test_A1413(self):
+        # The whole commentary for a program, with the text rebuilt from the edits as the GUI does it
+        text = "; comment\nsection.meta\n\nsection.data\nx VAR int   1 ; one\nsection.text\nstart  MOV int eax x\nJMP start"
+        file = io.StringIO()
+        assembler.EVENTS = EventTrace(file)
+        assembler.INTERACTIVE_MODE = True
+        try:
+            bytecode, _ = layout_and_encode(*contextualise_text(text))
+        finally:
+            assembler.EVENTS.flush()
+            assembler.INTERACTIVE_MODE = False
+            assembler.EVENTS = EventTrace(buffer_size=0)
+
+        events = [line.split(" ", 1) for line in file.getvalue().splitlines()]
+        payloads = {event[0]: json.loads(event[1]) for event in events if len(event) > 1}
+        lines = text.split("\n")
+        for step in ("remove_comments", "remove_empty_lines", "remove_dup_wspace"):
+            lines = apply_line_changes(lines, payloads[step])
+        self.assertEqual(lines, normalise_text(text).split("\n"))
+        self.assertEqual(["\n".join(lines[start:end]) for start, end in payloads["split"]],
+                         ["", "x VAR int 1", "start MOV int eax x\nJMP start"])
+        self.assertEqual(payloads["found_var"], ["x", 0, "int"])
+        self.assertEqual(payloads["end"], {"length": len(bytecode)})
+        self.assertEqual(bytecode, assemble(text).bytecode)
+
+    def test_A1414(self):
+        # Once one event has been dropped, smaller ones after it are too, or the edits that are kept wouldn't apply
+        file = io.StringIO()
+        trace = EventTrace(file, max_chars=40, buffer_size=0)
+        trace.emit("remove_comments", [[0, 1, ["x" * 30]]])
+        trace.emit("remove_empty_lines", [[2, 1, []]])
+        trace.emit("end", {"length": 0})
+        self.assertEqual(file.getvalue().splitlines(), ['truncated [2]', 'end {"length": 0}'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import io
+import mmap
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from assembler import *
+from disassemble import dis
+
+FIBONACCI = os.path.join(os.path.dirname(__file__), "fibonacci.asm")
+
+
+class Test_container(unittest.TestCase):
+    def setUp(self):
+        self.plain = assemble_file(FIBONACCI)
+        self.container = assemble_file(FIBONACCI, container=True)
+
+    def test_A1501(self):
+        self.assertTrue(is_container(self.container.bytecode))
+        self.assertFalse(is_container(self.plain.bytecode))
+        self.assertEqual(self.container.symbols, self.plain.symbols)
+
+    def test_A1502(self):
+        plain = read_image(self.plain.bytecode)
+        container = read_image(self.container.bytecode)
+        self.assertEqual((plain.version, container.version), (1, 2))
+        self.assertEqual(plain.config, container.config)
+        self.assertEqual(bytes(plain.code), bytes(container.code))
+        self.assertEqual(bytes(plain.code), self.plain.bytecode[plain.code_offset:])
+        self.assertEqual((plain.symbols, plain.lines), (None, None))
+
+    def test_A1503(self):
+        image = read_image(self.container.bytecode)
+        self.assertEqual(image.symbols, {"temp": (66, SYMBOL_VARIABLE), "i": (70, SYMBOL_VARIABLE),
+                                         "loop": (22, SYMBOL_LABEL)})
+        # Every instruction is on its own line, in order, starting with the data section
+        self.assertEqual(image.lines[:3], [(0, 6), (7, 7), (14, 10)])
+        self.assertEqual(image.entry, 0)
+
+    def test_A1504(self):
+        for name, (address, kind) in read_image(self.container.bytecode).symbols.items():
+            with self.subTest(name=name):
+                self.assertEqual(find_symbol(self.container.bytecode, name), (address, kind))
+        self.assertIsNone(find_symbol(self.container.bytecode, "missing"))
+        self.assertIsNone(find_symbol(encode_container({}, b"\x00\x00"), "loop"))
+
+    def test_A1505(self):
+        # A container can be read straight from a memory-mapped file
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "out.bin")
+            with open(path, "wb") as file:
+                file.write(self.container.bytecode)
+            with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                self.assertEqual(find_symbol(mapped, "loop"), (22, SYMBOL_LABEL))
+                image = read_image(mapped)
+                self.assertEqual(bytes(image.code), bytes(read_image(self.plain.bytecode).code))
+                del image
+
+    def test_A1506(self):
+        outputs = []
+        for bytecode in (self.plain.bytecode, self.container.bytecode):
+            output = io.StringIO()
+            with redirect_stdout(output):
+                dis(bytecode)
+            outputs.append(output.getvalue())
+        plain, container = outputs
+        self.assertIn("loop", container)
+        self.assertEqual(plain.split("Instructions")[1], container.split("Instructions")[1])
+
+    def test_A1507(self):
+        with self.assertRaises(ValueError):
+            container_section(b"ASMB\x00\x09\x00\x04\x00\x00\x00\x00", SECTION_CODE)
+
+
+if __name__ == '__main__':
+    unittest.main()
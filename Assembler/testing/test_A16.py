@@ -0,0 +1,113 @@
+import os
+import tempfile
+import time
+import unittest
+
+from assembler import *
+from linker import assemble_object, build, decode_object, encode_object, link, object_exports, object_imports
+
+MAIN = """section.meta
+mem_amt=2
+section.data
+count VAR int 3
+section.text
+MOV 4B eax count
+JMP helper
+back HLT
+"""
+
+HELPER = """section.meta
+section.data
+total VAR short 300
+flag VAR char 1
+section.text
+helper ADD int eax total
+MOV 1B flag 0
+SUB int count 1
+JMP back
+"""
+
+# What MAIN and HELPER are together, as one file
+COMBINED = """section.meta
+mem_amt=2
+section.data
+count VAR int 3
+total VAR short 300
+flag VAR char 1
+section.text
+MOV 4B eax count
+JMP helper
+back HLT
+helper ADD int eax total
+MOV 1B flag 0
+SUB int count 1
+JMP back
+"""
+
+
+class Test_linker(unittest.TestCase):
+    def test_A1601(self):
+        obj = assemble_object(HELPER)
+        self.assertEqual(object_exports(obj), {"total", "flag", "helper"})
+        self.assertEqual(object_imports(obj), {"count", "back"})
+        self.assertEqual(obj.config, {})
+        self.assertEqual(assemble_object(MAIN).config, {"mem_amt": "2"})
+
+        # Every relocation is a blank address
+        for offset, _ in obj.relocations:
+            self.assertEqual(obj.code[offset: offset + 4], b"\x00\x00\x00\x00")
+
+    def test_A1602(self):
+        obj = assemble_object(HELPER)
+        self.assertEqual(decode_object(encode_object(obj)), obj)
+        with self.assertRaises(ValueError):
+            decode_object(b"ASMB" + encode_object(obj)[4:])
+
+    def test_A1603(self):
+        # A single object links into exactly what assembling it normally gives
+        with open(os.path.join(os.path.dirname(__file__), "fibonacci.asm")) as file:
+            text = file.read()
+        self.assertEqual(link([assemble_object(text)]), assemble(text))
+
+    def test_A1604(self):
+        linked = link([assemble_object(MAIN), assemble_object(HELPER)])
+        self.assertEqual(linked, assemble(COMBINED))
+
+        container = read_image(link([assemble_object(MAIN), assemble_object(HELPER)], container=True).bytecode)
+        self.assertEqual(bytes(container.code), bytes(read_image(linked.bytecode).code))
+        self.assertEqual(container.symbols["helper"], (linked.symbols["helper"], SYMBOL_LABEL))
+
+    def test_A1605(self):
+        with self.assertRaises(AssemblyError):
+            link([assemble_object(HELPER)])     # count and back are never defined
+        with self.assertRaises(AssemblyError):
+            link([assemble_object(MAIN), assemble_object(MAIN)])    # Everything is defined twice
+        with self.assertRaises(AssemblyError):
+            link([assemble_object(MAIN), assemble_object(HELPER.replace("section.meta", "section.meta\nmem_amt=3"))])
+
+    def test_A1606(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for name, text in (("main.asm", MAIN), ("helper.asm", HELPER)):
+                paths.append(os.path.join(directory, name))
+                with open(paths[-1], "w") as file:
+                    file.write(text)
+
+            program, rebuilt = build(paths)
+            self.assertEqual(program, assemble(COMBINED))
+            self.assertEqual(rebuilt, paths)
+
+            program, rebuilt = build(paths)
+            self.assertEqual(rebuilt, [])
+
+            # Only the edited file is assembled again
+            with open(paths[1], "w") as file:
+                file.write(HELPER.replace("flag 0", "flag 2"))
+            os.utime(paths[1], (time.time() + 10, time.time() + 10))
+            program, rebuilt = build(paths)
+            self.assertEqual(rebuilt, [paths[1]])
+            self.assertEqual(program, assemble(COMBINED.replace("flag 0", "flag 2")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+
+from assembler import *
+
+HEADER = """section.meta
+section.data
+x VAR int 5
+section.text
+"""
+
+
+def optimise(text: str):
+    config_dict, instruction_list = contextualise_lines((HEADER + text).split("\n"))
+    return instruction_list, optimise_instructions(instruction_list)
+
+
+def text_lines(instruction_list: list) -> list:
+    return [(i.label, i.opcode_mnemonic, i.operand1, i.operand2) for i in instruction_list
+            if isinstance(i, TextInstruction)]
+
+
+class TestPeephole(unittest.TestCase):
+    def test_A1701_merge_add_sub(self):
+        _, (optimised, hits) = optimise("ADD uint eax 4\nSUB uint eax 1\nADD uint eax 2\nHLT")
+        self.assertEqual(hits["merge_add_sub"], 1)
+        self.assertEqual(text_lines(optimised)[0], ("", "ADD", RegisterOperand("eax"), ImmediateOperand("5")))
+        self.assertEqual(len(optimised), 3)
+
+        # Changes which cancel out go altogether, and different registers are left alone
+        _, (optimised, _) = optimise("SUB uint esp 4\nADD uint esp 4\nADD uint eax 1\nADD uint ebx 1\nHLT")
+        self.assertEqual([line[1] for line in text_lines(optimised)], ["ADD", "ADD", "HLT"])
+
+    def test_A1702_drop_self_mov(self):
+        _, (optimised, hits) = optimise("MOV 4B eax eax\nMOV 4B eax ebx\nHLT")
+        self.assertEqual(hits["drop_self_mov"], 1)
+        self.assertEqual(text_lines(optimised)[0][1:], ("MOV", RegisterOperand("eax"), RegisterOperand("ebx")))
+
+    def test_A1703_push_pop(self):
+        _, (optimised, hits) = optimise("SUB uint esp 4\nMOV 4B [esp] 7\nMOV 4B edx [esp]\nADD uint esp 4\nHLT")
+        self.assertEqual(hits["push_pop"], 1)
+        self.assertEqual(text_lines(optimised), [("", "MOV", RegisterOperand("edx"), ImmediateOperand("7")),
+                                                 ("", "HLT", None, None)])
+
+        # A value moved through esp can't be moved directly
+        _, (optimised, hits) = optimise("SUB uint esp 4\nMOV 4B [esp] esp\nMOV 4B edx [esp]\nADD uint esp 4\nHLT")
+        self.assertEqual(hits["push_pop"], 0)
+        self.assertEqual(len(optimised), 6)
+
+    def test_A1704_jump_to_next(self):
+        _, (optimised, hits) = optimise("JMP next\nnext HLT")
+        self.assertEqual(hits["jump_to_next"], 1)
+        self.assertEqual(text_lines(optimised), [("next", "HLT", None, None)])
+
+    def test_A1705_labels(self):
+        # A label on a removed instruction moves onto the next one
+        _, (optimised, _) = optimise("JMP here\nhere MOV 4B eax eax\nADD int eax 1\nJMP here")
+        self.assertEqual(text_lines(optimised)[0], ("here", "ADD", RegisterOperand("eax"), ImmediateOperand("1")))
+        self.assertEqual(text_lines(optimised)[1][2], AddressOperand("here"))
+
+        # If the next one already has a label, jumps to the removed one are pointed at it instead
+        _, (optimised, _) = optimise("JMP gone\ngone MOV 4B eax eax\nkept HLT")
+        self.assertEqual(text_lines(optimised), [("kept", "HLT", None, None)])
+        _, (optimised, _) = optimise("JE gone\nADD int eax 1\ngone MOV 4B eax eax\nkept HLT")
+        self.assertEqual(text_lines(optimised)[0][2], AddressOperand("kept"))
+
+        # A rule never swallows a labelled instruction after its first
+        _, (_, hits) = optimise("ADD uint eax 1\nmiddle ADD uint eax 1\nJMP middle")
+        self.assertEqual(hits["merge_add_sub"], 0)
+
+    def test_A1706_input_unchanged(self):
+        instruction_list, (optimised, _) = optimise("JMP gone\ngone MOV 4B eax eax\nkept HLT")
+        self.assertEqual(len(instruction_list), 4)
+        self.assertEqual(text_lines(instruction_list)[0][2], AddressOperand("gone"))
+        self.assertEqual([i.instruction_num for i in optimised], list(range(len(optimised))))
+
+    def test_A1707_assemble(self):
+        source = HEADER + "SUB uint esp 4\nMOV 4B [esp] x\nMOV 4B eax [esp]\nADD uint esp 4\nend HLT"
+        plain = assemble(source)
+        optimised = assemble(source, optimise=True)
+        self.assertLess(len(optimised.bytecode), len(plain.bytecode))
+        self.assertEqual(optimised.bytecode, assemble(HEADER + "MOV 4B eax x\nend HLT").bytecode)
+
+        # The table keeps the source lines, so the container's line table still points at the right lines
+        image = read_image(assemble(source, container=True, optimise=True).bytecode)
+        self.assertEqual([line for _, line in image.lines], [3, 5, 9])
+
+
+if __name__ == '__main__':
+    unittest.main()
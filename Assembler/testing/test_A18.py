@@ -0,0 +1,107 @@
+import gc
+import unittest
+
+from assembler import *
+import cfg
+from cfg import UNKNOWN_TARGET, ControlFlowGraph, FlowNode, drop_unreachable, flow_nodes, graph_of, nodes_key
+from disassemble import decode_instructions, flow_nodes_of
+
+HEADER = """section.meta
+section.data
+x VAR int 5
+section.text
+"""
+
+# if (x == 0) { eax = 1 } else { eax = 2 }, then a loop counting ebx down, then a dead block after the HLT
+PROGRAM = HEADER + """CMP int x 0
+JNE other
+MOV 4B eax 1
+JMP join
+other MOV 4B eax 2
+join MOV 4B ebx 3
+loop SUB int ebx 1
+CMP int ebx 0
+JNE loop
+HLT
+MOV 4B eax 9
+JMP join"""
+
+
+def instructions_of(text: str) -> list:
+    return contextualise_lines(text.split("\n"))[1]
+
+
+class TestControlFlowGraph(unittest.TestCase):
+    def test_A1801_blocks(self):
+        graph = graph_of(instructions_of(PROGRAM))
+        self.assertEqual([(block.start, block.end, block.name) for block in graph.blocks],
+                         [(0, 3, None), (3, 5, None), (5, 6, "other"), (6, 7, "join"), (7, 10, "loop"),
+                          (10, 11, None), (11, 13, None)])
+        self.assertEqual([block.successors for block in graph.blocks],
+                         [(1, 2), (3,), (3,), (4,), (4, 5), (), (3,)])
+        self.assertEqual(graph.block_of(8), 4)
+        self.assertEqual(graph.block_named("join"), 3)
+        self.assertEqual(graph.predecessors[3], [1, 2, 6])
+
+    def test_A1802_reachability(self):
+        graph = graph_of(instructions_of(PROGRAM))
+        self.assertEqual(graph.unreachable_blocks(), [6])
+
+        # Using a label's address (other than by jumping to it) makes it reachable
+        graph = graph_of(instructions_of(PROGRAM.replace("MOV 4B eax 9", "dead MOV 4B eax 9")
+                                         .replace("MOV 4B eax 1", "MOV 4B eax dead")))
+        self.assertEqual(graph.unreachable_blocks(), [])
+
+        # A jump to a register could go to any label
+        nodes, _ = flow_nodes(instructions_of(HEADER + "JMP eax\nHLT\nend HLT"))
+        self.assertEqual(nodes[1].target, UNKNOWN_TARGET)
+        self.assertEqual(graph_of(instructions_of(HEADER + "JMP eax\nHLT\nend HLT")).unreachable_blocks(), [1])
+
+    def test_A1803_dominators(self):
+        graph = graph_of(instructions_of(PROGRAM))
+        self.assertEqual(graph.immediate_dominators, [0, 0, 0, 0, 3, 4, None])
+        self.assertEqual(graph.dominators(5), [5, 4, 3, 0])
+        self.assertTrue(graph.dominates(3, 4))
+        self.assertFalse(graph.dominates(1, 3))
+        self.assertEqual(graph.dominators(6), [])
+
+    def test_A1804_cached(self):
+        graph = graph_of(instructions_of(PROGRAM))
+        self.assertIs(graph_of(InstructionTable.from_instructions(instructions_of(PROGRAM))), graph)
+        self.assertIsNot(graph_of(instructions_of(PROGRAM.replace("JNE loop", "JE loop"))), graph)
+
+        # Graphs which nothing holds on to any more aren't kept
+        key = nodes_key(*flow_nodes(instructions_of(PROGRAM)))
+        self.assertIn(key, cfg._graphs)
+        del graph
+        gc.collect()
+        self.assertNotIn(key, cfg._graphs)
+
+    def test_A1805_drop_unreachable(self):
+        instruction_list = instructions_of(PROGRAM)
+        kept, dropped = drop_unreachable(instruction_list)
+        self.assertEqual(dropped, 1)
+        self.assertEqual(kept, instruction_list[:11])
+        self.assertEqual(len(instruction_list), 13)
+
+        optimised = assemble(PROGRAM, optimise=True)
+        self.assertEqual(optimised.bytecode, assemble(PROGRAM.rsplit("\n", 2)[0]).bytecode)
+
+    def test_A1806_bytecode(self):
+        # The graph of the bytecode has the same shape as the graph of the source
+        image = read_image(assemble(PROGRAM).bytecode)
+        decoded = decode_instructions(image.code)
+        nodes, referenced = flow_nodes_of(decoded)
+        self.assertEqual(nodes[6], FlowNode(decoded[6].start_byte, "MOV", None))
+        self.assertEqual(nodes[3], FlowNode(None, "MOV", None))
+        self.assertEqual(nodes[4].target, decoded[6].start_byte)
+
+        graph = graph_of(instructions_of(PROGRAM))
+        from_bytes = ControlFlowGraph(nodes, referenced)
+        self.assertEqual([block.successors for block in from_bytes.blocks],
+                         [block.successors for block in graph.blocks])
+        self.assertEqual(from_bytes.immediate_dominators, graph.immediate_dominators)
+
+
+if __name__ == '__main__':
+    unittest.main()
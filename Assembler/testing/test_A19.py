@@ -0,0 +1,68 @@
+import unittest
+
+from assembler import *
+
+PROGRAM = """section.meta
+mem_amt=1
+section.data
+count VAR int 0
+limit VAR short 300
+flag VAR char 0
+ratio VAR float 1.5
+small VAR char 3
+section.text
+MOV 4B eax limit
+ADD int count 1
+HLT"""
+
+
+class TestRawData(unittest.TestCase):
+    def test_A1901_layout(self):
+        variables = [instruction for instruction in contextualise_lines(PROGRAM.split("\n"))[1]
+                     if isinstance(instruction, DataInstruction)]
+        data_layout = layout_data(variables)
+        # The variables with a value come first, in order, then the ones which start at zero
+        self.assertEqual(data_layout.var_offsets, {"limit": (0, "short"), "ratio": (2, "float"), "small": (6, "char"),
+                                                   "count": (7, "int"), "flag": (11, "char")})
+        self.assertEqual(data_layout.image, b"\x01\x2c" + struct.pack(">f", 1.5) + b"\x03")
+        self.assertEqual(data_layout.bss_size, 5)
+
+    def test_A1902_image(self):
+        assembled = assemble(PROGRAM, raw_data=True)
+        image = read_image(assembled.bytecode)
+        self.assertEqual(image.config, {"mem_amt": 1, META_DATA_SIZE: 7, META_BSS_SIZE: 5})
+
+        # Only the text instructions are code, and the data image goes straight after them
+        code_size = len(image.code) - 7
+        self.assertEqual(bytes(image.code[code_size:]), layout_data([DataInstruction(0, "limit", "300", "short"),
+                                                                     DataInstruction(1, "ratio", "1.5", "float"),
+                                                                     DataInstruction(2, "small", "3", "char")]).image)
+        self.assertEqual(assembled.symbols["limit"], code_size)
+        self.assertEqual(assembled.symbols["count"], code_size + 7)
+        self.assertEqual(bytes(image.code[3:7]), U32.pack(code_size))
+
+    def test_A1903_smaller(self):
+        plain = assemble(PROGRAM.replace("small VAR char 3\n", ""))
+        raw = assemble(PROGRAM.replace("small VAR char 3\n", ""), raw_data=True)
+        self.assertLess(len(raw.bytecode), len(plain.bytecode))
+        self.assertEqual(assemble(PROGRAM, raw_data=False).config, raw.config)
+
+    def test_A1904_container(self):
+        container = read_image(assemble(PROGRAM, container=True, raw_data=True).bytecode)
+        plain = read_image(assemble(PROGRAM, raw_data=True).bytecode)
+        self.assertEqual(bytes(container.code), bytes(plain.code))
+        self.assertEqual(container.config, plain.config)
+        self.assertEqual(container.symbols["flag"], (len(plain.code) + 4, SYMBOL_VARIABLE))
+
+    def test_A1905_errors(self):
+        with self.assertRaises(AssemblyError):
+            assemble(PROGRAM.replace("VAR char 3", "VAR uchar 300"), raw_data=True)
+
+        # 300 more ints don't fit in 1KB, even though they take no space in the image
+        many = "".join("big{} VAR int 0\n".format(i) for i in range(300))
+        with self.assertRaises(AssemblyError):
+            assemble(PROGRAM.replace("section.text", many + "section.text"), raw_data=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
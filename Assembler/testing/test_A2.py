@@ -34,4 +34,19 @@ MOV out eax"""
         text = "section.meta\nsection.data"
 
         with self.assertRaises(AssemblyError):
-            split_into_sections(text)
\ No newline at end of file
+            split_into_sections(text)
+
+
+class Test_iter_section_lines(unittest.TestCase):
+    def test_A210(self):
+        lines = ["section.meta", "section.data", "section.text"]
+        self.assertEqual(list(iter_section_lines(lines)), [])
+
+    def test_A211(self):
+        lines = ["section.meta", "a=b", "section.data", "x VAR int 50", "section.text", "MOV eax x", "MOV out eax"]
+        out = [("meta", "a=b"), ("data", "x VAR int 50"), ("text", "MOV eax x"), ("text", "MOV out eax")]
+        self.assertEqual(list(iter_section_lines(lines)), out)
+
+    def test_A212(self):
+        with self.assertRaises(AssemblyError):
+            list(iter_section_lines(["section.meta", "section.data"]))
@@ -0,0 +1,96 @@
+import io
+import json
+import os
+import tempfile
+import tracemalloc
+import unittest
+from contextlib import redirect_stdout
+
+import assembler
+from assembler import *
+
+PROGRAM = """section.meta
+section.data
+x VAR int 5
+y VAR int 0
+section.text
+start MOV 4B eax x
+loop ADD int eax 1
+JMP loop"""
+
+
+class TestProfiling(unittest.TestCase):
+    def test_A2001_assemble(self):
+        profiler = PhaseProfiler(trace_memory=True)
+        assembled = assemble(PROGRAM, profiler=profiler)
+        report = profiler.report()
+
+        self.assertEqual([phase["name"] for phase in report["phases"]],
+                         ["normalise_split_contextualise", "layout", "place_memory_addresses", "encode"])
+        for phase in report["phases"]:
+            self.assertGreaterEqual(phase["wall_seconds"], 0)
+            self.assertGreaterEqual(phase["cpu_seconds"], 0)
+            self.assertGreaterEqual(phase["peak_bytes"], 0)
+        self.assertEqual(report["counts"], {"lines": 8, "instructions": 5, "labels": 2, "variables": 2,
+                                            "bytes": len(assembled.bytecode)})
+        self.assertEqual(json.loads(profiler.to_json()), report)
+
+        # Nothing is left tracing or reporting afterwards
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertIsNone(assembler.PROFILER)
+
+    def test_A2002_main(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "program.asm")
+            with open(path, "w") as file:
+                file.write(PROGRAM)
+
+            # The whole-text path has a phase for each stage
+            profiler = PhaseProfiler(trace_memory=False)
+            with redirect_stdout(io.StringIO()):
+                main(path, "hex", optimise=True, profiler=profiler)
+            report = profiler.report()
+            self.assertEqual([phase["name"] for phase in report["phases"]],
+                             ["normalise", "split", "divide_and_contextualise", "optimise", "layout",
+                              "place_memory_addresses", "encode"])
+            self.assertNotIn("peak_bytes", report["phases"][0])
+            self.assertEqual(report["counts"]["lines"], 8)
+
+            # "return" goes through assemble_buffer(), which is profiled as well
+            profiler = PhaseProfiler(trace_memory=False)
+            main(path, "return", profiler=profiler)
+            self.assertEqual(len(profiler.phases), 4)
+
+    def test_A2003_separate_memory_run(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "program.asm")
+            with open(path, "w") as file:
+                file.write(PROGRAM)
+
+            # Nothing is traced while timing, and the second run, which is traced, doesn't output anything
+            output, expected = io.StringIO(), io.StringIO()
+            with redirect_stdout(output):
+                profiler = profile_main(path, "hex")
+            with redirect_stdout(expected):
+                main(path, "hex")
+            self.assertEqual(output.getvalue(), expected.getvalue())
+            self.assertFalse(PhaseProfiler().trace_memory)
+            report = profiler.report()
+            self.assertEqual(len(report["phases"]), 6)
+            self.assertTrue(all(phase["peak_bytes"] >= 0 for phase in report["phases"]))
+            self.assertIn("peak_bytes", report["total"])
+            self.assertFalse(tracemalloc.is_tracing())
+
+        untraced = PhaseProfiler()
+        assemble(PROGRAM, profiler=untraced)
+        with self.assertRaisesRegex(ValueError, "different phases"):
+            profiler.add_peaks(untraced)
+
+    def test_A2004_not_profiling(self):
+        self.assertIs(profile_phase("layout"), NO_PHASE)
+        with profile_phase("layout"):
+            profile_count(lines=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import math
+import unittest
+
+from assembler import *
+from benchmarks.generators import GENERATORS
+from benchmarks.scaling import check_bounds, fitted_sizes, measure, phase_exponent, profile_text
+
+
+class TestScalingBenchmark(unittest.TestCase):
+    def test_A2101_generators(self):
+        for name, generator in GENERATORS.items():
+            with self.subTest(name=name):
+                text = generator(200)
+                self.assertAlmostEqual(len(text.split("\n")), 200, delta=5)
+                self.assertGreater(len(assemble(text).bytecode), 200)
+                self.assertGreater(len(assemble(text, raw_data=True).bytecode), 0)
+
+    def test_A2102_every_arithmetic_form(self):
+        _, instruction_list = contextualise_lines(GENERATORS["arithmetic_forms"](20).split("\n"))
+        forms = {operand.get_bit_designation() for instruction in instruction_list
+                 for operand in (instruction.operand1, instruction.operand2) if isinstance(operand, ArithmeticOperand)}
+        self.assertEqual(forms, set(ARITHMETIC_FORMS.values()))
+
+    def test_A2103_phases(self):
+        self.assertEqual(list(profile_text(GENERATORS["jump_dense"](100))),
+                         ["normalise", "split", "divide_and_contextualise", "layout", "place_memory_addresses",
+                          "encode"])
+        times = measure(GENERATORS["straight_line"], (100, 200))
+        self.assertTrue(all(len(phase_times) == 2 for phase_times in times.values()))
+
+    def test_A2104_bounds(self):
+        results = {"program": {"layout": {"exponent": 1.3}, "encode": {"exponent": 1.0}}}
+        self.assertEqual(check_bounds(results, 1.2, {}), [("program", "layout", 1.3, 1.2)])
+        self.assertEqual(check_bounds(results, 1.2, {"layout": 1.5}), [])
+        self.assertEqual(check_bounds(results, 0.9, {"layout": 1.5}), [("program", "encode", 1.0, 0.9)])
+        self.assertEqual(check_bounds({"program": {"split": {"exponent": None}}}, 0.9, {}), [])
+
+    def test_A2105_fitted_sizes(self):
+        # The smallest sizes are left out of the fit, unless that would leave fewer than two
+        self.assertEqual(fitted_sizes((1000, 10000, 100000, 1000000)), [1, 2, 3])
+        self.assertEqual(fitted_sizes((1000, 10000)), [0, 1])
+        self.assertEqual(fitted_sizes((100, 200, 400)), [0, 1, 2])
+
+    def test_A2106_phase_exponent(self):
+        sizes = (1000, 10000, 100000, 1000000)
+        self.assertAlmostEqual(phase_exponent(sizes, (0.001, 0.01, 0.1, 1.0), [1, 2, 3]), 1.0)
+        # Times under 10ms are left out, here leaving a fit through the last two
+        self.assertAlmostEqual(phase_exponent(sizes, (0.0001, 0.0001, 0.02, 0.4), [1, 2, 3]), math.log10(20))
+        # ...or nothing at all to fit
+        self.assertIsNone(phase_exponent(sizes, (0.0, 0.0, 0.0, 0.0), [1, 2, 3]))
+        self.assertIsNone(phase_exponent(sizes, (0.0001, 0.001, 0.005, 0.05), [1, 2, 3]))
+        # Times for sizes less than ten times apart aren't fitted either
+        self.assertIsNone(phase_exponent((10000, 30000, 100000), (0.005, 0.03, 0.1), [0, 1, 2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
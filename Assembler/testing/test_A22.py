@@ -0,0 +1,68 @@
+import unittest
+
+from assembler import *
+from disassemble import OPCODE_TABLE, decode_instructions
+
+PROGRAM = """section.meta
+section.data
+x VAR int 5
+section.text
+MOV 4B eax x
+ADD char al 100
+SUB short bx 300
+MUL int ecx 70000
+ADD float eax 2.5
+MOV 4B [eax] ebx
+MOV 4B [eax*4] ebx
+MOV 4B edx [ecx+eax]
+MOV 4B edx [ecx*2+eax]
+MOV 4B edx [ecx+eax*8]
+HLT"""
+
+
+class TestDisassemblerCore(unittest.TestCase):
+    def test_A2201_decode(self):
+        code = read_image(assemble(PROGRAM).bytecode).code
+        decoded = decode_instructions(code)
+        self.assertEqual([(instruction.opcode, instruction.dtype, instruction.op1, instruction.op2)
+                          for instruction in decoded],
+                         [("MOV", "4B", "M65", 5),
+                          ("MOV", "4B", "eax", "M65"),
+                          ("ADD", "char", "al", 100),
+                          ("SUB", "short", "bx", 300),
+                          ("MUL", "int", "ecx", 70000),
+                          ("ADD", "float", "eax", 2.5),
+                          ("MOV", "4B", "[eax]", "ebx"),
+                          ("MOV", "4B", "[eax*4]", "ebx"),
+                          ("MOV", "4B", "edx", "[ecx+eax]"),
+                          ("MOV", "4B", "edx", "[ecx*2+eax]"),
+                          ("MOV", "4B", "edx", "[ecx+eax*8]"),
+                          ("HLT", "", "", "")])
+        self.assertEqual([instruction.start_byte for instruction in decoded[:4]], [0, 7, 14, 18])
+
+        # Any buffer can be decoded, including a slice of one, with offsets from the start of the slice
+        self.assertEqual(decode_instructions(bytearray(code)), decoded)
+        self.assertEqual(decode_instructions(code[14:]),
+                         [instruction._replace(start_byte=instruction.start_byte - 14) for instruction in decoded[2:]])
+
+    def test_A2202_tables(self):
+        # The assembler's tables are left as they are
+        self.assertTrue(all(isinstance(key, str) for key in OPCODES))
+        self.assertTrue(all(isinstance(key, str) for key in REGISTERS))
+
+        self.assertEqual(len(OPCODE_TABLE), 256)
+        self.assertEqual(OPCODE_TABLE[OPCODES["ADD_short"]], ("ADD", "short", 2))
+        self.assertEqual(OPCODE_TABLE[OPCODES["HLT"]], ("HLT", "", 0))
+        self.assertIsNone(OPCODE_TABLE[0xFF])
+
+    def test_A2203_errors(self):
+        with self.assertRaisesRegex(ValueError, "Unknown opcode 0xff at byte 2"):
+            decode_instructions(b"\x00\x00\xff\x00")
+        with self.assertRaisesRegex(ValueError, "Unknown operand kind"):
+            decode_instructions(b"\x00\xb0")
+        with self.assertRaisesRegex(ValueError, "runs past the end"):
+            decode_instructions(b"\x00\x00\x12\x15\xa0")
+
+
+if __name__ == '__main__':
+    unittest.main()
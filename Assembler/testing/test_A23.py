@@ -0,0 +1,57 @@
+import unittest
+from collections import Counter
+from itertools import islice
+
+from assembler import *
+from disassemble import RawInstruction, decode_instructions, format_instruction, iter_code, iter_instructions
+
+PROGRAM = """section.meta
+mem_amt=1
+section.data
+x VAR int 5
+y VAR short 7
+section.text
+loop ADD int eax 1
+MOV 4B [eax+ebx] x
+CMP int eax 10
+JLT loop
+HLT"""
+
+
+class TestInstructionIterator(unittest.TestCase):
+    def test_A2301_records(self):
+        bytecode = assemble(PROGRAM).bytecode
+        records = list(iter_instructions(bytecode))
+        self.assertTrue(all(isinstance(record, RawInstruction) for record in records))
+
+        # Nothing is turned into text until format_instruction()
+        add = records[2]
+        self.assertEqual((add.opcode, add.operands, add.field1, add.field2),
+                         (OPCODES["ADD_int"], 0x12, REGISTERS["eax"], 1))
+        self.assertEqual((add.mnemonic, add.dtype, add.kinds, add.size), ("ADD", "int", (1, 2), 4))
+        self.assertEqual(records[3].field1, bytes([REGISTERS["eax"], REGISTERS["ebx"]]))
+
+        code = read_image(bytecode).code
+        self.assertEqual([format_instruction(record) for record in records], decode_instructions(code))
+        self.assertEqual(Counter(record.mnemonic for record in records),
+                         {"MOV": 3, "ADD": 1, "CMP": 1, "JLT": 1, "HLT": 1})
+
+    def test_A2302_start_and_stop(self):
+        bytecode = assemble(PROGRAM).bytecode
+        records = list(iter_instructions(bytecode))
+        self.assertEqual(list(iter_instructions(bytecode, records[3].start_byte)), records[3:])
+
+        # Only what is asked for is decoded, so an invalid byte further on doesn't matter
+        code = bytes(read_image(bytecode).code) + b"\xff\xff"
+        self.assertEqual(list(islice(iter_code(code), 2)), records[:2])
+        with self.assertRaisesRegex(ValueError, "Unknown opcode 0xff at byte {}".format(len(code) - 2)):
+            list(iter_code(code))
+
+    def test_A2303_raw_data(self):
+        # The raw data after the code isn't decoded as instructions
+        records = list(iter_instructions(assemble(PROGRAM, raw_data=True).bytecode))
+        self.assertEqual([record.mnemonic for record in records], ["ADD", "MOV", "CMP", "JLT", "HLT"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import io
+import mmap
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+import disassemble
+from assembler import *
+from disassemble import dis, iter_code, iter_instructions, parse_range
+
+PROGRAM = """section.meta
+mem_amt=1
+section.data
+x VAR int 5
+section.text
+start MOV 4B eax x
+loop ADD int eax 1
+SUB int ebx 2
+CMP int eax 10
+JLT loop
+end HLT"""
+
+
+def dis_output(bytecode, byte_range=None) -> str:
+    output = io.StringIO()
+    with redirect_stdout(output):
+        dis(bytecode, byte_range=byte_range)
+    return output.getvalue()
+
+
+def instruction_lines(output: str) -> list:
+    return output.split("Instructions")[1].split("\n")[1:-1]
+
+
+class TestLargeImages(unittest.TestCase):
+    def test_A2401_range(self):
+        bytecode = assemble(PROGRAM).bytecode
+        starts = [record.start_byte for record in iter_instructions(bytecode)]
+        self.assertEqual(starts, [0, 7, 14, 18, 22, 26, 32])
+
+        # Only the instructions starting in the range are decoded, including one running past its end
+        records = list(iter_instructions(bytecode, 14, 23))
+        self.assertEqual([record.start_byte for record in records], [14, 18, 22])
+        self.assertEqual(list(iter_code(read_image(bytecode).code, 32, 1000))[-1].mnemonic, "HLT")
+
+        whole = instruction_lines(dis_output(bytecode))
+        self.assertEqual(instruction_lines(dis_output(bytecode, (14, 23))), whole[2:5])
+        self.assertEqual(instruction_lines(dis_output(bytecode, (22, None))), whole[4:])
+        code_length = len(read_image(bytecode).code)
+        self.assertIn("showing bytes 22 to {})".format(code_length), dis_output(bytecode, (22, None)))
+
+        # Only the symbols in the range are printed
+        container = assemble(PROGRAM, container=True).bytecode
+        output = dis_output(container, (14, 20))
+        self.assertIn("label\tloop", output)
+        self.assertNotIn("label\tstart", output)
+        self.assertNotIn("label\tend", output)
+
+    def test_A2402_chunks(self):
+        bytecode = assemble(PROGRAM).bytecode
+        whole = dis_output(bytecode)
+        chunk_lines = disassemble.CHUNK_LINES
+        try:
+            disassemble.CHUNK_LINES = 2
+            self.assertEqual(dis_output(bytecode), whole)
+        finally:
+            disassemble.CHUNK_LINES = chunk_lines
+
+    def test_A2403_mmap(self):
+        for container in (False, True):
+            with self.subTest(container=container), tempfile.TemporaryDirectory() as directory:
+                bytecode = assemble(PROGRAM, container=container).bytecode
+                path = os.path.join(directory, "out.bin")
+                with open(path, "wb") as file:
+                    file.write(bytecode)
+                with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    self.assertEqual(dis_output(mapped), dis_output(bytecode))
+                    self.assertEqual(dis_output(mapped, (7, 18)), dis_output(bytecode, (7, 18)))
+
+    def test_A2404_parse_range(self):
+        self.assertEqual(parse_range("10:20"), (10, 20))
+        self.assertEqual(parse_range(":20"), (0, 20))
+        self.assertEqual(parse_range("10:"), (10, None))
+        self.assertRaises(ValueError, parse_range, "10")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+from assembler import *
+from recover import AddressIndex, recover_source
+
+PROGRAM = """section.meta
+mem_amt=2
+section.data
+a VAR uchar 200
+b VAR short 300
+c VAR int 70000
+d VAR float 2.5
+e VAR uint 4294967295
+f VAR char 0
+g VAR float 0.1
+h VAR int 5
+section.text
+start ADD char al 200
+ADD int eax -1
+ADD int eax -70000
+ADD int eax 2.5
+ADD float eax 1e-45
+SUB short bx -300
+MOV 4B [eax*4] ebx
+MOV 4B edx [ecx*2+eax]
+MOV 4B edx [ecx+eax*8]
+loop MOV 4B eax h
+CMP int eax b
+JLT loop
+JMP end
+end HLT"""
+
+MODES = ({}, {"container": True}, {"raw_data": True}, {"container": True, "raw_data": True})
+
+
+class TestRecoverSource(unittest.TestCase):
+    def test_A2501_round_trip(self):
+        for mode in MODES:
+            with self.subTest(**mode):
+                bytecode = assemble(PROGRAM, **mode).bytecode
+                recovered = recover_source(bytecode)
+                self.assertEqual((recovered.container, recovered.raw_data),
+                                 (mode.get("container", False), mode.get("raw_data", False)))
+                self.assertEqual(assemble(recovered.text, container=recovered.container,
+                                          raw_data=recovered.raw_data).bytecode, bytecode)
+
+    def test_A2502_names(self):
+        # A container keeps the real names, and puts each line back where it was
+        text = recover_source(assemble(PROGRAM, container=True).bytecode).text
+        lines = text.split("\n")
+        self.assertEqual(lines[3], "a VAR uchar 200")
+        self.assertEqual(lines[12], "start ADD char al -56")
+        self.assertEqual(lines[21], "loop MOV 4B eax h")
+        self.assertEqual(lines[23], "JLT loop")
+        self.assertIn("g VAR float 0.1", lines)
+
+        # Otherwise names are made from the addresses
+        text = recover_source(assemble(PROGRAM).bytecode).text
+        self.assertRegex(text, r"\nL(\d+) MOV 4B eax V\d+\n.*\nJLT L\1\n")
+        self.assertNotIn("start", text)
+
+    def test_A2503_address_index(self):
+        index = AddressIndex({30: "b", 10: "a", 2000: "c"})
+        self.assertEqual(list(index.addresses), [10, 30, 2000])
+        self.assertEqual(index.name_of(30), "b")
+        self.assertIsNone(index.name_of(20))
+        self.assertIsNone(index.name_of(3000))
+        self.assertIn(2000, index)
+        self.assertNotIn(0, index)
+        self.assertEqual(len(index), 3)
+
+    def test_A2504_errors(self):
+        bytecode = bytearray(assemble("section.meta\nsection.data\nsection.text\nJMP end\nend HLT").bytecode)
+        # Point the jump into the middle of itself, which the assembler could never have written
+        address = bytecode.index(b"\x00\x00\x00\x00") + 4 + 2
+        bytecode[address:address + 4] = (1).to_bytes(4, "big")
+        with self.assertRaisesRegex(ValueError, "Address 1 is neither the start of an instruction nor of a variable"):
+            recover_source(bytes(bytecode))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import csv
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from assembler import *
+import bytecode_stats
+from bytecode_stats import collect, count_image, main, report, summarise
+
+HERE = os.path.dirname(__file__)
+
+PROGRAM = """section.meta
+section.data
+x VAR int 5
+section.text
+start ADD char al 100
+SUB short bx 300
+MUL int ecx 70000
+MOV 4B [eax*4] ebx
+CMP int eax x
+JLT start
+JMP end
+end HLT"""
+
+
+class TestBytecodeStats(unittest.TestCase):
+    def test_A2601_summary(self):
+        for mode in ({}, {"container": True, "raw_data": True}):
+            with self.subTest(**mode):
+                summary = summarise(count_image(assemble(PROGRAM, **mode).bytecode))
+                # The MOV setting x is only there without raw data
+                data_movs = 0 if mode else 1
+                self.assertEqual(summary["instructions"], 8 + data_movs)
+                self.assertEqual(summary["opcodes"]["JLT"], 1)
+                self.assertEqual(summary["opcodes"].get("MOV_4B"), 1 + data_movs)
+                self.assertEqual(summary["operand_kinds"]["imm8"], 1 + data_movs)
+                self.assertEqual(summary["operand_kinds"]["[a*b]"], 1)
+                self.assertEqual(summary["immediate_sizes"], {"1": 1 + data_movs, "2": 1, "4": 1})
+                self.assertEqual(summary["lengths"]["2"], 1)
+                self.assertAlmostEqual(summary["jump_density"], 2 / summary["instructions"])
+                self.assertAlmostEqual(summary["average_length"], summary["code_bytes"] / summary["instructions"])
+
+    def test_A2602_without_numpy(self):
+        bytecode = assemble_file(os.path.join(HERE, "fibonacci.asm")).bytecode
+        counts = count_image(bytecode)
+        with mock.patch.object(bytecode_stats, "numpy", None):
+            self.assertEqual(count_image(bytecode), counts)
+            self.assertEqual(bytecode_stats.add_counts([counts, counts]),
+                             counts._replace(code_bytes=2 * counts.code_bytes,
+                                             **{field: [2 * n for n in getattr(counts, field)]
+                                                for field in ("opcodes", "kinds", "lengths")}))
+        self.assertEqual(bytecode_stats.add_counts([counts]), counts)
+
+    def test_A2603_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.mkdir(os.path.join(directory, "sub"))
+            for i in range(4):
+                with open(os.path.join(directory, "sub" if i % 2 else "", "{}.bin".format(i)), "wb") as file:
+                    file.write(assemble(PROGRAM, container=bool(i % 2)).bytecode)
+            with open(os.path.join(directory, "bad.bin"), "wb") as file:
+                file.write(b"junk")
+            with open(os.path.join(directory, "notes.txt"), "wt") as file:
+                file.write("not bytecode")
+
+            serial = collect([directory], workers=1)
+            self.assertEqual([os.path.relpath(result.path, directory) for result in serial],
+                             ["0.bin", "2.bin", "bad.bin", os.path.join("sub", "1.bin"), os.path.join("sub", "3.bin")])
+            self.assertEqual(collect([directory], workers=2), serial)
+            self.assertIsNotNone(serial[2].error)
+
+            stats = report(serial)
+            self.assertEqual(stats["total"]["files"], 4)
+            self.assertEqual(stats["total"]["instructions"], 4 * 9)
+            self.assertEqual(list(stats["errors"]), [serial[2].path])
+
+            json_path, csv_path = os.path.join(directory, "stats.json"), os.path.join(directory, "stats.csv")
+            self.assertEqual(main([directory], 1, json_path, csv_path), 1)
+            with open(json_path) as file:
+                self.assertEqual(json.load(file), stats)
+            with open(csv_path, newline="") as file:
+                rows = list(csv.reader(file))
+            self.assertEqual(rows[0], ["path", "table", "key", "value"])
+            self.assertIn(["TOTAL", "opcodes", "JLT", "4"], rows)
+            self.assertIn([serial[0].path, "summary", "instructions", "9"], rows)
+
+    @unittest.skipUnless(bytecode_stats.numpy, "NumPy isn't installed")
+    def test_A2604_numpy_matches(self):
+        images = [assemble(PROGRAM, container=True, raw_data=True).bytecode,
+                  assemble_file(os.path.join(HERE, "fibonacci.asm")).bytecode]
+        counts = [count_image(bytecode) for bytecode in images]
+        with mock.patch.object(bytecode_stats, "numpy", None):
+            self.assertEqual([count_image(bytecode) for bytecode in images], counts)
+            total = bytecode_stats.add_counts(counts)
+        self.assertEqual(bytecode_stats.add_counts(counts), total)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -100,4 +100,65 @@ class Test_interpret_operand(unittest.TestCase):
 
     def test_A323(self):
         self.assertEqual(interpret_operand("[eax*4]"),
-                         ArithmeticOperand("eax*4"))
\ No newline at end of file
+                         ArithmeticOperand("eax*4"))
+
+    def test_A324(self):
+        self.assertEqual(interpret_operand("1e3"), ImmediateOperand(1000.0))
+        self.assertIsInstance(interpret_operand("7.5").value, float)
+
+    def test_A325(self):
+        for x in ("[eax-ebx]", "[a+b+c]", "[eax*ebx*ecx]"):
+            with self.subTest(x=x):
+                with self.assertRaises(AssemblyError):
+                    interpret_operand(x)
+
+
+class Test_classify_operand(unittest.TestCase):
+    def test_A340(self):
+        outputs = {
+            "EAX": OperandToken("register", 1, "eax", None, None),
+            "-100": OperandToken("immediate", None, -100, None, None),
+            "2.5": OperandToken("immediate", None, 2.5, None, None),
+            "loop_1": OperandToken("address", 5, "loop_1", None, None),
+            "[eax]": OperandToken("arithmetic", 6, "eax", None, None),
+            "[eax*4]": OperandToken("arithmetic", 7, "eax", "4", None),
+            "[eax+ebx]": OperandToken("arithmetic", 8, "eax", "ebx", None),
+            "[eax*ebx+4]": OperandToken("arithmetic", 9, "eax", "ebx", "4"),
+            "[eax+ebx*4]": OperandToken("arithmetic", 10, "eax", "ebx", "4")
+        }
+        for inp, out in outputs.items():
+            with self.subTest(inp=inp):
+                self.assertEqual(classify_operand(inp), out)
+
+    def test_A341(self):
+        for x in ("[]", "5e", "--5", "[a+b+c]", "a.b", "[eax"):
+            with self.subTest(x=x):
+                self.assertIsNone(classify_operand(x))
+
+
+class Test_contextualise_lines(unittest.TestCase):
+    def test_A330(self):
+        lines = ["section.meta", "section.data", "section.text"]
+        self.assertEqual(contextualise_lines(lines), (META_CONFIG_DEFAULT, []))
+
+    def test_A331(self):
+        text = """section.meta
+a=b
+section.data
+a VAR int 5
+section.text
+MOV eax ebx"""
+        self.assertEqual(contextualise_lines(text.split("\n")),
+                         divide_and_contextualise(split_into_sections(normalise_text(text))))
+
+    def test_A332(self):
+        text = """section.text
+loop MOV eax a
+section.data
+a VAR int 5
+section.meta"""
+        out = (META_CONFIG_DEFAULT, [
+            DataInstruction(0, "a", "5", "int"),
+            TextInstruction(1, "MOV", "char", RegisterOperand("eax"), AddressOperand("a"), "loop")
+        ])
+        self.assertEqual(contextualise_lines(text.split("\n")), out)
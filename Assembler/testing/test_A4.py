@@ -15,6 +15,34 @@ class Test_record_labels_and_variables(unittest.TestCase):
         self.assertEqual(record_labels_and_variables(inp), {"start": 0})
 
 
+    def test_A404(self):
+        inp = [DataInstruction(0, "i", "5", "int"),
+               TextInstruction(1, "MOV", "4B", RegisterOperand("eax"), RegisterOperand("ebx"), "start"),
+               TextInstruction(2, "JMP", "", AddressOperand("start"), None, "end")]
+        self.assertEqual(record_labels_and_variables(inp), {"i": 17, "start": 7, "end": 11})
+
+
+class Test_compute_layout(unittest.TestCase):
+    def test_A420(self):
+        self.assertEqual(compute_layout([]), Layout([0], 0, {}, 0, {}))
+
+    def test_A421(self):
+        inp = [DataInstruction(0, "i", "5", "int"),
+               DataInstruction(1, "c", "5", "char"),
+               TextInstruction(2, "MOV", "4B", RegisterOperand("eax"), RegisterOperand("ebx"), "start"),
+               TextInstruction(3, "HLT", "", None, None, "end")]
+        layout = compute_layout(inp)
+        self.assertEqual(layout.instr_offsets, [0, 7, 14, 18, 20])
+        self.assertEqual(layout.text_size, 20)
+        self.assertEqual(layout.var_offsets, {"i": (0, "int"), "c": (4, "char")})
+        self.assertEqual(layout.var_table_size, 5)
+        self.assertEqual(layout.label_offsets, {"start": 14, "end": 18})
+
+    def test_A422(self):
+        with self.assertRaises(ValueError):
+            compute_layout(["MOV eax ebx"])
+
+
 class Test_calculate_var_table_size(unittest.TestCase):
     def test_A410(self):
         self.assertEqual(calculate_var_table_size({}), 0)
@@ -60,4 +60,21 @@ class Test_encode_instruction_list(unittest.TestCase):
             RegisterOperand("eax"),
             ImmediateOperand("5")
         )]
-        self.assertEqual(encode_instruction_list(inp, {}), b"\x10\x12\xA0\x05")
\ No newline at end of file
+        self.assertEqual(encode_instruction_list(inp, {}), b"\x10\x12\xA0\x05")
+
+class Test_encode_program(unittest.TestCase):
+    def test_A530(self):
+        self.assertEqual(encode_program({}, [], {}), b"\x00" * 4)
+
+    def test_A531(self):
+        inp = [DataInstruction(0, "i", "5", "int"),
+               TextInstruction(1, "MOV", "1B", RegisterOperand("eax"), ImmediateOperand("5")),
+               TextInstruction(2, "JMP", "", AddressOperand(7), None)]
+        out = b"a=b&" + b"\x00" * 4 + b"\x12\x52\x00\x00\x00\x11\x05" + b"\x10\x12\xA0\x05" + b"\x08\x50\x00\x00\x00\x07"
+        self.assertEqual(encode_program({"a": "b"}, inp, {"i": 17}), out)
+
+    def test_A532(self):
+        inp = [TextInstruction(0, "MOV", "1B", RegisterOperand("eax"), ImmediateOperand("5")),
+               TextInstruction(1, "ADD", "int", RegisterOperand("eax"), ArithmeticOperand("ebx+esi*4"))]
+        self.assertEqual(encode_program({}, inp, {})[4:],
+                         b"".join(instr.get_bytes({}) for instr in inp))
@@ -71,4 +71,26 @@ class Test_Instruction(unittest.TestCase):
         place_memory_addresses({"i": 40, "a": 44}, [pair[0] for pair in instructions])
         for instr, operand_byte in instructions:
             with self.subTest(args=repr(instr)):
-                self.assertEqual(instr.get_bytes({"i": 40, "a": 44})[1], operand_byte)
\ No newline at end of file
+                self.assertEqual(instr.get_bytes({"i": 40, "a": 44})[1], operand_byte)
+
+    def test_A624(self):
+        pairs = {
+            ("HLT", 0): 0x00,
+            ("JMP", "char"): 0x08,
+            ("CMP", "ushort"): 0x04,
+            ("MOV", "2B"): 0x11,
+            ("MOV", "float"): 0x12,
+            ("AND", "uchar"): 0x50
+        }
+        for pair, opcode in pairs.items():
+            with self.subTest(pair=pair):
+                self.assertEqual(OPCODE_TABLE[pair], opcode)
+
+    def test_A625(self):
+        with self.subTest(case="mismatch"):
+            with self.assertRaisesRegex(ValueError, "CMP.*2B"):
+                TextInstruction(0, "CMP", "2B", RegisterOperand("eax"), RegisterOperand("ebx")).get_opcode_num()
+
+        with self.subTest(case="parsing"):
+            with self.assertRaisesRegex(AssemblyError, "mov"):
+                parse_text_line("mov eax ebx", 0)
@@ -159,4 +159,32 @@ class Test_ArithmeticOperand(unittest.TestCase):
         for inp, out in outputs.items():
             with self.subTest(inp=inp):
                 op = ArithmeticOperand(inp)
-                self.assertEqual(op.get_bytes(), out)
\ No newline at end of file
+                self.assertEqual(op.get_bytes(), out)
+
+class Test_intern_operand(unittest.TestCase):
+    def test_A740(self):
+        for x in ("esp", "[esp]", "4", "loop"):
+            with self.subTest(x=x):
+                self.assertIs(intern_operand(x), intern_operand(x))
+                self.assertEqual(intern_operand(x), interpret_operand(x))
+
+    def test_A741(self):
+        op = intern_operand("ecx")
+        with self.assertRaises(AttributeError):
+            op.name = "edx"
+        self.assertEqual(op.name, "ecx")
+
+        # One which isn't shared can still be changed
+        op = interpret_operand("ecx")
+        op.name = "edx"
+        self.assertEqual(op.name, "edx")
+
+    def test_A742(self):
+        for x in ("esi", "[esi+4]", "-70000", "2.5"):
+            with self.subTest(x=x):
+                self.assertEqual(intern_operand(x).get_bytes(), interpret_operand(x).get_bytes())
+
+    def test_A743(self):
+        buffer = bytearray(4)
+        intern_operand("[eax*4+dl]").write_bytes(buffer, 1)
+        self.assertEqual(buffer, b"\x00\xa0\x04\xd3")
@@ -0,0 +1,65 @@
+import unittest
+
+from assembler import *
+
+
+class Test_InstructionTable(unittest.TestCase):
+    def setUp(self):
+        self.instructions = [
+            DataInstruction(0, "i", "5", "int"),
+            DataInstruction(1, "j", "300", "short"),
+            TextInstruction(2, "MOV", "int", RegisterOperand("eax"), AddressOperand("i"), "start"),
+            TextInstruction(3, "ADD", "int", RegisterOperand("eax"), ArithmeticOperand("ebx+esi*4")),
+            TextInstruction(4, "JMP", "char", AddressOperand("start"), None),
+            TextInstruction(5, "HLT", 0, None, None, "end")
+        ]
+
+    def test_A801(self):
+        self.assertEqual(len(InstructionTable()), 0)
+        self.assertEqual(list(InstructionTable()), [])
+
+    def test_A802(self):
+        table = InstructionTable.from_instructions(self.instructions)
+        self.assertEqual(len(table), len(self.instructions))
+        self.assertEqual(list(table), self.instructions)
+        self.assertEqual(table[-1], self.instructions[-1])
+
+    def test_A803(self):
+        table = InstructionTable.from_instructions(self.instructions)
+        self.assertEqual(compute_layout(table), compute_layout(self.instructions))
+
+    def test_A804(self):
+        table = InstructionTable.from_instructions(self.instructions)
+        mem_table = record_labels_and_variables(self.instructions)
+        self.assertEqual(record_labels_and_variables(table), mem_table)
+
+        place_memory_addresses(mem_table, table)
+        place_memory_addresses(mem_table, self.instructions)
+        self.assertEqual(encode_program({}, table, mem_table), encode_program({}, self.instructions, mem_table))
+
+    def test_A805(self):
+        first = InstructionTable.from_instructions(self.instructions[:3])
+        second = InstructionTable.from_instructions(self.instructions[3:])
+        first.extend(second)
+        self.assertEqual(list(first), self.instructions)
+        self.assertEqual(first.payload, InstructionTable.from_instructions(self.instructions).payload)
+
+    def test_A806(self):
+        with self.assertRaises(ValueError):
+            InstructionTable().append(TextInstruction(0, "FOO", "int", None, None))
+
+
+class Test_contextualise_lines_as_table(unittest.TestCase):
+    def test_A810(self):
+        text = """section.text
+loop MOV eax a ; Comment
+
+JMP loop
+section.data
+a VAR int 5
+section.meta
+mem_amt=2"""
+        config_dict, table = contextualise_lines(text.split("\n"), as_table=True)
+        self.assertEqual(config_dict, {"mem_amt": "2"})
+        self.assertEqual(list(table), contextualise_lines(text.split("\n"))[1])
+        self.assertEqual(list(table.source_lines), [6, 2, 4])
@@ -0,0 +1,109 @@
+import unittest
+
+from assembler import *
+from incremental import IncrementalAssembler
+
+
+def full_assemble(text):
+    """Assemble text with the normal (non-incremental) pipeline."""
+    config_dict, instruction_list = contextualise_lines(text.split("\n"), as_table=True)
+    mem_table = record_labels_and_variables(instruction_list)
+    place_memory_addresses(mem_table, instruction_list)
+    return bytes(encode_program(config_dict, instruction_list, mem_table))
+
+
+PROGRAM = """section.meta
+mem_amt=2
+section.data
+i VAR int 5
+j VAR short 300
+section.text
+start MOV 4B eax i
+ADD int eax [ebx+esi*4]
+JMP char end
+JMP char start
+end HLT
+"""
+
+
+class Test_IncrementalAssembler(unittest.TestCase):
+    def setUp(self):
+        self.assembler = IncrementalAssembler()
+        self.assembler.assemble(PROGRAM)
+
+    def test_A901(self):
+        self.assertEqual(IncrementalAssembler().assemble(PROGRAM), full_assemble(PROGRAM))
+        self.assertTrue(self.assembler.last_full_rebuild)
+
+    def test_A902(self):
+        # Changing an immediate keeps every address where it was
+        text = PROGRAM.replace("[ebx+esi*4]", "[ebx+esi*8]")
+        self.assertEqual(self.assembler.assemble(text), full_assemble(text))
+        self.assertFalse(self.assembler.last_full_rebuild)
+        self.assertEqual(self.assembler.last_lines_parsed, 1)
+
+    def test_A903(self):
+        # Inserting a line moves the labels and variables after it
+        text = PROGRAM.replace("JMP char end\n", "JMP char end\nMOV 4B ebx 70000\n")
+        self.assertEqual(self.assembler.assemble(text), full_assemble(text))
+        self.assertEqual(self.assembler.last_lines_parsed, 1)
+
+        # ...and removing it again moves them back
+        self.assertEqual(self.assembler.assemble(PROGRAM), full_assemble(PROGRAM))
+
+    def test_A904(self):
+        edits = [
+            PROGRAM.replace("j VAR short 300\n", "j VAR short 300\nk VAR char 1\n"),
+            PROGRAM.replace("end HLT", "finish HLT").replace("char end", "char finish"),
+            PROGRAM.replace("mem_amt=2", "mem_amt=4"),
+            PROGRAM.replace("section.data\n", "section.data\nu VAR uint 9\n"),
+        ]
+        for text in edits:
+            with self.subTest(text=text):
+                self.assertEqual(self.assembler.assemble(text), full_assemble(text))
+
+    def test_A905(self):
+        self.assembler.assemble(PROGRAM.replace("JMP char start\n", "JMP char start\n\n"))
+        self.assertEqual(self.assembler.last_lines_parsed, 1)
+        self.assertEqual(self.assembler.assemble(PROGRAM), full_assemble(PROGRAM))
+        self.assertEqual(self.assembler.last_lines_parsed, 0)
+
+    def test_A906(self):
+        # A failed update leaves the assembler ready for a full build next time
+        with self.assertRaises(Exception):
+            self.assembler.assemble(PROGRAM.replace("char start", "char nowhere"))
+        self.assertEqual(self.assembler.assemble(PROGRAM), full_assemble(PROGRAM))
+        self.assertTrue(self.assembler.last_full_rebuild)
+
+    def test_A907(self):
+        # A name defined twice resolves as in a full run, before and after either definition is removed
+        text = PROGRAM.replace("end HLT\n", "end HLT\nstart HLT\nend MOV 4B eax j\n")
+        self.assertEqual(self.assembler.assemble(text), full_assemble(text))
+        for edit in (text.replace("start HLT\n", ""), text.replace("end HLT\n", "HLT\n"), PROGRAM):
+            with self.subTest(text=edit):
+                self.assertEqual(self.assembler.assemble(edit), full_assemble(edit))
+                self.assertFalse(self.assembler.last_full_rebuild)
+
+    def test_A908(self):
+        # Only the lines the edit touches are parsed again, whether it is within a line or across several
+        text = PROGRAM.replace("mem_amt=2\nsection.data\ni VAR int 5", "mem_amt=2\nsection.data\ni VAR int 6")
+        self.assertEqual(self.assembler.assemble(text), full_assemble(text))
+        self.assertEqual(self.assembler.last_lines_parsed, 1)
+
+        self.assembler.assemble(PROGRAM)
+        text = PROGRAM.replace("ADD int eax [ebx+esi*4]\nJMP char end", "ADD int ebx 7\nSUB int ebx 1\nJMP short end")
+        self.assertEqual(self.assembler.assemble(text), full_assemble(text))
+        self.assertEqual(self.assembler.last_lines_parsed, 3)
+
+    def test_A909(self):
+        # Every edit of the benchmark, on programs big enough to be split into many blocks
+        from benchmarks.bench_incremental import time_edits
+        from benchmarks.generators import GENERATORS
+
+        for program, generator in GENERATORS.items():
+            with self.subTest(program=program):
+                time_edits(generator(2000), repeats=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
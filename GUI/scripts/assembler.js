@@ -3,39 +3,52 @@ let fs = require("fs");
 let $ = require("jquery");
 let prog_lines = [];
 let animation_queue = [];
+let code_lines = [];    // The assembly as it stands after the last text event
+
+// Apply a list of [start, number removed, lines inserted] edits to code_lines and show the result
+function applyLineEdits(edits) {
+    for (let i = 0; i < edits.length; i++) {
+        let edit = edits[i];
+        code_lines.splice.apply(code_lines, [edit[0], edit[1]].concat(edit[2]));
+    }
+    $("#code").html(code_lines.join("<br />"));
+}
 
 let animations;
 animations = {
     start_text: function (text) {
         return function () {
             $("#commentary").append("This is the initial assembly<br />");
-            $("#code").html(text[0].replace(/\n/g, "<br />"));
+            code_lines = text[0].split("\n");
+            $("#code").html(code_lines.join("<br />"));
         };
     },
 
-    remove_comments: function (text) {
+    // The normalisation steps only send the lines they changed
+    remove_comments: function (edits) {
         return function () {
             $("#commentary").append("Removing comments<br />");
-            $("#code").html(text[0].replace(/\n/g, "<br />"));
+            applyLineEdits(edits);
         };
     },
 
-    remove_empty_lines: function (text) {
+    remove_empty_lines: function (edits) {
         return function () {
             $("#commentary").append("Removing empty lines<br />");
-            $("#code").html(text[0].replace(/\n/g, "<br />"));
+            applyLineEdits(edits);
         };
     },
-    remove_dup_wspace: function (text) {
+    remove_dup_wspace: function (edits) {
         return function () {
             $("#commentary").append("Removing any duplicate whitespace<br />");
-            $("#code").html(text[0].replace(/\n/g, "<br />"))
+            applyLineEdits(edits);
         };
     },
 
-    split: function (json) {
+    split: function (ranges) {
         return function () {
-            // Given JSON is in the form of [meta, data, text]
+            // Given JSON is the [start, end] range of lines in each of meta, data and text
+            let json = ranges.map(range => code_lines.slice(range[0], range[1]).join("\n"));
             $("#commentary").append("Split into separate sections<br />");
             $("#code").html("<div id='section-meta' class='asm-section'></div>" +
                 "<div id='section-data' class='asm-section'></div>" +
@@ -194,6 +207,12 @@ animations = {
         };
     },
 
+    truncated: function (dropped) {
+        return function () {
+            $("#commentary").append(`${dropped[0]} further steps were left out<br />`);
+        };
+    },
+
     end: function (final) {
         return function () {
             $("#commentary").append("Commentary finished<br />");
@@ -303,6 +322,9 @@ function afterAssemblerFinish() {
                 parts = JSON.parse(line.splitWithTail(" ", 1)[1]);
                 animation_queue.push(animations.conv_instr(parts[0], parts[1], parts[2], parts[3]));
                 break;
+            case "truncated":
+                animation_queue.push(animations.truncated(JSON.parse(line.splitWithTail(" ", 1)[1])));
+                break;
             case "end":
                 animation_queue.push(animations.end(JSON.parse(line.splitWithTail(" ", 1)[1])));
                 break;